@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Usage: import_time.py [--budget <ms>] [--runs <n>]
+
+Check that starting dj_cfn_generator stays cheap: import the modules the CLI
+loads up front (plus the render cache, used on every default run) under
+`python -X importtime`, and fail when that takes longer than the budget or
+pulls in any of the heavy modules that should only load on demand.
+
+Options:
+  --budget <ms>     Maximum import time in milliseconds[default: 100]
+  --runs <n>        Take the fastest of this many runs[default: 5]
+  -h, --help        Show this help message
+"""
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+
+from docopt import docopt
+
+MODULES = ['dj_cfn_generator.cli', 'dj_cfn_generator.cache']
+
+# only imported on the code paths that need them
+LAZY_MODULES = ['troposphere', 'awacs', 'boto3', 'botocore', 'multiprocessing']
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(argv=None):
+    # Returns (microseconds spent importing MODULES, every module imported)
+    # while running argv(by default just importing MODULES) under python
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+    if argv is None:
+        argv = ['-c', '; '.join('import ' + m for m in MODULES)]
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime'] + list(argv),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, cwd=ROOT)
+    _, err = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(err.decode('utf-8', 'replace'))
+
+    total = 0
+    imported = set()
+    for line in err.decode('utf-8', 'replace').splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        if not fields[1].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        imported.add(name)
+        if name in MODULES:
+            total += int(fields[1])
+    return total, imported
+
+
+def lazy_imported(imported):
+    # the LAZY_MODULES found(with any of their submodules) in imported
+    return [m for m in LAZY_MODULES if any(name == m or name.startswith(m + '.') for name in imported)]
+
+
+def main(args):
+    budget = float(args['--budget'])
+    runs = [measure() for _ in range(int(args['--runs']))]
+    total = min(t for t, imported in runs)
+    imported = runs[0][1]
+
+    failed = False
+    print("Import time: {:.1f}ms (budget {:.0f}ms)".format(total / 1000.0, budget))
+    if total / 1000.0 > budget:
+        print("FAIL: import time is over budget")
+        failed = True
+    for m in lazy_imported(imported):
+        print("FAIL: {} is imported at startup".format(m))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main(docopt(__doc__))
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+Usage: run.py [--repeat <n>] [--threshold <fraction>] [--timing-threshold <fraction>] [--strict]
+              [--baseline <file>] [--save] [--only <names>]
+
+Time the template generation hot paths and record their peak memory use, and
+report them against the stored baseline. A peak memory more than the threshold
+over the baseline fails the run. Timings depend on the machine, so those over
+the threshold are only marked, and fail the run when they are over the
+(generous) timing threshold, or with --strict. A template, with every stack
+part, that CloudFormation would reject for its size or number of entries fails
+the run as well.
+
+The baseline is a reference point for the report. Refresh it(--save) in a
+commit of its own, not along with a feature change.
+
+Options:
+  --repeat <n>              Number of timed runs per benchmark[default: 30]
+  --threshold <fraction>    Fail on peak memory and mark timings this much over the baseline(0.5 = 50%
+                            more)[default: 0.5]
+  --timing-threshold <fraction>
+                            Fail on timings this much over the baseline[default: 2]
+  --strict                  Fail on timings over --threshold too
+  --baseline <file>         Baseline results[default: benchmarks/baseline.json]
+  --save                    Store these results as the new baseline
+  --only <names>            Only run these benchmarks(comma separated)
+  -h, --help                Show this help message
+"""
+from __future__ import print_function
+
+import gc
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+from docopt import docopt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import dj_cfn_generator  # noqa: E402
+from dj_cfn_generator import stack_parts  # noqa: E402
+from dj_cfn_generator.matrix import variants  # noqa: E402
+from dj_cfn_generator.size import encoded_size, limit_errors  # noqa: E402
+
+# Timer noise on sub-millisecond benchmarks easily exceeds any percentage, so a
+# benchmark must also be this much slower(in seconds) to be marked, and peak
+# this much more(in bytes) to fail
+MIN_SLOWDOWN = 0.001
+MIN_PEAK_GROWTH = 16 * 1024
+
+
+def built(parts=None):
+    t, r = dj_cfn_generator.new_template()
+    stack_parts.build(t, r, parts)
+    return t, r
+
+
+def part_benchmark(name):
+    # init() of one part, on a template that already holds the parts it needs
+    module = stack_parts.import_part(name)
+    deps = [p.name for p in stack_parts.resolve([name]) if p.name != name]
+
+    def setup():
+        return built(deps) if deps else dj_cfn_generator.new_template()
+
+    def run(state):
+        t, r = state
+        module.init(t, r)
+    return setup, run
+
+
+def benchmarks():
+    # name -> (setup, run): setup() prepares fresh state outside the timing,
+    # run(state) is what gets measured
+    full = built()
+    benches = [
+        ('generate_json', (lambda: None, lambda state: dj_cfn_generator.generate_json())),
+        ('generate_json[large-prod]', (lambda: None, lambda state: dj_cfn_generator.generate_json(
+            contestsize='large', envtype='prod'))),
+        ('Template.to_json', (lambda: full[0], lambda t: t.to_json())),
+        ('webserver.build_user_data', (lambda: full[1], stack_parts.import_part('webserver').build_user_data)),
+        ('judgehost.build_user_data', (lambda: full[1], stack_parts.import_part('judgehost').build_user_data)),
+    ]
+    for name in stack_parts.PART_NAMES:
+        benches.append(('{}.init'.format(name), part_benchmark(name)))
+    return benches
+
+
+def measure(setup, run, repeat):
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        gc.collect()
+        start = timeit.default_timer()
+        run(state)
+        times.append(timeit.default_timer() - start)
+    times.sort()
+
+    state = setup()
+    gc.collect()
+    tracemalloc.start()
+    run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'min': times[0],
+        'median': times[len(times) // 2],
+        'peak_bytes': peak,
+    }
+
+
+def regressions(name, result, base, threshold, timing_threshold, strict):
+    # (failures, marks): messages for the results of benchmark `name` that are
+    # over the thresholds on its baseline `base`
+    failures = []
+    marks = []
+    if result['peak_bytes'] > base['peak_bytes'] * (1 + threshold) and \
+            result['peak_bytes'] - base['peak_bytes'] > MIN_PEAK_GROWTH:
+        failures.append("{} peaked at {}KB, more than {:.0%} over the baseline {}KB".format(
+            name, result['peak_bytes'] // 1024, threshold, base['peak_bytes'] // 1024))
+
+    # the fastest run is the least noisy figure to compare
+    ratio = result['min'] / base['min']
+    if result['min'] - base['min'] > MIN_SLOWDOWN:
+        fail_threshold = threshold if strict else timing_threshold
+        for over, messages in ((fail_threshold, failures), (threshold, marks)):
+            if ratio > 1 + over:
+                messages.append("{} took {:.2f}ms, more than {:.0%} over the baseline {:.2f}ms".format(
+                    name, result['min'] * 1000, over, base['min'] * 1000))
+                break
+    return failures, marks
+
+
+def check_limits():
+    # The template with every stack part(and the options that add the most to
+    # it), unspecialized and for every variant of the matrix. Returns a line
+    # per template and the limit errors of all of them.
+    lines = []
+    errors = []
+    for contestsize, envtype in [(None, None)] + variants():
+        template, owners = dj_cfn_generator.build_template(
+            parts=stack_parts.PART_NAMES, contestsize=contestsize, envtype=envtype, load_balancer='alb',
+            warm_pools=dj_cfn_generator.WARM_POOL_TIERS)
+        name = '{}-{}'.format(contestsize or 'any', envtype or 'any')
+        total = encoded_size(template, compact=False)
+        lines.append("{:<32} {:>10} {:>10}".format(name, total, len(template.get('Resources', {}))))
+        errors += ["{}: {}".format(name, e) for e in limit_errors(template, total)]
+    return lines, errors
+
+
+def main(args):
+    only = None
+    if args['--only']:
+        only = [n.strip() for n in args['--only'].split(',')]
+    repeat = int(args['--repeat'])
+    threshold = float(args['--threshold'])
+    timing_threshold = float(args['--timing-threshold'])
+    baseline_file = os.path.join(ROOT, args['--baseline'])
+
+    baseline = {}
+    if not args['--save'] and os.path.exists(baseline_file):
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failures = []
+    marked = []
+    print("{:<32} {:>10} {:>10} {:>10} {:>10}".format("Benchmark", "min ms", "median ms", "peak KB", "vs base"))
+    for name, (setup, run) in benchmarks():
+        if only and name not in only:
+            continue
+        result = measure(setup, run, repeat)
+        results[name] = result
+
+        change = ''
+        base = baseline.get(name)
+        if base:
+            change = '{:+.0%}'.format(result['min'] / base['min'] - 1)
+            failed, marks = regressions(name, result, base, threshold, timing_threshold, args['--strict'])
+            failures += failed
+            marked += marks
+        print("{:<32} {:>10.2f} {:>10.2f} {:>10} {:>10}".format(
+            name, result['min'] * 1000, result['median'] * 1000, result['peak_bytes'] // 1024, change))
+
+    if args['--save']:
+        with open(baseline_file, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True, separators=(',', ': '))
+            f.write('\n')
+        print("Saved baseline to {}".format(baseline_file))
+
+    for message in marked:
+        print("SLOWER: " + message)
+    for message in failures:
+        print("REGRESSION: " + message)
+
+    lines, errors = check_limits()
+    print("")
+    print("{:<32} {:>10} {:>10}".format("Template", "bytes", "resources"))
+    for line in lines:
+        print(line)
+    for message in errors:
+        print("OVER LIMIT: " + message)
+    sys.exit(1 if failures or errors else 0)
+
+
+if __name__ == '__main__':
+    main(docopt(__doc__))
@@ -1,56 +1,163 @@
-from troposphere import Ref, Template, Select
-from stack_parts import parameters, dynamodb, iam, webserver, securitygroups, rds, judgehost
+import json
 
+from . import stack_parts
+from .fold import fold_template, prune_template
+
+__version__ = '0.1'
+
+CONTEST_SIZES = ['nano', 'small', 'medium', 'large']
+ENVIRONMENT_TYPES = ['stage', 'prod']
+# metrics the web tier can scale on(see scaling.py), requests needs an ALB
+WEB_SCALING_METRICS = ['latency', 'cpu', 'requests']
+DEFAULT_WEB_SCALING = ['latency', 'cpu']
+# Bigger contests aim for lower latency/CPU so the web tier has more headroom
+# when everyone logs in at once, and count new instances in sooner so a scale
+# out can follow the previous one faster
+WEB_SCALING_TARGETS = {
+    'nano': {'WebLatencyTarget': 0.5, 'WebCPUTarget': 70, 'WebScalingWarmup': 300},
+    'small': {'WebLatencyTarget': 0.4, 'WebCPUTarget': 60, 'WebScalingWarmup': 240},
+    'medium': {'WebLatencyTarget': 0.3, 'WebCPUTarget': 50, 'WebScalingWarmup': 180},
+    'large': {'WebLatencyTarget': 0.25, 'WebCPUTarget': 50, 'WebScalingWarmup': 180},
+}
+CACHE_ENGINES = ['redis', 'memcached']
+# how the session table gets its capacity(see stack_parts/dynamodb.py)
+DYNAMODB_MODES = ['provisioned', 'autoscaling', 'ondemand']
+# judging queue entries per judgehost the judgehosts scale towards
+DEFAULT_JUDGE_QUEUE_TARGET = 10
+# Instance types a mixed judgehost fleet picks from. They have to judge equally
+# fast, or the same submission may pass on one and time out on another.
+DEFAULT_JUDGE_INSTANCE_TYPES = ['c5.large', 'c5d.large', 'c5n.large']
+DEFAULT_JUDGE_ON_DEMAND_BASE = 1
+# the webservers sit behind a classic ELB or an Application Load Balancer
+LOAD_BALANCER_TYPES = ['classic', 'alb']
+# tiers that can get a warm pool of stopped, initialized instances
+WARM_POOL_TIERS = ['web', 'judge']
+# how webservers get the domserver: installed from S3DeployBucket at boot, or
+# already on a pre-baked AMI
+WEB_BOOT_MODES = ['install', 'prebaked']
+# How a webserver deploy replaces the instances: one at a time, in batches of
+# a percentage of the group, or with a whole new group(see stack_parts/webserver.py)
+WEB_DEPLOY_STRATEGIES = ['rolling', 'batches', 'replace']
+DEFAULT_DEPLOY_BATCH = 25
+DEFAULT_DEPLOY_MIN_IN_SERVICE = 75
+
+
+def new_template(contestsize=None, envtype=None, web_scaling=None, judge_queue_target=None, workload=None,
+                 cache_engine=None, dynamodb_mode=None, judge_spot=None, judge_on_demand_base=None,
+                 judge_instance_types=None, warm_pools=None, load_balancer=None, web_boot=None,
+                 web_deploy=None, deploy_batch=None, deploy_min_in_service=None):
+    # The template and `r` dict the stack parts get built into, with everything
+    # the generator itself provides
+
+    # troposphere is only imported here so that cached renders never load it
+    from troposphere import Ref, Template, Select
 
-def generate_json():
     r = {}
+    r['settings'] = {
+        'contestsize': contestsize,
+        'envtype': envtype,
+        'web_scaling': web_scaling or DEFAULT_WEB_SCALING,
+        'judge_queue_target': judge_queue_target or DEFAULT_JUDGE_QUEUE_TARGET,
+        'cache_engine': cache_engine or CACHE_ENGINES[0],
+        'dynamodb_mode': dynamodb_mode or DYNAMODB_MODES[0],
+        'judge_spot': judge_spot or 0,
+        'judge_on_demand_base': DEFAULT_JUDGE_ON_DEMAND_BASE if judge_on_demand_base is None else judge_on_demand_base,
+        'judge_instance_types': judge_instance_types or DEFAULT_JUDGE_INSTANCE_TYPES,
+        'warm_pools': warm_pools or [],
+        'load_balancer': load_balancer or LOAD_BALANCER_TYPES[0],
+        'web_boot': web_boot or WEB_BOOT_MODES[0],
+        'web_deploy': web_deploy or WEB_DEPLOY_STRATEGIES[0],
+        'deploy_batch': deploy_batch or DEFAULT_DEPLOY_BATCH,
+        'deploy_min_in_service': DEFAULT_DEPLOY_MIN_IN_SERVICE if deploy_min_in_service is None
+        else deploy_min_in_service,
+    }
     t = Template()
     # t.add_description(Join('', ["DOMjudge Cluster - ", Ref('AWS::StackName')]))
     t.add_description("DOMjudge Cluster")
 
     r['notify_topic'] = Select(0, Ref("AWS::NotificationARNs"))
 
-    t.add_mapping('SizeMap', {
-        'nano': {
-            'RDSInstanceType': 'db.t2.micro',
-            'WebInstanceType': 't2.micro',
-            'WebASGMinSize': 1,
-            'WebASGMaxSize': 4,
-            'JudgeASGMinSize': 1,
-            'JudgeASGMaxSize': 4,
-        },
-        'small': {
-            'RDSInstanceType': 'db.t2.micro',
-            'WebInstanceType': 't2.micro',
-            'WebASGMinSize': 1,
-            'WebASGMaxSize': 4,
-            'JudgeASGMinSize': 1,
-            'JudgeASGMaxSize': 4,
-        },
-        'medium': {
-            'RDSInstanceType': 'db.t2.micro',
-            'WebInstanceType': 't2.micro',
-            'WebASGMinSize': 1,
-            'WebASGMaxSize': 4,
-            'JudgeASGMinSize': 1,
-            'JudgeASGMaxSize': 4,
-        },
-        'large': {
-            'RDSInstanceType': 'db.t2.micro',
-            'WebInstanceType': 't2.micro',
-            'WebASGMinSize': 1,
-            'WebASGMaxSize': 4,
-            'JudgeASGMinSize': 1,
-            'JudgeASGMaxSize': 4,
-        },
-    })
-
-    parameters.init(t, r)
-    dynamodb.init(t, r)
-    iam.init(t, r)
-    securitygroups.init(t, r)
-    rds.init(t, r)
-    webserver.init(t, r)
-    judgehost.init(t, r)
-
-    return t.to_json()
+    # Instance types and counts come from the capacity model, see capacity.py
+    from .capacity import plan, size_map, plan_deploy
+    sizes = size_map(plan(workload))
+    for size, targets in WEB_SCALING_TARGETS.items():
+        sizes[size].update(targets)
+        if r['settings']['web_deploy'] == 'batches':
+            sizes[size].update(plan_deploy(sizes[size]['WebASGMaxSize'], r['settings']['deploy_batch'],
+                                           r['settings']['deploy_min_in_service']))
+    t.add_mapping('SizeMap', sizes)
+
+    return t, r
+
+
+def build_template(parts=None, contestsize=None, envtype=None, web_scaling=None, judge_queue_target=None,
+                   workload=None, cache_engine=None, dynamodb_mode=None, judge_spot=None,
+                   judge_on_demand_base=None, judge_instance_types=None, warm_pools=None, load_balancer=None,
+                   web_boot=None, web_deploy=None, deploy_batch=None, deploy_min_in_service=None,
+                   profile=None):
+    # Returns the template as a dict, and which stack part added each entry of
+    # it as {section: {logical id: part name}}.
+    #
+    # parts: names of the stack parts to build (plus whatever they require);
+    # None builds the whole cluster
+    # contestsize/envtype: build a template specialized for that ContestSize
+    # and/or EnvironmentType instead of leaving the choice to the stack. Every
+    # condition and SizeMap lookup that depends on them is folded into a literal.
+    # web_scaling: the metrics the web tier scales on(see WEB_SCALING_METRICS)
+    # judge_queue_target: judging queue entries per judgehost to scale towards
+    # workload: overrides of the contest workloads the SizeMap is planned for(see capacity.plan())
+    # cache_engine: the ElastiCache engine of the optional elasticache part(see CACHE_ENGINES)
+    # dynamodb_mode: how the session table gets its capacity(see DYNAMODB_MODES)
+    # judge_spot: percentage of the judgehosts above judge_on_demand_base to run
+    # on spot instances of judge_instance_types; 0 runs them all on demand
+    # warm_pools: the tiers(see WARM_POOL_TIERS) that get a warm pool
+    # load_balancer: what the webservers sit behind(see LOAD_BALANCER_TYPES)
+    # web_boot: how webservers get the domserver(see WEB_BOOT_MODES)
+    # web_deploy: how a deploy replaces the webservers(see WEB_DEPLOY_STRATEGIES);
+    # with batches, deploy_batch percent of the webservers at a time, keeping
+    # deploy_min_in_service percent in service
+    # profile: a list that gets a record per stack part with the time it took,
+    # the memory it allocated, what it added and how many bytes that serializes to
+    t, r = new_template(contestsize, envtype, web_scaling, judge_queue_target, workload, cache_engine,
+                        dynamodb_mode, judge_spot, judge_on_demand_base, judge_instance_types, warm_pools,
+                        load_balancer, web_boot, web_deploy, deploy_batch, deploy_min_in_service)
+    owners = stack_parts.build(t, r, parts, profile)
+
+    template = t.to_dict()
+    if contestsize or envtype:
+        template = fold_template(template, {
+            'ContestSize': contestsize,
+            'EnvironmentType': envtype,
+        })
+    # parameters only the parts left out(or the folded conditions) used
+    prune_template(template)
+
+    if profile is not None:
+        from .size import size_report
+        part_bytes = dict(size_report(template, owners)['parts'])
+        for record in profile:
+            record['bytes'] = part_bytes.get(record['part'], 0)
+    return template, owners
+
+
+def dump(template, fp, compact=False):
+    # json.dump() writes the encoded template in chunks, so this never holds the
+    # whole JSON string in memory
+    if compact:
+        json.dump(template, fp, sort_keys=True, separators=(',', ':'))
+    else:
+        json.dump(template, fp, indent=4, sort_keys=True, separators=(',', ': '))
+
+
+def write_json(fp, compact=False, **options):
+    # Render the template straight into the file object `fp`. options are the
+    # arguments of build_template()
+    template, owners = build_template(**options)
+    dump(template, fp, compact)
+
+
+def generate_json(compact=False, **options):
+    template, owners = build_template(**options)
+    if compact:
+        return json.dumps(template, sort_keys=True, separators=(',', ':'))
+    return json.dumps(template, indent=4, sort_keys=True, separators=(',', ': '))
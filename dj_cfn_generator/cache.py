@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import shutil
+
+from . import __version__
+
+DEFAULT_CACHE_DIR = os.path.join('~', '.cache', 'dj_cfn_generator')
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024    # 64MB of rendered templates
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def source_hash():
+    # Hash of every module in the package (the generator and all stack parts), so
+    # editing any of them invalidates the cache even without a version bump
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(PACKAGE_DIR):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith('.py'):
+                continue
+            path = os.path.join(root, name)
+            h.update(os.path.relpath(path, PACKAGE_DIR).encode('utf-8'))
+            with open(path, 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def cache_key(options):
+    h = hashlib.sha256()
+    h.update(__version__.encode('utf-8'))
+    h.update(source_hash().encode('utf-8'))
+    h.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+
+class RenderCache(object):
+    # Rendered templates stored as <cache_dir>/<key>.json. The mtime of an entry
+    # is bumped on every hit, and the least recently used entries are removed
+    # once the directory grows beyond max_bytes.
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def open(self, key):
+        path = self.path(key)
+        try:
+            f = open(path)
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+        return f
+
+    def get(self, key):
+        f = self.open(key)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def put(self, key, data):
+        self.write(key, lambda f: f.write(data))
+
+    def write(self, key, writer):
+        # writer(f) writes the entry into the file object f
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError:
+            if not os.path.isdir(self.cache_dir):
+                raise
+
+        # write to a temporary file first so readers never see a partial template
+        import tempfile
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                writer(f)
+            os.rename(tmp, self.path(key))
+        except Exception:
+            os.remove(tmp)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            total -= size
+
+
+def cached_generate_json(cache, **options):
+    # Same as generate_json(**options), but served from `cache` when the package
+    # and the options are unchanged
+    key = cache_key(options)
+    data = cache.get(key)
+    if data is None:
+        from . import generate_json
+        data = generate_json(**options)
+        cache.put(key, data)
+    return data
+
+
+def cached_write_json(cache, fp, **options):
+    # Same as write_json(fp, **options), streaming the cached copy when there is one
+    key = cache_key(options)
+    f = cache.open(key)
+    if f is None:
+        from . import write_json
+        cache.write(key, lambda f: write_json(f, **options))
+        f = cache.open(key)
+        if f is None:
+            # evicted straight away, it is larger than the whole cache
+            return write_json(fp, **options)
+    with f:
+        shutil.copyfileobj(f, fp)
@@ -0,0 +1,312 @@
+import math
+
+from . import CONTEST_SIZES
+
+# The contest each ContestSize is planned for
+DEFAULT_WORKLOADS = {
+    'nano': {'teams': 10, 'problems': 8, 'testcase_mb': 5, 'submissions_per_team_hour': 2},
+    'small': {'teams': 50, 'problems': 10, 'testcase_mb': 10, 'submissions_per_team_hour': 2},
+    'medium': {'teams': 150, 'problems': 11, 'testcase_mb': 20, 'submissions_per_team_hour': 3},
+    'large': {'teams': 500, 'problems': 12, 'testcase_mb': 50, 'submissions_per_team_hour': 3},
+}
+
+# (instance type, requests/second one webserver serves within the latency target),
+# smallest first
+WEB_INSTANCE_TYPES = [
+    ('t2.micro', 15),
+    ('t2.small', 30),
+    ('t2.medium', 60),
+    ('c4.large', 120),
+    ('c4.xlarge', 240),
+]
+# (instance class, memory in GB, queries/second), smallest first
+RDS_INSTANCE_TYPES = [
+    ('db.t2.micro', 1, 200),
+    ('db.t2.small', 2, 400),
+    ('db.t2.medium', 4, 800),
+    ('db.m4.large', 8, 1600),
+    ('db.m4.xlarge', 16, 3200),
+    ('db.m4.2xlarge', 32, 6400),
+]
+# (node type, memory in GB, operations/second), smallest first
+CACHE_NODE_TYPES = [
+    ('cache.t2.micro', 0.5, 20000),
+    ('cache.t2.small', 1.5, 40000),
+    ('cache.t2.medium', 3, 80000),
+    ('cache.m4.large', 6, 150000),
+]
+# seconds a judgehost spends on a submission: compiling plus running the test
+# cases, which takes about as long as reading their data
+JUDGE_SECONDS_PER_SUBMISSION = 10
+JUDGE_SECONDS_PER_TESTCASE_MB = 0.5
+
+# Every team's browser polls the scoreboard and clarifications a few times a
+# minute, and at the start all of them log in and load the problem set at once
+REQUESTS_PER_TEAM_SECOND = 0.2
+START_BURST = 3
+# the last hour brings about twice the average submission rate
+SUBMISSION_PEAK = 2
+QUERIES_PER_REQUEST = 10
+# most of them are reads(scoreboard, API, judgehost polling), which read
+# replicas can take over
+READ_SHARE = 0.8
+MAX_RDS_REPLICAS = 3
+# With replicas, the primary takes the writes and as many reads as keep it
+# under this share of its capacity at the peak(RDSCpuAlarm goes off at 50%)
+PRIMARY_LOAD_SHARE = 0.5
+# share of a replica's capacity the reads the primary doesn't take are planned
+# to use. It is low so replica lag stays small, and the others can take over
+# the reads of a replica that falls behind or fails.
+REPLICA_READ_BUDGET = 0.3
+# each webserver hit reads and most update the session
+SESSION_WRITES_PER_REQUEST = 0.5
+
+# session reads/writes and scoreboard lookups per webserver hit, and what
+# each team keeps in the cache(sessions of its members, its scoreboard row)
+CACHE_OPS_PER_REQUEST = 4
+CACHE_KB_PER_TEAM = 64
+MAX_CACHE_NODES = 4
+
+# Database storage: what a judged submission stores(source, compile output,
+# the output of every run) and how many IOs a database write costs(the row
+# and the redo log), plus its 16KB pages of judging output
+CONTEST_HOURS = 5
+JUDGING_MB_PER_SUBMISSION = 0.5
+IOS_PER_WRITE = 2
+PAGE_KB = 16
+# room to grow on top of the contest's data, and the smallest volume RDS allows
+STORAGE_HEADROOM = 4
+MIN_STORAGE_GB = 20
+# gp2 gives 3 IOPS per GB as a baseline and bursts above it on credits, which
+# run out during a long contest. Volumes of 1000GB(3000 IOPS) and up don't
+# burst, so storage needing more than that gets provisioned IOPS(io1, which
+# RDS allows from 100GB and up to 50 IOPS per GB) instead of a bigger volume.
+GP2_IOPS_PER_GB = 3
+GP2_MIN_IOPS = 100
+GP2_MAX_BURSTING_IOPS = 3000
+IO1_MIN_STORAGE_GB = 100
+IO1_MIN_IOPS = 1000
+IO1_MAX_IOPS_PER_GB = 50
+# connections each webserver's PHP workers open, on top of one per judgehost
+# and a few for the admins
+CONNECTIONS_PER_WEBSERVER = 25
+ADMIN_CONNECTIONS = 10
+# the redo log holds about an hour of writes, in two files of this size
+WRITE_KB = 1
+MIN_LOG_FILE_SIZE = 128 * 1024 * 1024
+MAX_LOG_FILE_SIZE = 2 * 1024 * 1024 * 1024
+
+# a web tier needing more instances than this moves to a bigger instance type
+MAX_WEB_INSTANCES = 8
+# headroom on the peak, so the groups don't run at 100%
+HEADROOM = 1.25
+# share of what a webserver serves that scaling on requests per target aims for
+WEB_REQUESTS_TARGET_SHARE = 0.7
+
+
+def ceil(value):
+    return int(math.ceil(value))
+
+
+def plan_web(peak_rps, base_rps, instance_types):
+    for instance_type, rps in instance_types:
+        max_size = ceil(peak_rps * HEADROOM / rps)
+        if max_size <= MAX_WEB_INSTANCES or instance_type == instance_types[-1][0]:
+            # at least two at peak, so the scaling policies have room to act
+            return instance_type, max(1, ceil(base_rps / rps)), max(2, max_size)
+
+
+def plan_rds(qps, memory_gb, instance_types):
+    # (instance class, replicas of it the reads need). The class is sized for
+    # all queries on the primary(without replicas, or when they fail over), the
+    # replicas for the reads the primary doesn't take within PRIMARY_LOAD_SHARE,
+    # at REPLICA_READ_BUDGET each. The rdsreplica part gets at least one.
+    for instance_class, memory, max_qps in instance_types:
+        if (qps * HEADROOM <= max_qps and memory_gb <= memory) or instance_class == instance_types[-1][0]:
+            primary_reads = max(0, max_qps * PRIMARY_LOAD_SHARE - qps * (1 - READ_SHARE))
+            replica_reads = max(0, qps * READ_SHARE - primary_reads)
+            replicas = ceil(replica_reads / (max_qps * REPLICA_READ_BUDGET))
+            return instance_class, min(MAX_RDS_REPLICAS, max(1, replicas))
+
+
+def plan_cache(ops, memory_gb, node_types):
+    # (node type, nodes), spreading the load over at most MAX_CACHE_NODES
+    for node_type, memory, max_ops in node_types:
+        nodes = max(1, ceil(ops * HEADROOM / max_ops), ceil(memory_gb * HEADROOM / memory))
+        if nodes <= MAX_CACHE_NODES or node_type == node_types[-1][0]:
+            return node_type, nodes
+
+
+def max_connections(webservers, judgehosts):
+    return webservers * CONNECTIONS_PER_WEBSERVER + judgehosts + ADMIN_CONNECTIONS
+
+
+def plan_storage(data_gb, iops):
+    # (storage type, GB, provisioned IOPS or 0, IOPS the volume sustains)
+    storage_gb = max(MIN_STORAGE_GB, ceil(data_gb * STORAGE_HEADROOM))
+    if iops <= GP2_MAX_BURSTING_IOPS:
+        # big enough that the baseline covers the peak, without burst credits
+        storage_gb = max(storage_gb, ceil(float(iops) / GP2_IOPS_PER_GB))
+        return 'gp2', storage_gb, 0, max(GP2_MIN_IOPS, storage_gb * GP2_IOPS_PER_GB)
+    iops = max(IO1_MIN_IOPS, int(math.ceil(iops / 100.0)) * 100)
+    storage_gb = max(storage_gb, IO1_MIN_STORAGE_GB, ceil(float(iops) / IO1_MAX_IOPS_PER_GB))
+    return 'io1', storage_gb, iops, iops
+
+
+def plan_deploy(web_max_size, batch_percent, min_in_service_percent):
+    # The UpdatePolicy of the webservers for a deploy in percentage batches,
+    # sized for the contest-time group(the scheduled actions scale it to the
+    # maximum for the contest). CloudFormation needs MinInstancesInService below
+    # MaxSize.
+    batch_size = max(1, ceil(web_max_size * batch_percent / 100.0))
+    min_in_service = min(web_max_size - 1, int(web_max_size * min_in_service_percent / 100.0))
+    return {'WebDeployBatchSize': batch_size, 'WebDeployMinInService': min_in_service}
+
+
+def plan_size(workload, web_instance_types=WEB_INSTANCE_TYPES, rds_instance_types=RDS_INSTANCE_TYPES,
+              judge_seconds=(JUDGE_SECONDS_PER_SUBMISSION, JUDGE_SECONDS_PER_TESTCASE_MB),
+              cache_node_types=CACHE_NODE_TYPES):
+    """
+    The capacity one contest needs. `workload` holds the number of teams and
+    problems, the average test case data per problem in MB and the submissions
+    per team per hour. Returns the workload figures the plan is based on and the
+    instance types and group sizes to run.
+    """
+    teams = workload['teams']
+    base_rps = teams * REQUESTS_PER_TEAM_SECOND
+    peak_rps = base_rps * START_BURST
+    web_type, web_min, web_max = plan_web(peak_rps, base_rps, web_instance_types)
+
+    judge_seconds = judge_seconds[0] + workload['testcase_mb'] * judge_seconds[1]
+    submissions_hour = teams * workload['submissions_per_team_hour']
+    peak_submissions_hour = submissions_hour * SUBMISSION_PEAK
+    judge_min = max(1, ceil(submissions_hour * judge_seconds / 3600))
+    judge_max = max(judge_min, ceil(peak_submissions_hour * judge_seconds * HEADROOM / 3600))
+
+    # the database serves the webservers, the polling judgehosts and keeps the
+    # test cases of every problem in memory
+    qps = peak_rps * QUERIES_PER_REQUEST + judge_max
+    memory_gb = 0.5 + 2 * workload['problems'] * workload['testcase_mb'] / 1024.0
+    rds_type, rds_replicas = plan_rds(qps, memory_gb, rds_instance_types)
+
+    # the writes go to the primary, and every submission's judging output to disk
+    write_qps = qps * (1 - READ_SHARE)
+    iops = ceil((write_qps * IOS_PER_WRITE +
+                 peak_submissions_hour / 3600.0 * JUDGING_MB_PER_SUBMISSION * 1024 / PAGE_KB) * HEADROOM)
+    data_gb = (2 * workload['problems'] * workload['testcase_mb'] +
+               submissions_hour * CONTEST_HOURS * JUDGING_MB_PER_SUBMISSION) / 1024.0
+    storage_type, storage_gb, provisioned_iops, volume_iops = plan_storage(data_gb, iops)
+    log_file_size = write_qps * WRITE_KB * 1024 * 3600 / 2
+    log_file_size = min(MAX_LOG_FILE_SIZE, max(MIN_LOG_FILE_SIZE, ceil(log_file_size / 1048576.0) * 1048576))
+
+    cache_type, cache_nodes = plan_cache(peak_rps * CACHE_OPS_PER_REQUEST,
+                                         teams * CACHE_KB_PER_TEAM / 1024.0 / 1024.0, cache_node_types)
+
+    return {
+        'workload': dict(workload),
+        'peak_requests_second': peak_rps,
+        'peak_submissions_hour': peak_submissions_hour,
+        'database_queries_second': qps,
+        'database_memory_gb': memory_gb,
+        'database_iops': iops,
+        'RDSInstanceType': rds_type,
+        'RDSReplicaCount': rds_replicas,
+        'RDSStorageType': storage_type,
+        'RDSAllocatedStorage': storage_gb,
+        'RDSIops': provisioned_iops,
+        # InnoDB flushes at the rate the volume sustains, and up to twice
+        # that(what gp2 bursts to at least) to catch up
+        'RDSIOCapacity': volume_iops,
+        'RDSIOCapacityMax': max(2 * volume_iops, GP2_MAX_BURSTING_IOPS),
+        'RDSMaxConnections': max_connections(web_max, judge_max),
+        'RDSLogFileSize': log_file_size,
+        'WebInstanceType': web_type,
+        # t2 instances can't be EBS-optimized
+        'WebEbsOptimized': 'false' if web_type.startswith('t2.') else 'true',
+        'WebASGMinSize': web_min,
+        'WebASGMaxSize': web_max,
+        # requests per webserver per minute(ALBRequestCountPerTarget)
+        'WebRequestsTarget': ceil(dict(web_instance_types)[web_type] * 60 * WEB_REQUESTS_TARGET_SHARE),
+        'JudgeASGMinSize': judge_min,
+        'JudgeASGMaxSize': judge_max,
+        'CacheNodeType': cache_type,
+        'CacheNodeCount': cache_nodes,
+        'DynamoDBReadCapacity': max(1, ceil(peak_rps * HEADROOM)),
+        'DynamoDBWriteCapacity': max(1, ceil(peak_rps * SESSION_WRITES_PER_REQUEST * HEADROOM)),
+        # what autoscaled tables scale in to between the bursts
+        'DynamoDBReadMinCapacity': max(1, ceil(base_rps)),
+        'DynamoDBWriteMinCapacity': max(1, ceil(base_rps * SESSION_WRITES_PER_REQUEST)),
+    }
+
+
+def plan(workload=None):
+    """
+    Plan every ContestSize. `workload` overrides parts of the defaults:
+
+    sizes: {contest size: workload fields}, see plan_size()
+    web_instance_types: [[instance type, requests/second], ...]
+    rds_instance_types: [[instance class, memory GB, queries/second], ...]
+    cache_node_types: [[node type, memory GB, operations/second], ...]
+    judge_seconds_per_submission, judge_seconds_per_testcase_mb: how long the
+    JudgehostInstanceType takes to judge a submission
+    """
+    workload = workload or {}
+    sizes = workload.get('sizes', {})
+    unknown = [s for s in sizes if s not in CONTEST_SIZES]
+    if unknown:
+        raise ValueError('Unknown contest size "{}" in workload (choose from {})'.format(
+            unknown[0], ', '.join(CONTEST_SIZES)))
+
+    web_instance_types = [tuple(i) for i in workload.get('web_instance_types', WEB_INSTANCE_TYPES)]
+    rds_instance_types = [tuple(i) for i in workload.get('rds_instance_types', RDS_INSTANCE_TYPES)]
+    cache_node_types = [tuple(i) for i in workload.get('cache_node_types', CACHE_NODE_TYPES)]
+    judge_seconds = (workload.get('judge_seconds_per_submission', JUDGE_SECONDS_PER_SUBMISSION),
+                     workload.get('judge_seconds_per_testcase_mb', JUDGE_SECONDS_PER_TESTCASE_MB))
+    plans = {}
+    for size in CONTEST_SIZES:
+        size_workload = dict(DEFAULT_WORKLOADS[size], **sizes.get(size, {}))
+        plans[size] = plan_size(size_workload, web_instance_types, rds_instance_types, judge_seconds,
+                                cache_node_types)
+    # a bigger ContestSize may get a bigger primary, which takes more of the
+    # reads itself, but never fewer replicas
+    replicas = 0
+    for size in CONTEST_SIZES:
+        replicas = max(replicas, plans[size]['RDSReplicaCount'])
+        plans[size]['RDSReplicaCount'] = replicas
+    return plans
+
+
+SIZE_MAP_KEYS = ['RDSInstanceType', 'RDSReplicaCount', 'RDSStorageType', 'RDSAllocatedStorage', 'RDSIops',
+                 'RDSIOCapacity', 'RDSIOCapacityMax', 'RDSMaxConnections', 'RDSLogFileSize', 'WebInstanceType',
+                 'WebEbsOptimized', 'WebASGMinSize', 'WebASGMaxSize', 'WebRequestsTarget', 'JudgeASGMinSize', 'JudgeASGMaxSize', 'CacheNodeType',
+                 'CacheNodeCount', 'DynamoDBReadCapacity', 'DynamoDBWriteCapacity', 'DynamoDBReadMinCapacity',
+                 'DynamoDBWriteMinCapacity']
+
+
+def size_map(plans):
+    # The SizeMap entries of plan()
+    return dict((size, dict((k, p[k]) for k in SIZE_MAP_KEYS)) for size, p in plans.items())
+
+
+def format_plan(plans):
+    rows = [('Size', 'Teams', 'Peak req/s', 'Web', 'Peak subs/h', 'Judgehosts', 'RDS', 'RDS storage', 'Cache',
+             'DynamoDB r/w')]
+    for size in CONTEST_SIZES:
+        p = plans[size]
+        rows.append((
+            size,
+            str(p['workload']['teams']),
+            '{:.0f}'.format(p['peak_requests_second']),
+            '{} x {}-{}'.format(p['WebInstanceType'], p['WebASGMinSize'], p['WebASGMaxSize']),
+            '{:.0f}'.format(p['peak_submissions_hour']),
+            '{}-{}'.format(p['JudgeASGMinSize'], p['JudgeASGMaxSize']),
+            '{} + {} replica(s)'.format(p['RDSInstanceType'], p['RDSReplicaCount']),
+            '{} {}GB{}'.format(p['RDSStorageType'], p['RDSAllocatedStorage'],
+                              ' {} IOPS'.format(p['RDSIops']) if p['RDSIops'] else ''),
+            '{} x {}'.format(p['CacheNodeType'], p['CacheNodeCount']),
+            '{}/{}'.format(p['DynamoDBReadCapacity'], p['DynamoDBWriteCapacity']),
+        ))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join(
+        '  '.join(cell.ljust(w) if i == 0 else cell.rjust(w) for i, (cell, w) in enumerate(zip(row, widths)))
+        for row in rows)
@@ -0,0 +1,352 @@
+"""
+Usage: dj_cfn_generator [-v] [options] [-f <file>]
+       dj_cfn_generator [-v] [options] -u [--bucket <s3bucket>]
+       dj_cfn_generator [-v] [options] --matrix <dir> [-j <n>] [-u [--bucket <s3bucket>]]
+       dj_cfn_generator [-v] [options] diff [<old> [<new>]] [--bucket <s3bucket>]
+       dj_cfn_generator [options] --plan
+       dj_cfn_generator [options] --deploy-plan
+
+Generate DOMjudge cluster cloudformation template on STDOUT.
+
+diff compares the template(or the template file <new>) to the template file <old>, or to the
+template the `latest` pointer in the S3 bucket names when <old> is omitted. It lists what gets
+added, modified or replaced, and estimates the rollout of every AutoScalingGroup whose instances
+get replaced.
+
+Options:
+  --parts <parts>               Only build these stack parts(comma separated) and the parts they need
+  --with <parts>                Also build these optional stack parts(comma separated: rdsreplica,
+                                elasticache, cloudfront)
+  --cache-engine <engine>       ElastiCache engine of the elasticache part(redis, memcached)
+                                [default: redis]
+  --dynamodb-mode <mode>        Capacity of the session table: provisioned(fixed), autoscaling(between
+                                the planned minimum and DynamoDBCapacity) or ondemand
+                                [default: provisioned]
+  --contest-size <size>         Specialize the template for one ContestSize(nano, small, medium, large)
+  --environment <env>           Specialize the template for one EnvironmentType(stage, prod)
+  --web-scaling <metrics>       Metrics the web tier scales on(comma separated: latency, cpu, and
+                                requests with --load-balancer alb)
+                                [default: latency,cpu]
+  --judge-queue-target <n>      Judging queue entries per judgehost to scale the judgehosts towards
+                                [default: 10]
+  --judge-spot <percent>        Percentage of the judgehosts above the on-demand base to run as spot
+                                instances(0 runs them all on demand)[default: 0]
+  --judge-on-demand-base <n>    Judgehosts to run on demand before using spot instances[default: 1]
+  --judge-instance-types <types>
+                                Interchangeable instance types of spot judgehosts(comma separated)
+                                [default: c5.large,c5d.large,c5n.large]
+  --load-balancer <type>        Put the webservers behind a classic ELB or an Application Load
+                                Balancer(classic, alb)[default: classic]
+  --web-boot <mode>             Install the domserver when a webserver boots, or use a pre-baked AMI
+                                that has it installed(install, prebaked)[default: install]
+  --web-deploy <strategy>       How a deploy replaces the webservers: one at a time(rolling), in
+                                percentage batches(batches) or with a new group(replace)
+                                [default: rolling]
+  --deploy-batch <percent>      Percentage of the contest-time webservers per batch[default: 25]
+  --deploy-min-in-service <percent>
+                                Percentage of the contest-time webservers to keep in service during a
+                                deploy in batches[default: 75]
+  --warm-pools <tiers>          Keep stopped, initialized instances ready for these tiers(comma
+                                separated: web, judge; not with --judge-spot)
+  --workload <file>             Plan the SizeMap for the contest workloads in this JSON file
+  --plan                        Print the capacity planned for every ContestSize
+  --deploy-plan                 Print how long a webserver deploy takes and how many webservers stay in
+                                service, for every ContestSize and EnvironmentType
+  --matrix <dir>                Write a specialized template for every ContestSize and EnvironmentType
+                                to <dir>, plus an index.json describing them
+  -j <n>, --jobs <n>            Number of processes to render the matrix with(one per CPU if omitted)
+  --cache-dir <dir>             Directory to cache rendered templates in[default: ~/.cache/dj_cfn_generator]
+  --no-cache                    Always render the template, bypassing the cache
+  --compact                     Write compact JSON instead of pretty printing it
+  --size-report                 Print where the bytes of the template go(per stack part and resource)
+                                on STDERR, with warnings about CloudFormation template size limits
+  --profile <format>            Print the time, allocations, template entries and bytes of every stack
+                                part on STDERR, as a table or json(timings include tracing overhead)
+  -u, --upload                  Upload template to Amazon S3(skipped when it is already there)
+  --bucket <s3bucket>           Bucket to use for uploads[default: cloudcontest.org-cf-templates]
+  --endpoint-url <url>          S3 endpoint to upload to, e.g. a local S3 stand-in for testing
+  --gzip                        Store templates in S3 gzip-encoded(Content-Encoding: gzip)
+  -f <file>, --file <file>      Save template as <file>
+  -v, --verbose                 Be verbose
+  -h, --help                    Show this help message
+"""
+from __future__ import print_function
+
+import os
+import sys
+
+from docopt import docopt
+
+import dj_cfn_generator
+
+# Only what every invocation needs is imported at module level. boto3,
+# troposphere, multiprocessing and friends are imported on the code path that
+# uses them, since most runs(e.g. cache hits written to a file) never do.
+
+verbose = False
+
+
+def vprint(*args, **kwargs):
+    global verbose
+    if verbose:
+        print(*args, file=sys.stderr, **kwargs)
+
+
+def upload_s3(templates, args):
+    # templates: list of (pointer key, template body or seekable binary file)
+    import boto3
+    from dj_cfn_generator.publish import publish_templates
+
+    bucket = args['--bucket']
+    vprint("Uploading to S3 bucket {}".format(bucket))
+    client = boto3.client('s3', endpoint_url=args['--endpoint-url'])
+    results = publish_templates(client, bucket, templates, gzipped=args['--gzip'])
+    for (pointer, body), (key, uploaded) in zip(templates, results):
+        vprint("{} -> {}{}".format(pointer, key, '' if uploaded else ' (unchanged)'))
+
+
+def show_diff(args, options, cache):
+    import json
+    from dj_cfn_generator.diff import diff_templates, format_diff
+
+    if args['<new>']:
+        with open(args['<new>']) as f:
+            new = json.load(f)
+    elif cache is None:
+        new = json.loads(dj_cfn_generator.generate_json(**options))
+    else:
+        from dj_cfn_generator.cache import cached_generate_json
+        new = json.loads(cached_generate_json(cache, **options))
+
+    if args['<old>']:
+        vprint("Comparing to {}".format(args['<old>']))
+        with open(args['<old>']) as f:
+            old = json.load(f)
+    else:
+        import boto3
+        from dj_cfn_generator.publish import fetch_template
+
+        # specialized templates are published under their own pointer(see --matrix)
+        pointer = 'latest'
+        if options['contestsize'] and options['envtype']:
+            pointer = 'latest-{}-{}'.format(options['contestsize'], options['envtype'])
+        client = boto3.client('s3', endpoint_url=args['--endpoint-url'])
+        key, body = fetch_template(client, args['--bucket'], pointer)
+        vprint("Comparing to {} in S3 bucket {} ({})".format(key, args['--bucket'], pointer))
+        old = json.loads(body.decode('utf-8'))
+
+    print(format_diff(diff_templates(old, new)))
+
+
+def main(args):
+    global verbose
+    verbose = args['--verbose'] or False
+
+    parts = None
+    if args['--parts']:
+        parts = [p.strip() for p in args['--parts'].split(',') if p.strip()]
+    if args['--with']:
+        optional = [p.strip() for p in args['--with'].split(',') if p.strip()]
+        for name in optional:
+            if name not in dj_cfn_generator.stack_parts.OPTIONAL_PART_NAMES:
+                sys.exit('Unknown optional stack part "{}" (choose from {})'.format(
+                    name, ', '.join(dj_cfn_generator.stack_parts.OPTIONAL_PART_NAMES)))
+        parts = (parts or dj_cfn_generator.stack_parts.DEFAULT_PART_NAMES) + optional
+    if parts:
+        try:
+            resolved = dj_cfn_generator.stack_parts.resolve(parts)
+        except ValueError as e:
+            sys.exit(str(e))
+        vprint("Building stack parts: {}".format(', '.join(p.name for p in resolved)))
+
+    if args['--contest-size'] and args['--contest-size'] not in dj_cfn_generator.CONTEST_SIZES:
+        sys.exit("Unknown contest size {}".format(args['--contest-size']))
+    if args['--environment'] and args['--environment'] not in dj_cfn_generator.ENVIRONMENT_TYPES:
+        sys.exit("Unknown environment type {}".format(args['--environment']))
+    web_scaling = [m.strip() for m in args['--web-scaling'].split(',') if m.strip()]
+    for metric in web_scaling:
+        if metric not in dj_cfn_generator.WEB_SCALING_METRICS:
+            sys.exit("Unknown web scaling metric {}(use {})".format(
+                metric, ', '.join(dj_cfn_generator.WEB_SCALING_METRICS)))
+    if args['--load-balancer'] not in dj_cfn_generator.LOAD_BALANCER_TYPES:
+        sys.exit("Unknown load balancer type {}(use {})".format(
+            args['--load-balancer'], ', '.join(dj_cfn_generator.LOAD_BALANCER_TYPES)))
+    if 'requests' in web_scaling and args['--load-balancer'] != 'alb':
+        sys.exit("Scaling on requests needs --load-balancer alb")
+    if args['--web-boot'] not in dj_cfn_generator.WEB_BOOT_MODES:
+        sys.exit("Unknown web boot mode {}(use {})".format(
+            args['--web-boot'], ', '.join(dj_cfn_generator.WEB_BOOT_MODES)))
+    if args['--web-deploy'] not in dj_cfn_generator.WEB_DEPLOY_STRATEGIES:
+        sys.exit("Unknown web deploy strategy {}(use {})".format(
+            args['--web-deploy'], ', '.join(dj_cfn_generator.WEB_DEPLOY_STRATEGIES)))
+    try:
+        deploy_batch = int(args['--deploy-batch'])
+        deploy_min_in_service = int(args['--deploy-min-in-service'])
+    except ValueError:
+        sys.exit("Deploy batch and minimum in service percentages must be numbers")
+    if not 0 < deploy_batch <= 100 or not 0 <= deploy_min_in_service < 100:
+        sys.exit("Deploy batch percentage must be between 1 and 100, and the minimum in service between 0 and 99")
+    try:
+        judge_queue_target = int(args['--judge-queue-target'])
+    except ValueError:
+        judge_queue_target = 0
+    if judge_queue_target < 1:
+        sys.exit("Judge queue target must be a positive number")
+    try:
+        judge_spot = int(args['--judge-spot'])
+        judge_on_demand_base = int(args['--judge-on-demand-base'])
+    except ValueError:
+        sys.exit("Judge spot percentage and on-demand base must be numbers")
+    if not 0 <= judge_spot <= 100 or judge_on_demand_base < 0:
+        sys.exit("Judge spot percentage must be between 0 and 100, and the on-demand base at least 0")
+    judge_instance_types = [i.strip() for i in args['--judge-instance-types'].split(',') if i.strip()]
+    if not judge_instance_types:
+        sys.exit("Specify at least one judgehost instance type")
+    warm_pools = [w.strip() for w in (args['--warm-pools'] or '').split(',') if w.strip()]
+    for tier in warm_pools:
+        if tier not in dj_cfn_generator.WARM_POOL_TIERS:
+            sys.exit("Unknown warm pool tier {}(use {})".format(tier, ', '.join(dj_cfn_generator.WARM_POOL_TIERS)))
+    if 'judge' in warm_pools and judge_spot:
+        sys.exit("Judgehosts can't have a warm pool when they run as spot instances")
+    if args['--cache-engine'] not in dj_cfn_generator.CACHE_ENGINES:
+        sys.exit("Unknown cache engine {}(use {})".format(
+            args['--cache-engine'], ', '.join(dj_cfn_generator.CACHE_ENGINES)))
+    if args['--dynamodb-mode'] not in dj_cfn_generator.DYNAMODB_MODES:
+        sys.exit("Unknown DynamoDB mode {}(use {})".format(
+            args['--dynamodb-mode'], ', '.join(dj_cfn_generator.DYNAMODB_MODES)))
+    workload = None
+    if args['--workload']:
+        import json
+        with open(args['--workload']) as f:
+            workload = json.load(f)
+    if workload or args['--plan']:
+        from dj_cfn_generator.capacity import plan, format_plan
+        try:
+            plans = plan(workload)
+        except (ValueError, KeyError, TypeError) as e:
+            sys.exit("Invalid workload: {}".format(e))
+        if args['--plan']:
+            print(format_plan(plans))
+            return
+    if args['--profile'] and args['--profile'] not in ('table', 'json'):
+        sys.exit("Unknown profile format {}(use table or json)".format(args['--profile']))
+
+    cache = None
+    if not args['--no-cache']:
+        from dj_cfn_generator.cache import RenderCache
+        cache = RenderCache(args['--cache-dir'])
+        vprint("Using template cache in {}".format(cache.cache_dir))
+
+    if args['--matrix']:
+        from dj_cfn_generator.matrix import render_matrix
+
+        processes = None
+        if args['--jobs']:
+            try:
+                processes = int(args['--jobs'])
+            except ValueError:
+                processes = 0
+            if processes < 1:
+                sys.exit("Number of jobs must be a positive number")
+        manifest = render_matrix(args['--matrix'], processes=processes,
+                                 cache_dir=cache.cache_dir if cache else None,
+                                 parts=parts, web_scaling=web_scaling,
+                                 judge_queue_target=judge_queue_target, workload=workload,
+                                 cache_engine=args['--cache-engine'], dynamodb_mode=args['--dynamodb-mode'],
+                                 judge_spot=judge_spot, judge_on_demand_base=judge_on_demand_base,
+                                 judge_instance_types=judge_instance_types, warm_pools=warm_pools,
+                                 load_balancer=args['--load-balancer'], web_boot=args['--web-boot'],
+                                 web_deploy=args['--web-deploy'], deploy_batch=deploy_batch,
+                                 deploy_min_in_service=deploy_min_in_service, compact=args['--compact'])
+        for variant in manifest['variants']:
+            vprint("Wrote {} ({} bytes)".format(variant['file'], variant['bytes']))
+
+        if args['--upload']:
+            # the files are streamed to S3 rather than read into memory
+            templates = []
+            try:
+                for variant in manifest['variants']:
+                    pointer = 'latest-{}-{}'.format(variant['ContestSize'], variant['EnvironmentType'])
+                    templates.append((pointer, open(os.path.join(args['--matrix'], variant['file']), 'rb')))
+                upload_s3(templates, args)
+            finally:
+                for pointer, f in templates:
+                    f.close()
+        return
+
+    options = {
+        'parts': parts,
+        'contestsize': args['--contest-size'],
+        'envtype': args['--environment'],
+        'web_scaling': web_scaling,
+        'judge_queue_target': judge_queue_target,
+        'workload': workload,
+        'cache_engine': args['--cache-engine'],
+        'dynamodb_mode': args['--dynamodb-mode'],
+        'judge_spot': judge_spot,
+        'judge_on_demand_base': judge_on_demand_base,
+        'judge_instance_types': judge_instance_types,
+        'warm_pools': warm_pools,
+        'load_balancer': args['--load-balancer'],
+        'web_boot': args['--web-boot'],
+        'web_deploy': args['--web-deploy'],
+        'deploy_batch': deploy_batch,
+        'deploy_min_in_service': deploy_min_in_service,
+    }
+    compact = args['--compact']
+
+    if args['--deploy-plan']:
+        from dj_cfn_generator.diff import format_deploy_plan
+        template, owners = dj_cfn_generator.build_template(**options)
+        print("Webserver deploy({}):".format(args['--web-deploy']))
+        print(format_deploy_plan(template, 'WebserverAutoScalingGroup'))
+        return
+
+    if args['diff']:
+        show_diff(args, dict(options, compact=compact), cache)
+        return
+
+    # generate the json template(via some troposphere magic), unless an
+    # identical one was rendered before. It is streamed to its destination
+    # rather than built as one string.
+    if args['--size-report'] or args['--profile']:
+        # the reports need to know which stack part added what, so always render
+        profile = [] if args['--profile'] else None
+        template, owners = dj_cfn_generator.build_template(profile=profile, **options)
+
+        if args['--size-report']:
+            from dj_cfn_generator.size import size_report, format_size_report
+            print(format_size_report(size_report(template, owners, compact)), file=sys.stderr)
+        if args['--profile']:
+            from dj_cfn_generator.profile import format_profile
+            print(format_profile(profile, args['--profile']), file=sys.stderr)
+
+        def render(fp):
+            dj_cfn_generator.dump(template, fp, compact)
+    elif cache is None:
+        def render(fp):
+            dj_cfn_generator.write_json(fp, compact=compact, **options)
+    else:
+        from dj_cfn_generator.cache import cached_write_json
+
+        def render(fp):
+            cached_write_json(cache, fp, compact=compact, **options)
+
+    if args['--file']:
+        vprint("Writing to file {}".format(args['--file']))
+        with open(args['--file'], 'w') as f:
+            render(f)
+    elif args['--upload']:
+        import codecs
+        import tempfile
+
+        with tempfile.TemporaryFile() as f:
+            render(codecs.getwriter('utf-8')(f))
+            upload_s3([('latest', f)], args)
+    else:
+        render(sys.stdout)
+        print()
+
+
+def run():
+    main(docopt(__doc__))
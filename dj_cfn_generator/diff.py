@@ -0,0 +1,311 @@
+import copy
+import itertools
+
+from . import CONTEST_SIZES, ENVIRONMENT_TYPES
+from .fold import fold_template
+from .rollout import estimate_rollout, format_duration
+
+SECTIONS = ['Parameters', 'Conditions', 'Mappings', 'Resources', 'Outputs']
+
+# Properties CloudFormation can't update in place: changing one creates a new
+# resource(with a new physical id) and deletes the old one. '*' means any property.
+REPLACEMENT_PROPERTIES = {
+    'AWS::ApplicationAutoScaling::ScalableTarget': {'ResourceId', 'ScalableDimension', 'ServiceNamespace'},
+    'AWS::AutoScaling::LaunchConfiguration': '*',
+    'AWS::AutoScaling::AutoScalingGroup': {'AutoScalingGroupName'},
+    'AWS::AutoScaling::WarmPool': {'AutoScalingGroupName'},
+    'AWS::CloudWatch::Alarm': {'AlarmName'},
+    'AWS::CloudWatch::Dashboard': {'DashboardName'},
+    'AWS::DynamoDB::Table': {'KeySchema', 'LocalSecondaryIndexes', 'TableName'},
+    'AWS::EC2::LaunchTemplate': {'LaunchTemplateName'},
+    'AWS::EC2::SecurityGroup': {'GroupDescription', 'GroupName', 'VpcId'},
+    'AWS::EC2::SecurityGroupEgress': '*',
+    'AWS::EC2::SecurityGroupIngress': '*',
+    'AWS::ElasticLoadBalancing::LoadBalancer': {'LoadBalancerName', 'Scheme'},
+    'AWS::ElasticLoadBalancingV2::LoadBalancer': {'Name', 'Scheme', 'Type'},
+    'AWS::ElasticLoadBalancingV2::TargetGroup': {'Name', 'Port', 'Protocol', 'VpcId', 'TargetType'},
+    'AWS::IAM::InstanceProfile': {'InstanceProfileName', 'Path'},
+    'AWS::IAM::Role': {'Path', 'RoleName'},
+    'AWS::RDS::DBInstance': {'AvailabilityZone', 'CharacterSetName', 'DBInstanceIdentifier', 'DBName',
+                             'DBSubnetGroupName', 'KmsKeyId', 'MasterUsername', 'StorageEncrypted'},
+    'AWS::RDS::DBParameterGroup': {'Description', 'Family'},
+}
+
+# Changing one of these on an AutoScalingGroup replaces its instances, as
+# directed by its UpdatePolicy
+ROLLOUT_PROPERTIES = {'LaunchConfigurationName', 'LaunchTemplate', 'MixedInstancesPolicy', 'VPCZoneIdentifier'}
+
+# Resources that get a new version(the attribute) rather than being replaced
+# when they are modified
+VERSIONED = {
+    'AWS::EC2::LaunchTemplate': 'LatestVersionNumber',
+}
+
+ACTION_SYMBOLS = {'add': '+', 'remove': '-', 'modify': '~', 'replace': '!'}
+
+
+def references(value, found=None, attribute=None):
+    # Logical ids value refers to through Ref or Fn::GetAtt, or only through
+    # Fn::GetAtt of `attribute`
+    if found is None:
+        found = set()
+    if isinstance(value, list):
+        for v in value:
+            references(v, found, attribute)
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            if k == 'Ref' and not isinstance(v, (dict, list)):
+                if attribute is None:
+                    found.add(v)
+            elif k == 'Fn::GetAtt' and isinstance(v, list) and v:
+                if attribute is None or v[1:2] == [attribute]:
+                    found.add(v[0])
+            else:
+                references(v, found, attribute)
+    return found
+
+
+def changed_keys(old, new):
+    return sorted(k for k in set(old) | set(new) if old.get(k) != new.get(k))
+
+
+def requires_replacement(resource_type, properties):
+    replacing = REPLACEMENT_PROPERTIES.get(resource_type, ())
+    if replacing == '*':
+        return bool(properties)
+    return any(p in replacing for p in properties)
+
+
+def diff_section(old, new):
+    # (name, action, changed keys) for every entry that differs
+    changes = []
+    for name in sorted(set(old) | set(new)):
+        if name not in new:
+            changes.append((name, 'remove', []))
+        elif name not in old:
+            changes.append((name, 'add', []))
+        elif old[name] != new[name]:
+            keys = changed_keys(old[name], new[name]) if isinstance(new[name], dict) else []
+            changes.append((name, 'modify', keys))
+    return changes
+
+
+def diff_resources(old, new):
+    changes = {}
+    for name in set(old) | set(new):
+        if name not in new:
+            changes[name] = {'action': 'remove', 'type': old[name].get('Type'), 'properties': [], 'attributes': []}
+            continue
+        if name not in old:
+            changes[name] = {'action': 'add', 'type': new[name].get('Type'), 'properties': [], 'attributes': []}
+            continue
+        if old[name] == new[name]:
+            continue
+
+        old_body, new_body = old[name], new[name]
+        properties = changed_keys(old_body.get('Properties', {}), new_body.get('Properties', {}))
+        attributes = [k for k in changed_keys(old_body, new_body) if k != 'Properties']
+        if old_body.get('Type') != new_body.get('Type'):
+            action = 'replace'
+        elif requires_replacement(new_body.get('Type'), properties):
+            action = 'replace'
+        else:
+            action = 'modify'
+        changes[name] = {'action': action, 'type': new_body.get('Type'),
+                         'properties': properties, 'attributes': attributes}
+
+    # A replaced resource gets a new physical id, so every property referring to
+    # it changes too at deploy time, which may in turn replace that resource.
+    # A modified launch template only gets a new version, which changes the
+    # properties referring to that(e.g. the LaunchTemplate or
+    # MixedInstancesPolicy of the groups using it).
+    replaced = set(n for n, c in changes.items() if c['action'] == 'replace')
+    pending = list(replaced)
+    pending += [n for n, c in changes.items() if c['action'] == 'modify' and c['type'] in VERSIONED]
+    refs = None
+    while pending:
+        if refs is None:
+            refs = dict(
+                (name, [(p, v) for p, v in body.get('Properties', {}).items()])
+                for name, body in new.items() if name in old)
+        target = pending.pop()
+        attribute = None if target in replaced else VERSIONED[changes[target]['type']]
+        for name, props in refs.items():
+            affected = [p for p, v in props if target in references(v, attribute=attribute)]
+            if not affected:
+                continue
+            change = changes.setdefault(name, {'action': 'modify', 'type': new[name].get('Type'),
+                                               'properties': [], 'attributes': []})
+            change.setdefault('caused_by', [])
+            if target not in change['caused_by']:
+                change['caused_by'].append(target)
+            change['properties'] = sorted(set(change['properties']) | set(affected))
+            if name not in replaced and requires_replacement(change['type'], affected):
+                change['action'] = 'replace'
+                replaced.add(name)
+                pending.append(name)
+    return changes
+
+
+def instance_count(value):
+    # The number of instances a (folded) ASG size property asks for, taking the
+    # largest branch of conditions that are only known at deploy time
+    if isinstance(value, dict) and 'Fn::If' in value:
+        counts = [instance_count(v) for v in value['Fn::If'][1:]]
+        counts = [c for c in counts if c is not None]
+        return max(counts) if counts else None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def variant_values(template):
+    # The ContestSize/EnvironmentType combinations the template can be deployed with
+    parameters = template.get('Parameters', {})
+    sizes = parameters.get('ContestSize', {}).get('AllowedValues', CONTEST_SIZES) \
+        if 'ContestSize' in parameters else [None]
+    envs = parameters.get('EnvironmentType', {}).get('AllowedValues', ENVIRONMENT_TYPES) \
+        if 'EnvironmentType' in parameters else [None]
+    return list(itertools.product(sizes, envs))
+
+
+def rollout_estimates(template, name, peak=False):
+    # Estimated rollout of the AutoScalingGroup `name` for every variant of
+    # template, with the group at its DesiredCapacity, or at its MaxSize when
+    # `peak`(where the contest schedule puts it)
+    estimates = []
+    for size, env in variant_values(template):
+        # fold a template holding just this group, that is all we need to count.
+        # Folding prunes sections in place, so they are copied.
+        partial = {
+            'Parameters': dict(template.get('Parameters', {})),
+            'Mappings': dict(template.get('Mappings', {})),
+            'Conditions': copy.deepcopy(template.get('Conditions', {})),
+            'Resources': {name: copy.deepcopy(template['Resources'][name])},
+        }
+        partial = fold_template(partial, {'ContestSize': size, 'EnvironmentType': env})
+        asg = partial['Resources'].get(name)
+        if asg is None:
+            # the group isn't created in this variant
+            continue
+        properties = asg.get('Properties', {})
+        desired = instance_count(properties.get('DesiredCapacity', properties.get('MinSize')))
+        instances = instance_count(properties.get('MaxSize')) if peak else desired
+        if instances is None:
+            continue
+        estimate = estimate_rollout(asg, instances, desired)
+        estimate.update({'ContestSize': size, 'EnvironmentType': env, 'instances': instances})
+        estimates.append(estimate)
+    return estimates
+
+
+def diff_templates(old, new):
+    """
+    Compare two template dicts by logical id. Returns a dict with a list of
+    `changes`(section, name, action, and for resources their type and the changed
+    properties and attributes) and a list of `rollouts`: the AutoScalingGroups
+    whose instances get replaced, with estimates of how long that takes.
+    """
+    changes = []
+    resource_changes = {}
+    for section in SECTIONS:
+        old_section, new_section = old.get(section, {}), new.get(section, {})
+        if section == 'Resources':
+            resource_changes = diff_resources(old_section, new_section)
+            for name in sorted(resource_changes):
+                change = dict(resource_changes[name], section=section, name=name)
+                changes.append(change)
+        else:
+            for name, action, keys in diff_section(old_section, new_section):
+                changes.append({'section': section, 'name': name, 'action': action, 'attributes': keys})
+
+    rollouts = []
+    for name in sorted(resource_changes):
+        change = resource_changes[name]
+        if change['type'] != 'AWS::AutoScaling::AutoScalingGroup' or change['action'] != 'modify':
+            continue
+        triggers = [p for p in change['properties'] if p in ROLLOUT_PROPERTIES]
+        if not triggers:
+            continue
+        rollouts.append({
+            'resource': name,
+            'properties': triggers,
+            'caused_by': change.get('caused_by', []),
+            'estimates': rollout_estimates(new, name),
+        })
+    return {'changes': changes, 'rollouts': rollouts}
+
+
+def format_variant(estimate):
+    return '-'.join(v for v in (estimate['ContestSize'], estimate['EnvironmentType']) if v) or 'template'
+
+
+def format_estimate(estimate):
+    if estimate['strategy'] == 'none':
+        return '{} instance(s) keep running the old configuration(no UpdatePolicy)'.format(estimate['instances'])
+    if estimate['strategy'] == 'replace':
+        return 'new group of {} instance(s), up to {}'.format(
+            estimate['instances'], format_duration(estimate['seconds']))
+    return '{} instance(s) in {} batch(es), up to {}, at least {} in service'.format(
+        estimate['instances'], estimate['batches'], format_duration(estimate['seconds']),
+        estimate['min_in_service'])
+
+
+def format_deploy_plan(template, name):
+    # How long replacing the instances of the AutoScalingGroup `name` takes, and
+    # how many stay in service, per variant of template: outside the contest and
+    # during it
+    rows = [('Variant', 'Instances', 'Batches', 'Up to', 'In service', 'Contest', 'Batches', 'Up to',
+             'In service')]
+    for estimate, peak in zip(rollout_estimates(template, name), rollout_estimates(template, name, peak=True)):
+        row = [format_variant(estimate)]
+        for e in estimate, peak:
+            row += [str(e['instances']), str(e['batches']), format_duration(e['seconds']), str(e['min_in_service'])]
+        rows.append(tuple(row))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join(
+        '  '.join(cell.ljust(w) if i == 0 else cell.rjust(w) for i, (cell, w) in enumerate(zip(row, widths)))
+        for row in rows)
+
+
+def format_diff(diff):
+    lines = []
+    section = None
+    # what happens to the resources others refer to
+    actions = dict((c['name'], c['action']) for c in diff['changes'] if c['section'] == 'Resources')
+    for change in diff['changes']:
+        if change['section'] != section:
+            section = change['section']
+            lines.append('{}:'.format(section))
+        line = '  {} {}'.format(ACTION_SYMBOLS[change['action']], change['name'])
+        if change.get('type'):
+            line += ' ({})'.format(change['type'])
+        line += ' {}'.format(change['action'])
+        details = change.get('properties', []) + change.get('attributes', [])
+        if details:
+            line += ': {}'.format(', '.join(details))
+        if change.get('caused_by'):
+            causes = [('replaced ' if actions.get(n) == 'replace' else 'new version of ') + n
+                      for n in change['caused_by']]
+            line += ' (refers to {})'.format(', '.join(causes))
+        lines.append(line)
+    if not diff['changes']:
+        lines.append('No changes')
+
+    for rollout in diff['rollouts']:
+        cause = ', '.join(rollout['properties'])
+        if rollout['caused_by']:
+            cause += ' via ' + ', '.join(rollout['caused_by'])
+        lines.append('Rollout of {} ({} changed):'.format(rollout['resource'], cause))
+        # variants that roll out the same way share a line
+        grouped = []
+        for estimate in rollout['estimates']:
+            line = format_estimate(estimate)
+            if grouped and grouped[-1][1] == line:
+                grouped[-1][0].append(format_variant(estimate))
+            else:
+                grouped.append(([format_variant(estimate)], line))
+        for variants, line in grouped:
+            lines.append('  {}: {}'.format(', '.join(variants), line))
+    return '\n'.join(lines)
@@ -0,0 +1,172 @@
+import re
+
+NO_VALUE = {'Ref': 'AWS::NoValue'}
+# the names a Fn::Sub string refers to(${Name} or ${Name.Attribute}, but not
+# the literal ${!Name})
+SUBSTITUTION = re.compile(r'\$\{(?!!)([^}.]+)')
+
+
+def is_literal(value):
+    return not isinstance(value, (dict, list))
+
+
+def collect_references(value, refs, conditions, mappings):
+    # Adds the parameters and resources `value` refers to to `refs`, and the
+    # conditions and mappings it uses to `conditions` and `mappings`
+    if isinstance(value, list):
+        for v in value:
+            collect_references(v, refs, conditions, mappings)
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            if k == 'Ref' and is_literal(v):
+                refs.add(v)
+            elif k == 'Fn::Sub':
+                if is_literal(v):
+                    refs.update(SUBSTITUTION.findall(v))
+                else:
+                    refs.update(set(SUBSTITUTION.findall(v[0])) - set(v[1]))
+            elif k == 'Fn::If':
+                conditions.add(v[0])
+            elif k == 'Condition' and is_literal(v):
+                conditions.add(v)
+            elif k == 'Fn::FindInMap' and is_literal(v[0]):
+                mappings.add(v[0])
+            collect_references(v, refs, conditions, mappings)
+
+
+def prune_template(template):
+    """
+    Drop the conditions, mappings and parameters nothing in the resources and
+    outputs refers to, directly or through the conditions they use. A template
+    of some of the stack parts then only asks for the parameters those use.
+    `template` is modified in place and returned.
+    """
+    conditions = template.get('Conditions', {})
+    refs = set()
+    used_conditions = set()
+    used_mappings = set()
+    for section in ('Resources', 'Outputs'):
+        collect_references(template.get(section, {}), refs, used_conditions, used_mappings)
+    pending = list(used_conditions)
+    while pending:
+        name = pending.pop()
+        if name in conditions:
+            before = set(used_conditions)
+            collect_references(conditions[name], refs, used_conditions, used_mappings)
+            pending.extend(used_conditions - before)
+
+    for section, used in (('Conditions', used_conditions), ('Mappings', used_mappings), ('Parameters', refs)):
+        entries = template.get(section, {})
+        for name in list(entries):
+            if name not in used:
+                del entries[name]
+        if section in template and not template[section]:
+            del template[section]
+    return template
+
+
+def fold_template(template, values):
+    """
+    Partially evaluate a template dict (as produced by Template.to_dict()) for
+    parameter values that are already known at generation time.
+
+    Refs to those parameters become literals, and every Fn::FindInMap, Fn::Equals,
+    Fn::If, Fn::And/Or/Not and Fn::Join that only depends on literals is resolved.
+    Afterwards the conditions, mappings and parameters nothing refers to any more
+    are dropped(see prune_template()). `template` is modified in place and returned.
+    """
+    parameters = template.get('Parameters', {})
+    values = dict((k, v) for k, v in values.items() if v is not None and k in parameters)
+    if not values:
+        return template
+
+    mappings = template.get('Mappings', {})
+    conditions = template.get('Conditions', {})
+    known = {}
+
+    def condition_value(name):
+        # True/False, or None when it depends on something only known at deploy time
+        if name not in known:
+            known[name] = None
+            folded = fold(conditions[name])
+            conditions[name] = folded
+            if isinstance(folded, bool):
+                known[name] = folded
+        return known[name]
+
+    def fold(value):
+        if isinstance(value, list):
+            return [v for v in (fold(v) for v in value) if v != NO_VALUE]
+        if not isinstance(value, dict):
+            return value
+        if len(value) != 1:
+            folded = dict((k, fold(v)) for k, v in value.items())
+            return dict((k, v) for k, v in folded.items() if v != NO_VALUE)
+
+        fn, args = list(value.items())[0]
+        if fn == 'Ref':
+            return values.get(args, value)
+        if fn == 'Condition' and is_literal(args):
+            c = condition_value(args)
+            return value if c is None else c
+        if fn == 'Fn::If':
+            c = condition_value(args[0])
+            if c is not None:
+                return fold(args[1] if c else args[2])
+            return {fn: [args[0], fold(args[1]), fold(args[2])]}
+
+        args = fold(args)
+        if fn == 'Fn::FindInMap' and all(is_literal(a) for a in args):
+            return mappings[args[0]][str(args[1])][str(args[2])]
+        if fn == 'Fn::Equals' and all(is_literal(a) for a in args):
+            return str(args[0]) == str(args[1])
+        if fn == 'Fn::Not' and isinstance(args[0], bool):
+            return not args[0]
+        if fn in ('Fn::And', 'Fn::Or'):
+            # True is the identity of And and False the identity of Or
+            identity = fn == 'Fn::And'
+            if (not identity) in args:
+                return not identity
+            args = [a for a in args if a is not identity]
+            if not args:
+                return identity
+            if len(args) == 1:
+                return args[0]
+        if fn == 'Fn::Join' and is_literal(args[0]) and isinstance(args[1], list) \
+                and all(is_literal(a) for a in args[1]):
+            return args[0].join(str(a) for a in args[1])
+        return {fn: args}
+
+    # resources and outputs whose own condition is now known
+    removed = set()
+    for section in ('Resources', 'Outputs'):
+        for name, body in list(template.get(section, {}).items()):
+            if 'Condition' not in body:
+                continue
+            c = condition_value(body['Condition'])
+            if c is False:
+                del template[section][name]
+                removed.add(name)
+            elif c is True:
+                del body['Condition']
+
+    for section in ('Resources', 'Outputs'):
+        for name, body in template.get(section, {}).items():
+            body = fold(body)
+            depends_on = body.get('DependsOn')
+            if isinstance(depends_on, list):
+                body['DependsOn'] = [d for d in depends_on if d not in removed]
+                if not body['DependsOn']:
+                    del body['DependsOn']
+            elif depends_on in removed:
+                del body['DependsOn']
+            template[section][name] = body
+    for name in list(conditions):
+        condition_value(name)
+
+    # the known conditions are folded into everything that used them
+    for name in list(conditions):
+        if known.get(name) is not None:
+            del conditions[name]
+    # and so may have been the only references to some parameters
+    return prune_template(template)
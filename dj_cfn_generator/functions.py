@@ -0,0 +1,42 @@
+from troposphere import GetAtt
+from troposphere.awslambda import Function, Code
+from troposphere.iam import Role
+from awacs.aws import Allow, Statement, Principal, Policy
+from awacs.sts import AssumeRole
+
+# The Lambda functions behind the template's custom resources, for what
+# CloudFormation can't work out itself. Their code is inline(ZipFile), which
+# gets the cfnresponse module to answer CloudFormation with.
+
+
+def function_role(title, **kwargs):
+    # A role a function can log with; kwargs are more Role properties
+    return Role(
+        title,
+        AssumeRolePolicyDocument=Policy(
+            Statement=[
+                Statement(
+                    Effect=Allow,
+                    Action=[AssumeRole],
+                    Principal=Principal("Service", ["lambda.amazonaws.com"])
+                )
+            ]
+        ),
+        ManagedPolicyArns=["arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole"],
+        **kwargs
+    )
+
+
+def inline_function(title, description, role, code, **kwargs):
+    # A python function running `code`'s handler() as `role`; kwargs are more
+    # Function properties
+    return Function(
+        title,
+        Description=description,
+        Handler="index.handler",
+        Runtime="python3.12",
+        Timeout=30,
+        Role=GetAtt(role, 'Arn'),
+        Code=Code(ZipFile=code),
+        **kwargs
+    )
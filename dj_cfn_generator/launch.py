@@ -0,0 +1,190 @@
+from troposphere import AWSObject, AWSProperty, Ref, GetAtt, If
+from troposphere.cloudformation import AWSCustomObject
+from troposphere.validators import boolean, integer
+from troposphere.autoscaling import LaunchTemplateSpecification, LifecycleHookSpecification
+from troposphere.ec2 import LaunchTemplate, LaunchTemplateData, LaunchTemplateBlockDeviceMapping, EBSBlockDevice, \
+    IamInstanceProfile, Monitoring
+from troposphere.iam import Policy as IAMPolicy
+from awacs.aws import Action, Allow, Statement, Policy
+from .functions import function_role, inline_function
+
+
+# Looks up the RootDeviceName of ImageId, for the Custom::RootDevice resources
+# of the launch templates. AMIs name their root device differently(/dev/sda1,
+# /dev/xvda), and mapping another one adds a second volume.
+ROOT_DEVICE_CODE = """\
+import boto3
+import cfnresponse
+
+
+def handler(event, context):
+    data = {}
+    try:
+        if event['RequestType'] != 'Delete':
+            image_id = event['ResourceProperties']['ImageId']
+            image = boto3.client('ec2').describe_images(ImageIds=[image_id])['Images'][0]
+            data['DeviceName'] = image['RootDeviceName']
+        cfnresponse.send(event, context, cfnresponse.SUCCESS, data, event.get('PhysicalResourceId'))
+    except Exception:
+        cfnresponse.send(event, context, cfnresponse.FAILED, data, event.get('PhysicalResourceId'))
+"""
+
+# the lifecycle hook an instance of a group with a warm pool completes once its
+# user data ran
+LAUNCH_HOOK = 'instance-ready'
+
+
+class InstanceReusePolicy(AWSProperty):
+    props = {
+        'ReuseOnScaleIn': (boolean, False),
+    }
+
+
+class WarmPool(AWSObject):
+    # AWS::AutoScaling::WarmPool, which troposphere doesn't know about yet
+    resource_type = "AWS::AutoScaling::WarmPool"
+
+    props = {
+        'AutoScalingGroupName': (str, True),
+        'InstanceReusePolicy': (InstanceReusePolicy, False),
+        'MaxGroupPreparedCapacity': (integer, False),
+        'MinSize': (integer, False),
+        'PoolState': (str, False),
+    }
+
+
+class RootDevice(AWSCustomObject):
+    # The root device name of ImageId, as its DeviceName attribute(see
+    # root_device_function())
+    resource_type = "Custom::RootDevice"
+
+    props = {
+        'ServiceToken': (str, True),
+        'ImageId': (str, True),
+    }
+
+
+def root_device_function(t):
+    # The function the RootDevice resources(see root_device()) call, for the
+    # parts building launch templates
+    role = t.add_resource(function_role(
+        "RootDeviceFunctionRole",
+        Policies=[IAMPolicy(
+            PolicyName="DescribeImages",
+            PolicyDocument=Policy(
+                Statement=[
+                    Statement(
+                        Effect=Allow,
+                        Action=[Action("ec2", "DescribeImages")],
+                        Resource=["*"]
+                    )
+                ]
+            )
+        )]
+    ))
+    return t.add_resource(inline_function(
+        "RootDeviceFunction",
+        "Looks up the root device name of an AMI",
+        role,
+        ROOT_DEVICE_CODE
+    ))
+
+
+def root_device(title, r, image):
+    return RootDevice(
+        title,
+        ServiceToken=GetAtt(r['root_device_function'], 'Arn'),
+        ImageId=image,
+    )
+
+
+def launch_template(title, r, image, device, instance_type, security_group, user_data, volume_size,
+                    instance_profile=None, ebs_optimized=None):
+    # A launch template for one tier, with a gp3 root volume of `volume_size` GB
+    # (gp3 has a 3000 IOPS baseline whatever its size, without burst credits) on
+    # the root device of `image`, which `device`(see root_device()) looked up
+    data = LaunchTemplateData(
+        ImageId=image,
+        InstanceType=instance_type,
+        SecurityGroupIds=[GetAtt(security_group, 'GroupId')],
+        UserData=user_data,
+        Monitoring=Monitoring(Enabled=If("IsStaging", "false", "true")),
+        KeyName=Ref(r['aws_keypair']),
+        BlockDeviceMappings=[
+            LaunchTemplateBlockDeviceMapping(
+                DeviceName=GetAtt(device, 'DeviceName'),
+                Ebs=EBSBlockDevice(
+                    VolumeType="gp3",
+                    VolumeSize=volume_size,
+                    DeleteOnTermination=True,
+                )
+            )
+        ],
+    )
+    if instance_profile is not None:
+        data.IamInstanceProfile = IamInstanceProfile(Arn=GetAtt(instance_profile, 'Arn'))
+    if ebs_optimized is not None:
+        data.EbsOptimized = ebs_optimized
+    return LaunchTemplate(title, LaunchTemplateData=data)
+
+
+def launch_template_specification(template):
+    return LaunchTemplateSpecification(
+        LaunchTemplateId=Ref(template),
+        Version=GetAtt(template, 'LatestVersionNumber')
+    )
+
+
+def warm_pool_tiers(settings):
+    # The tiers of settings['warm_pools'] that get a warm pool: spot instances
+    # can't be in one
+    return [tier for tier in settings['warm_pools'] if not (tier == 'judge' and settings['judge_spot'])]
+
+
+def launch_hook(boot_minutes):
+    # The lifecycle hook of a group with a warm pool. A new instance waits(up
+    # to boot_minutes) until its user data completes the hook(see
+    # complete_launch_hook()), so the pool only stops instances that are set up,
+    # and the group only puts those in service.
+    return LifecycleHookSpecification(
+        LifecycleHookName=LAUNCH_HOOK,
+        LifecycleTransition="autoscaling:EC2_INSTANCE_LAUNCHING",
+        HeartbeatTimeout=boot_minutes * 60,
+        DefaultResult="ABANDON",
+    )
+
+
+def complete_launch_hook():
+    # User data completing launch_hook(): now, and at every later boot, as an
+    # instance started from the warm pool goes through the hook again but
+    # doesn't run its user data again. The group's name comes from the
+    # instance, as the launch template can't refer to the group.
+    return ["""cat >/var/lib/cloud/scripts/per-boot/complete-launch-hook <<'HOOK'
+#!/bin/bash
+INSTANCE_ID=$(curl -s http://169.254.169.254/latest/meta-data/instance-id)
+GROUP=$(aws autoscaling describe-auto-scaling-instances --region """, Ref("AWS::Region"),
+            """ --instance-ids $INSTANCE_ID --query 'AutoScalingInstances[0].AutoScalingGroupName' --output text)
+aws autoscaling complete-lifecycle-action --region """, Ref("AWS::Region"),
+            " --auto-scaling-group-name $GROUP --lifecycle-hook-name " + LAUNCH_HOOK +
+            """ --instance-id $INSTANCE_ID --lifecycle-action-result CONTINUE
+HOOK
+chmod +x /var/lib/cloud/scripts/per-boot/complete-launch-hook
+# tell the group this instance is set up
+/var/lib/cloud/scripts/per-boot/complete-launch-hook
+"""]
+
+
+def warm_pool(title, r, asg):
+    # Stopped instances that already ran their user data(the group needs
+    # launch_hook() for that), which the group starts instead of booting new
+    # ones when it scales out, and stops again when it scales in. By default
+    # the pool holds as many as the group's MaxSize leaves room for. Only
+    # production stacks get one.
+    return WarmPool(
+        title,
+        Condition=r['is_producton'],
+        AutoScalingGroupName=Ref(asg),
+        PoolState="Stopped",
+        MinSize=0,
+        InstanceReusePolicy=InstanceReusePolicy(ReuseOnScaleIn=True),
+    )
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+from multiprocessing import Pool
+
+from . import __version__, CONTEST_SIZES, ENVIRONMENT_TYPES
+
+MANIFEST_NAME = 'index.json'
+
+
+def variants():
+    return [(size, env) for size in CONTEST_SIZES for env in ENVIRONMENT_TYPES]
+
+
+def variant_filename(contestsize, envtype):
+    return 'cloudformation-{}-{}.json'.format(contestsize, envtype)
+
+
+def render_variant(job):
+    # Runs in a pool worker, so it only gets plain (picklable) arguments
+    options, cache_dir = job
+    if cache_dir is None:
+        from . import generate_json
+        return generate_json(**options)
+
+    from .cache import RenderCache, cached_generate_json
+    return cached_generate_json(RenderCache(cache_dir), **options)
+
+
+def render_matrix(outdir, processes=None, cache_dir=None, **options):
+    # Render one specialized template per ContestSize x EnvironmentType into
+    # `outdir` across a process pool, and describe them in outdir/index.json.
+    # `options` are passed on to generate_json() for every variant.
+    jobs = []
+    for contestsize, envtype in variants():
+        variant_options = dict(options, contestsize=contestsize, envtype=envtype)
+        jobs.append((variant_options, cache_dir))
+
+    pool = Pool(processes)
+    try:
+        templates = pool.map(render_variant, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    try:
+        os.makedirs(outdir)
+    except OSError:
+        if not os.path.isdir(outdir):
+            raise
+
+    manifest = {
+        'version': __version__,
+        'options': options,
+        'variants': [],
+    }
+    for (contestsize, envtype), data in zip(variants(), templates):
+        filename = variant_filename(contestsize, envtype)
+        # the size the template limits apply to
+        body = data.encode('utf-8')
+        with open(os.path.join(outdir, filename), 'wb') as f:
+            f.write(body)
+        manifest['variants'].append({
+            'ContestSize': contestsize,
+            'EnvironmentType': envtype,
+            'file': filename,
+            'bytes': len(body),
+            'sha256': hashlib.sha256(body).hexdigest(),
+        })
+
+    # written last, so a manifest only ever lists complete templates
+    with open(os.path.join(outdir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True, separators=(',', ': '))
+
+    return manifest
@@ -0,0 +1,56 @@
+import json
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:    # python 2
+    tracemalloc = None
+
+COUNTED = ['Resources', 'Outputs', 'Parameters', 'Conditions', 'Mappings']
+
+
+def measure(func, *args):
+    # Returns (wall time in seconds, bytes allocated and still held afterwards)
+    # of func(*args). The allocation figure is None without tracemalloc.
+    if tracemalloc is None:
+        start = timeit.default_timer()
+        func(*args)
+        return timeit.default_timer() - start, None
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        start = timeit.default_timer()
+        func(*args)
+        seconds = timeit.default_timer() - start
+        allocated = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        if started:
+            tracemalloc.stop()
+    return seconds, allocated
+
+
+def format_profile(profile, fmt='table'):
+    if fmt == 'json':
+        return json.dumps(profile, indent=4, sort_keys=True, separators=(',', ': '))
+
+    columns = ['seconds', 'allocated'] + [c.lower() for c in COUNTED] + ['bytes']
+    header = "{:<16} {:>9} {:>10} {:>10} {:>8} {:>11} {:>11} {:>9} {:>8}".format(
+        "Stack part", "ms", "alloc KB", "resources", "outputs", "parameters", "conditions", "mappings", "bytes")
+    lines = [header]
+    totals = dict((c, 0) for c in columns)
+    for record in profile:
+        for c in columns:
+            totals[c] += record[c] or 0
+        lines.append(format_row(record['part'], record))
+    lines.append(format_row('total', totals))
+    return "\n".join(lines)
+
+
+def format_row(name, record):
+    allocated = '-' if record['allocated'] is None else record['allocated'] // 1024
+    return "{:<16} {:>9.2f} {:>10} {:>10} {:>8} {:>11} {:>11} {:>9} {:>8}".format(
+        name, record['seconds'] * 1000, allocated, record['resources'], record['outputs'],
+        record['parameters'], record['conditions'], record['mappings'], record['bytes'])
@@ -0,0 +1,110 @@
+import gzip
+import hashlib
+import io
+import shutil
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+LATEST_KEY = 'latest'
+DEFAULT_WORKERS = 8
+# bytes hashed at a time, so a template is never read into memory whole
+CHUNK_SIZE = 64 * 1024
+
+
+def as_file(body):
+    # Bodies are seekable binary files; bytes are wrapped into one
+    if isinstance(body, bytes):
+        return io.BytesIO(body)
+    return body
+
+
+def file_digest(fp, algorithm):
+    # The hex digest of everything in fp, which is left at the start
+    h = hashlib.new(algorithm)
+    fp.seek(0)
+    for chunk in iter(lambda: fp.read(CHUNK_SIZE), b''):
+        h.update(chunk)
+    fp.seek(0)
+    return h.hexdigest()
+
+
+def template_key(body):
+    # Templates are stored under a hash of their content, so republishing an
+    # identical template maps onto the object that is already there
+    return 'cloudformation-{}.json'.format(file_digest(as_file(body), 'sha256')[:16])
+
+
+def gzip_body(body):
+    # A temporary file holding body gzipped. mtime=0 keeps the output (and so
+    # its ETag) the same for the same template.
+    out = tempfile.TemporaryFile()
+    body = as_file(body)
+    body.seek(0)
+    with gzip.GzipFile(fileobj=out, mode='wb', mtime=0) as f:
+        shutil.copyfileobj(body, f, CHUNK_SIZE)
+    out.seek(0)
+    return out
+
+
+def object_etag(client, bucket, key):
+    from botocore.exceptions import ClientError
+    try:
+        response = client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    return response['ETag'].strip('"')
+
+
+def put_if_changed(client, bucket, key, body, content_type, gzipped=False):
+    # Upload body(bytes or a seekable binary file, streamed from) unless the
+    # object already holds exactly these bytes. For a single part upload the
+    # ETag is the MD5 of the stored bytes.
+    extra = {}
+    body = as_file(body)
+    if gzipped:
+        body = gzip_body(body)
+        extra['ContentEncoding'] = 'gzip'
+
+    try:
+        if object_etag(client, bucket, key) == file_digest(body, 'md5'):
+            return False
+        client.put_object(Bucket=bucket, Key=key, Body=body, ContentType=content_type, **extra)
+        return True
+    finally:
+        if gzipped:
+            body.close()
+
+
+def publish_template(client, bucket, body, pointer=LATEST_KEY, gzipped=False):
+    # Store the template(bytes or a seekable binary file) under its content
+    # hash and point `pointer` at it. Returns (template key, whether anything
+    # was uploaded).
+    key = template_key(body)
+    uploaded = put_if_changed(client, bucket, key, body, 'application/json', gzipped)
+    # the pointer is written after the template, so it never names a missing object
+    if put_if_changed(client, bucket, pointer, key.encode('utf-8'), 'text/plain'):
+        uploaded = True
+    return key, uploaded
+
+
+def publish_templates(client, bucket, templates, gzipped=False, workers=DEFAULT_WORKERS):
+    # Publish several templates at once; `templates` is a list of (pointer, body).
+    # boto3 clients are thread safe, so the uploads share one client.
+    pool = ThreadPool(max(1, min(workers, len(templates))))
+    try:
+        return pool.map(lambda job: publish_template(client, bucket, job[1], job[0], gzipped), templates)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def fetch_template(client, bucket, pointer=LATEST_KEY):
+    # The template body `pointer` names, as published by publish_template()
+    key = client.get_object(Bucket=bucket, Key=pointer)['Body'].read().decode('utf-8').strip()
+    response = client.get_object(Bucket=bucket, Key=key)
+    body = response['Body'].read()
+    if response.get('ContentEncoding') == 'gzip':
+        body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+    return key, body
@@ -0,0 +1,67 @@
+import math
+import re
+
+DURATION_RE = re.compile(r'^PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?$')
+
+
+def parse_duration(value):
+    # ISO8601 durations as used by PauseTime and ResourceSignal timeouts(PT5M)
+    m = DURATION_RE.match(str(value))
+    if not m or not any(m.groups()):
+        raise ValueError('Invalid duration "{}"'.format(value))
+    hours, minutes, seconds = (int(g or 0) for g in m.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    if minutes >= 60:
+        return '{}h{:02d}m'.format(minutes // 60, minutes % 60)
+    if seconds:
+        return '{}m{:02d}s'.format(minutes, seconds)
+    return '{}m'.format(minutes)
+
+
+def estimate_rollout(asg, instances, desired=None):
+    # How replacing the instances of the AutoScalingGroup resource `asg`(a
+    # template dict) with `instances` running plays out. Returns a dict with the
+    # strategy, number of batches, the worst case duration in seconds and the
+    # lowest number of instances in service while it runs. `desired` is the
+    # DesiredCapacity of the template, which a replacement group starts with
+    # however far the old one scaled out(default: `instances`).
+    update_policy = asg.get('UpdatePolicy', {})
+    creation_policy = asg.get('CreationPolicy', {})
+
+    if update_policy.get('AutoScalingReplacingUpdate', {}).get('WillReplace') in (True, 'true', 'True'):
+        # a whole new group is created next to the old one, which keeps serving
+        timeout = creation_policy.get('ResourceSignal', {}).get('Timeout', 'PT5M')
+        return {
+            'strategy': 'replace',
+            'batches': 1,
+            'seconds': parse_duration(timeout),
+            'min_in_service': instances if desired is None else min(instances, desired),
+        }
+
+    rolling = update_policy.get('AutoScalingRollingUpdate')
+    if rolling is None:
+        # instances keep the old launch configuration until they are replaced
+        # some other way
+        return {
+            'strategy': 'none',
+            'batches': 0,
+            'seconds': 0,
+            'min_in_service': instances,
+        }
+
+    batch_size = int(rolling.get('MaxBatchSize', 1))
+    min_in_service = int(rolling.get('MinInstancesInService', 0))
+    pause = parse_duration(rolling.get('PauseTime', 'PT0S'))
+    # batches are capped so at least MinInstancesInService keep running
+    batch_size = max(1, min(batch_size, instances - min_in_service))
+    batches = int(math.ceil(float(instances) / batch_size)) if instances else 0
+    return {
+        'strategy': 'rolling',
+        'batches': batches,
+        'seconds': batches * pause,
+        'min_in_service': max(0, min(min_in_service, instances - batch_size)),
+    }
@@ -0,0 +1,247 @@
+from troposphere import Ref, If, GetAtt, Join
+from troposphere.cloudformation import AWSCustomObject
+from troposphere.autoscaling import ScalingPolicy, ScheduledAction, TargetTrackingConfiguration, StepAdjustments, \
+    PredefinedMetricSpecification
+from troposphere.cloudwatch import Alarm, MetricDataQuery, MetricStat, Metric
+from troposphere.cloudwatch import MetricDimension as cwMetricDimension
+
+from . import WEB_SCALING_METRICS
+
+# Steps of the latency policy: (seconds over the latency target, percent more
+# webservers), the last one for anything beyond
+LATENCY_STEPS = [(0.25, 25), (0.5, 50), (None, 100)]
+
+
+def target_tracking_policy(title, asg, target, warmup, predefined=None, condition=None):
+    # A policy that keeps the metric of `asg` around `target`, adding or removing
+    # as many instances as that takes at once
+    extra = {}
+    if condition is not None:
+        extra['Condition'] = condition
+    return ScalingPolicy(
+        title,
+        AutoScalingGroupName=Ref(asg),
+        PolicyType='TargetTrackingScaling',
+        EstimatedInstanceWarmup=warmup,
+        TargetTrackingConfiguration=TargetTrackingConfiguration(
+            PredefinedMetricSpecification=predefined,
+            TargetValue=target
+        ),
+        **extra
+    )
+
+
+def latency_steps():
+    adjustments = []
+    lower = 0
+    for upper, percent in LATENCY_STEPS:
+        step = StepAdjustments(MetricIntervalLowerBound=lower, ScalingAdjustment=percent)
+        if upper is not None:
+            step.MetricIntervalUpperBound = upper
+        adjustments.append(step)
+        lower = upper
+    return adjustments
+
+
+def web_scaling_policies(r, metrics, sizes):
+    """
+    Scaling policies for the web tier, one per metric in `metrics`:
+
+    latency: a step policy adding webservers while the average load balancer
+    latency(response time of the targets behind an ALB) is over the target.
+    Latency doesn't fall in proportion to the webservers added the way
+    utilization does, so it isn't tracked and never scales in; combine it with
+    cpu or requests.
+    cpu: target tracking of the average CPU utilization of the group
+    requests: target tracking of the requests per webserver, only behind an ALB
+
+    `sizes(key)` returns the per contest size value of a SizeMap key. When the
+    group has several policies, it scales out as soon as one of them asks for it
+    and only scales in when all the target tracking ones agree, so cpu also
+    covers for a latency metric that isn't reported(e.g. while the ELB sees no
+    traffic).
+
+    Staging groups have a fixed size, so everything returned(the policies and
+    the alarm of the latency one) only exists in production.
+    """
+    targetgroup = r.get('webserver_targetgroup')
+    policies = []
+    for metric in metrics:
+        if metric == 'latency':
+            policy = ScalingPolicy(
+                "WebserverLatencyScalingPolicy",
+                Condition="IsProduction",
+                AutoScalingGroupName=Ref(r['webserver_asg']),
+                PolicyType="StepScaling",
+                AdjustmentType="PercentChangeInCapacity",
+                MinAdjustmentMagnitude=1,
+                EstimatedInstanceWarmup=sizes('WebScalingWarmup'),
+                MetricAggregationType="Average",
+                StepAdjustments=latency_steps()
+            )
+            if targetgroup is not None:
+                namespace, metric_name = "AWS/ApplicationELB", "TargetResponseTime"
+                dimension = cwMetricDimension(Name="LoadBalancer",
+                                              Value=GetAtt(r['webserver_elb'], 'LoadBalancerFullName'))
+            else:
+                namespace, metric_name = "AWS/ELB", "Latency"
+                dimension = cwMetricDimension(Name="LoadBalancerName", Value=Ref(r['webserver_elb']))
+            policies += [policy, Alarm(
+                "WebserverLatencyScalingAlarm",
+                Condition="IsProduction",
+                AlarmDescription=Join("", [Ref('AWS::StackName'), " Scale Out Webservers"]),
+                Namespace=namespace,
+                MetricName=metric_name,
+                Dimensions=[dimension],
+                Statistic="Average",
+                Period="60",
+                EvaluationPeriods="2",
+                Threshold=sizes('WebLatencyTarget'),    # over the target for 2 minutes
+                ComparisonOperator="GreaterThanThreshold",
+                AlarmActions=[Ref(policy)],
+                InsufficientDataActions=[]
+            )]
+        elif metric == 'cpu':
+            policies.append(target_tracking_policy(
+                "WebserverCPUScalingPolicy",
+                r['webserver_asg'],
+                sizes('WebCPUTarget'),
+                sizes('WebScalingWarmup'),
+                predefined=PredefinedMetricSpecification(
+                    PredefinedMetricType='ASGAverageCPUUtilization'
+                ),
+                condition="IsProduction",
+            ))
+        elif metric == 'requests' and targetgroup is not None:
+            policies.append(target_tracking_policy(
+                "WebserverRequestsScalingPolicy",
+                r['webserver_asg'],
+                sizes('WebRequestsTarget'),
+                sizes('WebScalingWarmup'),
+                predefined=PredefinedMetricSpecification(
+                    PredefinedMetricType='ALBRequestCountPerTarget',
+                    ResourceLabel=Join("/", [GetAtt(r['webserver_elb'], 'LoadBalancerFullName'),
+                                             GetAtt(targetgroup, 'TargetGroupFullName')]),
+                ),
+                condition="IsProduction",
+            ))
+        elif metric == 'requests':
+            raise ValueError('Scaling on requests needs an Application Load Balancer')
+        else:
+            raise ValueError('Unknown web scaling metric "{}" (choose from {})'.format(
+                metric, ', '.join(WEB_SCALING_METRICS)))
+    return policies
+
+
+def backlog_per_instance(asg, namespace, metric_name, period):
+    # Metric math for an alarm on the value of a queue metric divided by the
+    # instances in service of `asg`(the whole queue while it has none). The group
+    # has to collect GroupInServiceInstances for this.
+    return [
+        MetricDataQuery(
+            Id='queue',
+            MetricStat=MetricStat(
+                Metric=Metric(Namespace=namespace, MetricName=metric_name),
+                Period=period,
+                Stat='Average',
+            ),
+            ReturnData=False,
+        ),
+        MetricDataQuery(
+            Id='instances',
+            MetricStat=MetricStat(
+                Metric=Metric(
+                    Namespace='AWS/AutoScaling',
+                    MetricName='GroupInServiceInstances',
+                    Dimensions=[cwMetricDimension(Name='AutoScalingGroupName', Value=Ref(asg))],
+                ),
+                Period=period,
+                Stat='Average',
+            ),
+            ReturnData=False,
+        ),
+        MetricDataQuery(
+            Id='backlog',
+            Expression='IF(instances > 0, queue / instances, queue)',
+            Label='Backlog per instance',
+            ReturnData=True,
+        ),
+    ]
+
+
+def proportional_steps(target, steps=4):
+    # Step adjustments for an alarm on the backlog per instance with `target` as
+    # its threshold. A backlog of k+1 times the target needs k times as many
+    # instances again, so every step adds another 100%, rounding up.
+    adjustments = []
+    for k in range(1, steps + 1):
+        step = StepAdjustments(
+            MetricIntervalLowerBound=(k - 1) * target,
+            ScalingAdjustment=k * 100,
+        )
+        if k < steps:
+            step.MetricIntervalUpperBound = k * target
+        adjustments.append(step)
+    return adjustments
+
+
+class PrewarmTime(AWSCustomObject):
+    # The time LeadMinutes before StartTime, as its Time attribute(see
+    # PrewarmTimeFunction in the parameters part)
+    resource_type = "Custom::PrewarmTime"
+
+    props = {
+        'ServiceToken': (str, True),
+        'StartTime': (str, True),
+        'LeadMinutes': (int, True),
+    }
+
+
+def prewarm_time(title, r, lead_minutes):
+    # When a tier that takes lead_minutes to boot scales up for the contest
+    # start: ContestPrewarmTime, or lead_minutes before ContestStartTime when
+    # that is empty. Returns the resource computing the latter and the time.
+    resource = PrewarmTime(
+        title,
+        Condition=r['is_prewarm_defaulted'],
+        ServiceToken=GetAtt(r['prewarm_time_function'], 'Arn'),
+        StartTime=Ref(r['contest_start_time']),
+        LeadMinutes=lead_minutes,
+    )
+    return resource, If(r['has_prewarm_time'], Ref(r['contest_prewarm_time']), GetAtt(resource, 'Time'))
+
+
+def contest_schedule(title, r, asg, peak, normal, prewarm):
+    # Scheduled actions for the contest schedule parameters: the minimum size of
+    # `asg` is raised to `peak` instances at `prewarm`(see prewarm_time()) and
+    # again at the freeze(the last hour brings the most submissions and
+    # scoreboard reloads, while reactive scaling may have shrunk the group
+    # during the quieter middle), so scaling in can't take the group below it
+    # during the contest. When the contest ends the minimum goes back to
+    # `normal`, and the scaling policies remove what isn't needed any more.
+    return [
+        ScheduledAction(
+            title + "PrewarmAction",
+            Condition=r['is_prewarm_scheduled'],
+            AutoScalingGroupName=Ref(asg),
+            MinSize=peak,
+            DesiredCapacity=peak,
+            StartTime=prewarm,
+        ),
+        ScheduledAction(
+            title + "FreezeAction",
+            Condition=r['is_freeze_scheduled'],
+            AutoScalingGroupName=Ref(asg),
+            MinSize=peak,
+            DesiredCapacity=peak,
+            StartTime=Ref(r['contest_freeze_time']),
+        ),
+        ScheduledAction(
+            title + "EndAction",
+            Condition=r['is_end_scheduled'],
+            AutoScalingGroupName=Ref(asg),
+            MinSize=normal,
+            DesiredCapacity=normal,
+            StartTime=Ref(r['contest_end_time']),
+        ),
+    ]
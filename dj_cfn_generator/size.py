@@ -0,0 +1,86 @@
+import json
+
+# CloudFormation template body limits
+INLINE_LIMIT = 51200          # TemplateBody passed directly in the API call
+S3_LIMIT = 1024 * 1024        # TemplateURL pointing at S3
+# and on the number of entries per section
+SECTION_LIMITS = {
+    'Parameters': 200,
+    'Mappings': 200,
+    'Resources': 500,
+    'Outputs': 200,
+}
+
+SECTIONS = ['Parameters', 'Conditions', 'Mappings', 'Resources', 'Outputs']
+GENERATOR = '(generator)'
+
+
+def encoded_size(value, compact=True):
+    if compact:
+        data = json.dumps(value, sort_keys=True, separators=(',', ':'))
+    else:
+        data = json.dumps(value, indent=4, sort_keys=True, separators=(',', ': '))
+    return len(data.encode('utf-8'))
+
+
+def limit_errors(template, total):
+    # What keeps `template`(`total` bytes) from being created at all
+    errors = []
+    if total > S3_LIMIT:
+        errors.append("Template is {} bytes, over the {} byte limit for templates in S3".format(total, S3_LIMIT))
+    for section, limit in sorted(SECTION_LIMITS.items()):
+        count = len(template.get(section, {}))
+        if count > limit:
+            errors.append("Template has {} {}, over the limit of {}".format(count, section, limit))
+    return errors
+
+
+def size_report(template, owners, compact=False):
+    # Where the bytes of `template` go, per entry and per stack part. Entries are
+    # measured in compact form, the total in the form that is actually written.
+    # owners is the {section: {logical id: part}} map from build_template().
+    entries = []
+    parts = {}
+    for section in SECTIONS:
+        for name, body in template.get(section, {}).items():
+            # the size of `"name":body,` as it appears inside the section
+            size = encoded_size({name: body}) - 1
+            part = owners.get(section, {}).get(name, GENERATOR)
+            entries.append({'section': section, 'name': name, 'part': part, 'bytes': size})
+            parts[part] = parts.get(part, 0) + size
+    entries.sort(key=lambda e: e['bytes'], reverse=True)
+
+    total = encoded_size(template, compact)
+    warnings = limit_errors(template, total)
+    if INLINE_LIMIT < total <= S3_LIMIT:
+        warnings.append("Template is {} bytes, over the {} byte limit for inline templates"
+                        "(it can only be used from S3)".format(total, INLINE_LIMIT))
+
+    return {
+        'bytes': total,
+        'compact': compact,
+        'inline_limit': INLINE_LIMIT,
+        's3_limit': S3_LIMIT,
+        'entries': entries,
+        'parts': sorted(parts.items(), key=lambda p: p[1], reverse=True),
+        'warnings': warnings,
+    }
+
+
+def format_size_report(report):
+    lines = []
+    lines.append("Template size: {} bytes({}), {:.0%} of the inline limit, {:.0%} of the S3 limit".format(
+        report['bytes'], 'compact' if report['compact'] else 'pretty printed',
+        float(report['bytes']) / report['inline_limit'], float(report['bytes']) / report['s3_limit']))
+    lines.append("")
+    lines.append("{:<20} {:>8}".format("Stack part", "Bytes"))
+    for part, size in report['parts']:
+        lines.append("{:<20} {:>8}".format(part, size))
+    lines.append("")
+    lines.append("{:<40} {:<12} {:<16} {:>8}".format("Entry", "Section", "Stack part", "Bytes"))
+    for e in report['entries']:
+        lines.append("{:<40} {:<12} {:<16} {:>8}".format(e['name'], e['section'], e['part'], e['bytes']))
+    for w in report['warnings']:
+        lines.append("")
+        lines.append("WARNING: " + w)
+    return "\n".join(lines)
@@ -0,0 +1,241 @@
+from collections import namedtuple
+from importlib import import_module
+
+
+Part = namedtuple('Part', ['name', 'provides', 'requires', 'optional', 'uses'])
+Part.__new__.__defaults__ = (False, ())
+
+# Every stack part, in default build order. Each part talks to the
+# others through the shared `r` dict, so it declares the keys it adds to `r`
+# (provides) and the keys it reads from `r` (requires). resolve() uses this to
+# work out which parts a partial build needs, and build() checks init() reads
+# and writes nothing else.
+# Optional parts are only built when asked for. Parts that use what an
+# optional part provides when it is there(r.get()) list those keys in `uses`,
+# and come after it in PARTS.
+#
+# The modules themselves are only imported once a build needs them.
+PARTS = [
+    Part('parameters',
+         provides=['envtype', 'is_staging', 'is_producton', 'contestsize', 'dynamodb_capacity',
+                   'has_dynamodb_capacity',
+                   's3_bucket', 's3_region', 's3_archive', 'web_ami', 'judgehost_ami',
+                   'judge_instance_type', 'enable_judgehosts', 'create_judgehosts',
+                   'db_name', 'db_user', 'db_pass', 'rds_maintenancewindow',
+                   'admin_pass', 'judgehost_pass', 'lb_vpc', 'lb_subnets', 'lb_certificate',
+                   'has_lb_certificate', 'aws_keypair'],
+         requires=['settings']),
+    Part('schedule',
+         provides=['contest_prewarm_time', 'contest_start_time', 'contest_freeze_time',
+                   'contest_end_time', 'has_prewarm_time', 'is_prewarm_scheduled',
+                   'is_freeze_scheduled', 'is_end_scheduled', 'is_prewarm_defaulted', 'prewarm_time_function'],
+         requires=['is_producton']),
+    Part('dynamodb',
+         provides=['sessiontable', 'sessiontable_readalarm', 'sessiontable_writealarm',
+                   'sessiontable_throttlealarm'],
+         requires=['settings', 'contestsize', 'dynamodb_capacity', 'has_dynamodb_capacity',
+                   'contest_prewarm_time', 'contest_start_time', 'contest_end_time', 'has_prewarm_time',
+                   'is_prewarm_scheduled', 'is_end_scheduled', 'notify_topic']),
+    Part('iam',
+         provides=['webserver_role', 'webserver_policy', 'webserver_instanceprofile',
+                   'judgehost_instanceprofile'],
+         requires=['settings', 'sessiontable', 's3_bucket']),
+    Part('securitygroups',
+         provides=['elb_securitygroup', 'webserver_securitygroup', 'rds_securitygroup',
+                   'judgehost_securitygroup'],
+         requires=[]),
+    Part('rds',
+         provides=['rds_provisioned_iops', 'rds_parametergroup', 'rds_database', 'rds_cpu_alarm',
+                   'rds_free_space_alarm', 'rds_read_latency_alarm', 'rds_write_latency_alarm',
+                   'rds_burst_balance_alarm', 'rds_queue_depth_alarm'],
+         requires=['is_staging', 'is_producton', 'contestsize', 'rds_securitygroup', 'db_name', 'db_user',
+                   'db_pass', 'rds_maintenancewindow', 'notify_topic']),
+    Part('rdsreplica',
+         provides=['rds_replicas', 'rds_read_endpoint', 'rds_replica_lag_alarms'],
+         requires=['is_producton', 'contestsize', 'rds_database', 'rds_parametergroup', 'rds_provisioned_iops',
+                   'rds_securitygroup', 'notify_topic'],
+         optional=True),
+    Part('elasticache',
+         provides=['cache_securitygroup', 'cache_cluster', 'cache_endpoint', 'cache_evictions_alarm',
+                   'cache_memory_alarm'],
+         requires=['settings', 'contestsize', 'webserver_securitygroup', 'notify_topic'],
+         optional=True),
+    Part('webserver',
+         provides=['webserver_elb', 'webserver_lc', 'webserver_asg', 'webserver_scaling_policies',
+                   'webserver_scheduled_actions', 'elb_healthy_hosts_alarm', 'elb_latency_alarm',
+                   'elb_5xx_error_alarm', 'webserver_targetgroup', 'webserver_warm_pool', 'root_device_function'],
+         requires=['settings', 'is_staging', 'is_producton', 'contestsize', 's3_bucket', 's3_archive',
+                   's3_region',
+                   'sessiontable', 'rds_database', 'db_name', 'db_user', 'db_pass',
+                   'judgehost_pass', 'admin_pass', 'web_ami', 'aws_keypair',
+                   'elb_securitygroup', 'webserver_securitygroup', 'lb_vpc', 'lb_subnets',
+                   'lb_certificate', 'has_lb_certificate', 'webserver_instanceprofile', 'contest_prewarm_time', 'contest_start_time',
+                   'contest_freeze_time', 'contest_end_time', 'has_prewarm_time',
+                   'is_prewarm_scheduled', 'is_freeze_scheduled', 'is_end_scheduled',
+                   'is_prewarm_defaulted', 'prewarm_time_function',
+                   'notify_topic'],
+         uses=['rds_read_endpoint', 'cache_endpoint']),
+    Part('judgehost',
+         provides=['judgehost_lc', 'judgehost_asg', 'judgehost_scheduled_actions',
+                   'judgehost_scaleout_policy',
+                   'judgehost_scalein_policy', 'judgehost_scaleout_alarm',
+                   'judgehost_scalein_alarm', 'judgehost_warm_pool'],
+         requires=['settings', 'is_staging', 'is_producton', 'contestsize', 'create_judgehosts',
+                   'judgehost_ami', 'root_device_function',
+                   'judge_instance_type', 'judgehost_pass', 'aws_keypair', 'judgehost_instanceprofile',
+                   'judgehost_securitygroup', 'contest_prewarm_time', 'contest_start_time',
+                   'contest_freeze_time', 'contest_end_time', 'has_prewarm_time',
+                   'is_prewarm_scheduled', 'is_freeze_scheduled', 'is_end_scheduled',
+                   'is_prewarm_defaulted', 'prewarm_time_function',
+                   'webserver_elb', 'webserver_asg']),
+    Part('cloudfront',
+         provides=['cloudfront_distribution', 'cloudfront_cache_hit_alarm', 'cloudfront_5xx_error_alarm'],
+         requires=['webserver_elb', 'notify_topic'],
+         optional=True),
+    Part('dashboard',
+         provides=['dashboard'],
+         requires=['webserver_asg', 'elb_latency_alarm', 'elb_5xx_error_alarm', 'elb_healthy_hosts_alarm',
+                   'judgehost_scaleout_alarm', 'rds_cpu_alarm', 'rds_read_latency_alarm',
+                   'rds_write_latency_alarm', 'rds_queue_depth_alarm', 'sessiontable_readalarm',
+                   'sessiontable_writealarm']),
+]
+
+PART_NAMES = [p.name for p in PARTS]
+DEFAULT_PART_NAMES = [p.name for p in PARTS if not p.optional]
+OPTIONAL_PART_NAMES = [p.name for p in PARTS if p.optional]
+
+# keys generate_json() puts in `r` before any part runs
+GENERATOR_KEYS = ['notify_topic', 'settings']
+
+
+def get_part(name):
+    for p in PARTS:
+        if p.name == name:
+            return p
+    raise ValueError('Unknown stack part "{}" (choose from {})'.format(name, ', '.join(PART_NAMES)))
+
+
+def import_part(name):
+    return import_module('.' + get_part(name).name, __name__)
+
+
+def resolve(names=None, available=GENERATOR_KEYS):
+    """
+    Return the parts needed to build `names` (default: every part that isn't
+    optional), dependencies included, in build order. Keys listed in `available`
+    are already in `r`.
+    """
+    if names is None:
+        names = DEFAULT_PART_NAMES
+
+    providers = {}
+    for p in PARTS:
+        for key in p.provides:
+            providers[key] = p.name
+
+    needed = set()
+    pending = [get_part(n).name for n in names]
+    while pending:
+        name = pending.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        for key in get_part(name).requires:
+            if key in available:
+                continue
+            if key not in providers:
+                raise ValueError('Stack part "{}" requires "{}", which no part provides'.format(name, key))
+            pending.append(providers[key])
+
+    # order them so every part runs after the parts it requires, otherwise
+    # keeping the order of PARTS
+    ordered = []
+    have = set(available)
+    remaining = [p for p in PARTS if p.name in needed]
+    while remaining:
+        ready = [p for p in remaining if all(key in have for key in p.requires)]
+        if not ready:
+            raise ValueError('Circular requirements between stack parts {}'.format(
+                ', '.join(p.name for p in remaining)))
+        ordered.append(ready[0])
+        have.update(ready[0].provides)
+        remaining.remove(ready[0])
+    return ordered
+
+
+def template_entries(t):
+    return {
+        'Parameters': set(t.parameters),
+        'Conditions': set(t.conditions),
+        'Mappings': set(t.mappings),
+        'Resources': set(t.resources),
+        'Outputs': set(t.outputs),
+    }
+
+
+class KeyTracker(dict):
+    """
+    A copy of `r` that records the keys read from it and written to it
+    """
+    def __init__(self, r):
+        dict.__init__(self, r)
+        self.read = set()
+        self.written = set()
+
+    def __getitem__(self, key):
+        self.read.add(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        self.read.add(key)
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        self.read.add(key)
+        return dict.__contains__(self, key)
+
+    def __setitem__(self, key, value):
+        self.written.add(key)
+        dict.__setitem__(self, key, value)
+
+
+def check_keys(part, tracker):
+    undeclared = (tracker.read - set(part.requires) - set(part.provides) - set(part.uses)) | \
+        (tracker.written - set(part.provides))
+    if undeclared:
+        raise ValueError('Stack part "{}" uses undeclared {}'.format(part.name, ', '.join(sorted(undeclared))))
+
+
+def build(t, r, names=None, profile=None):
+    # Returns which part added each entry of the template, as
+    # {section: {logical id: part name}}. When `profile` is a list, a record of
+    # the time, memory and template entries of every part is appended to it.
+    owners = dict((section, {}) for section in template_entries(t))
+    for p in resolve(names, available=r):
+        before = template_entries(t)
+        module = import_part(p.name)
+        tracker = KeyTracker(r)
+        if profile is None:
+            module.init(t, tracker)
+        else:
+            from ..profile import measure
+            seconds, allocated = measure(module.init, t, tracker)
+        check_keys(p, tracker)
+        r.update((key, tracker[key]) for key in tracker.written)
+
+        missing = [key for key in p.provides if key not in r]
+        if missing:
+            raise ValueError('Stack part "{}" did not provide {}'.format(p.name, ', '.join(missing)))
+
+        added = {}
+        for section, entries in template_entries(t).items():
+            added[section] = entries - before[section]
+            for name in added[section]:
+                owners[section][name] = p.name
+
+        if profile is not None:
+            record = {'part': p.name, 'seconds': seconds, 'allocated': allocated}
+            for section, entries in added.items():
+                record[section.lower()] = len(entries)
+            profile.append(record)
+    return owners
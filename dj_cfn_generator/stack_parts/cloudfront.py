@@ -0,0 +1,164 @@
+from troposphere import AWSObject, AWSProperty, Ref, GetAtt, Join, Equals, Output, Export, Tags
+from troposphere.cloudfront import Distribution, DistributionConfig, Origin, CustomOriginConfig, \
+    DefaultCacheBehavior, CacheBehavior, ForwardedValues, Cookies
+from troposphere.cloudwatch import Alarm, MetricDimension
+
+# seconds spectators may see an old scoreboard(it doesn't change during the
+# freeze anyway)
+SCOREBOARD_TTL = 10
+# seconds the stylesheets, scripts and images are cached for. They only change
+# with a new domserver version.
+STATIC_TTL = 24 * 60 * 60
+# the scoreboard filter of the public scoreboard is kept in this cookie
+SCOREBOARD_COOKIES = ['domjudge_scorefilter']
+
+STATIC_PATHS = ['/*.css', '/js/*', '/images/*']
+
+# % of the requests served from the cache the hit rate alarm goes off under
+CACHE_HIT_ALARM_RATE = 50
+
+
+class MonitoringSubscriptionConfig(AWSProperty):
+    props = {
+        'RealtimeMetricsSubscriptionStatus': (str, True),
+    }
+
+
+class MonitoringSubscription(AWSProperty):
+    props = {
+        'RealtimeMetricsSubscriptionConfig': (MonitoringSubscriptionConfig, True),
+    }
+
+
+class DistributionMonitoringSubscription(AWSObject):
+    # AWS::CloudFront::MonitoringSubscription, which troposphere doesn't know
+    # about yet
+    resource_type = "AWS::CloudFront::MonitoringSubscription"
+
+    props = {
+        'DistributionId': (str, True),
+        'MonitoringSubscription': (MonitoringSubscription, True),
+    }
+
+
+def cached(path, ttl, cookies=None):
+    return CacheBehavior(
+        PathPattern=path,
+        TargetOriginId="WebserverELB",
+        ViewerProtocolPolicy="allow-all",
+        AllowedMethods=["GET", "HEAD"],
+        Compress=True,
+        ForwardedValues=ForwardedValues(
+            QueryString=True,
+            Cookies=Cookies(Forward="whitelist", WhitelistedNames=cookies) if cookies else Cookies(Forward="none")
+        ),
+        MinTTL=0,
+        DefaultTTL=ttl,
+        MaxTTL=ttl,
+    )
+
+
+def init(t, r):
+    stackname = Ref('AWS::StackName')
+
+    # Everything else, the team and jury interfaces, the API and logging in,
+    # goes to the webservers uncached, with its cookies and headers
+    r['cloudfront_distribution'] = t.add_resource(Distribution(
+        "CloudFrontDistribution",
+        DistributionConfig=DistributionConfig(
+            Comment=Join("", [stackname, " scoreboard and static files"]),
+            Enabled=True,
+            HttpVersion="http2",
+            Origins=[
+                Origin(
+                    Id="WebserverELB",
+                    DomainName=GetAtt(r['webserver_elb'], 'DNSName'),
+                    CustomOriginConfig=CustomOriginConfig(
+                        HTTPPort=80,
+                        OriginProtocolPolicy="http-only"
+                    )
+                )
+            ],
+            DefaultCacheBehavior=DefaultCacheBehavior(
+                TargetOriginId="WebserverELB",
+                ViewerProtocolPolicy="allow-all",
+                AllowedMethods=["GET", "HEAD", "OPTIONS", "PUT", "POST", "PATCH", "DELETE"],
+                ForwardedValues=ForwardedValues(
+                    QueryString=True,
+                    Cookies=Cookies(Forward="all"),
+                    Headers=["*"]
+                ),
+                MinTTL=0,
+                DefaultTTL=0,
+                MaxTTL=0,
+            ),
+            CacheBehaviors=[cached('/public*', SCOREBOARD_TTL, SCOREBOARD_COOKIES)] +
+                           [cached(path, STATIC_TTL) for path in STATIC_PATHS],
+        ),
+        Tags=Tags(djclusterid=stackname)
+    ))
+
+    t.add_output(Output(
+        'CloudFrontDomainName',
+        Description="CloudFront distribution domain name",
+        Value=GetAtt(r['cloudfront_distribution'], 'DomainName'),
+        Export=Export(Join("-", [stackname, "CloudFrontDomainName"]))
+    ))
+
+    # CacheHitRate is one of the additional metrics, which have to be turned on
+    # (and are paid for). CloudFront only publishes its metrics in us-east-1,
+    # so only stacks in that region create the alarms, and turn them on.
+    in_us_east_1 = t.add_condition("InUsEast1", Equals(Ref("AWS::Region"), "us-east-1"))
+    t.add_resource(DistributionMonitoringSubscription(
+        "CloudFrontMonitoringSubscription",
+        Condition=in_us_east_1,
+        DistributionId=Ref(r['cloudfront_distribution']),
+        MonitoringSubscription=MonitoringSubscription(
+            RealtimeMetricsSubscriptionConfig=MonitoringSubscriptionConfig(
+                RealtimeMetricsSubscriptionStatus="Enabled"
+            )
+        )
+    ))
+    dimensions = [
+        MetricDimension(
+            Name="DistributionId",
+            Value=Ref(r['cloudfront_distribution'])
+        ),
+        MetricDimension(
+            Name="Region",
+            Value="Global"
+        )
+    ]
+
+    r['cloudfront_cache_hit_alarm'] = t.add_resource(Alarm(
+        "CloudFrontCacheHitRateAlarm",
+        Condition=in_us_east_1,
+        AlarmDescription=Join("", [stackname, " LOW CloudFront cache hit rate"]),
+        Namespace="AWS/CloudFront",
+        MetricName="CacheHitRate",
+        Dimensions=dimensions,
+        Statistic="Average",
+        EvaluationPeriods="3",
+        Period="300",
+        Threshold=str(CACHE_HIT_ALARM_RATE),    # most requests should be spectators' scoreboards
+        ComparisonOperator="LessThanThreshold",
+        AlarmActions=[r['notify_topic']],
+        # no data while nobody is looking
+        InsufficientDataActions=[]
+    ))
+
+    r['cloudfront_5xx_error_alarm'] = t.add_resource(Alarm(
+        "CloudFront5XXErrorAlarm",
+        Condition=in_us_east_1,
+        AlarmDescription=Join("", [stackname, " HIGH CloudFront 5xx error rate"]),
+        Namespace="AWS/CloudFront",
+        MetricName="5xxErrorRate",
+        Dimensions=dimensions,
+        Statistic="Average",
+        EvaluationPeriods="1",
+        Period="300",
+        Threshold="1",    # 1% of the requests
+        ComparisonOperator="GreaterThanThreshold",
+        AlarmActions=[r['notify_topic']],
+        InsufficientDataActions=[]
+    ))
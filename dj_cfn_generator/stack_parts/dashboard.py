@@ -0,0 +1,158 @@
+import json
+
+from troposphere import AWSHelperFn, Ref, Join, Output
+from troposphere.cloudwatch import Dashboard
+
+# CloudWatch dashboards are 24 units wide
+WIDGET_WIDTH = 12
+WIDGET_HEIGHT = 6
+# seconds per datapoint
+PERIOD = 60
+
+
+def json_join(value):
+    # `value` as JSON for a Join, with the CloudFormation functions in it(the
+    # dimension values, the region) as JSON strings
+    parts = []
+
+    def emit(v):
+        if isinstance(v, AWSHelperFn):
+            parts.extend(['"', v, '"'])
+        elif isinstance(v, dict):
+            parts.append('{')
+            for i, k in enumerate(sorted(v)):
+                parts.append('{}{}:'.format(',' if i else '', json.dumps(k)))
+                emit(v[k])
+            parts.append('}')
+        elif isinstance(v, (list, tuple)):
+            parts.append('[')
+            for i, item in enumerate(v):
+                if i:
+                    parts.append(',')
+                emit(item)
+            parts.append(']')
+        else:
+            parts.append(json.dumps(v))
+    emit(value)
+
+    # merge the strings between the functions
+    merged = []
+    for p in parts:
+        if isinstance(p, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += p
+        else:
+            merged.append(p)
+    return Join('', merged)
+
+
+def metric(namespace, metric_name, dimensions=(), **options):
+    # A dashboard metric: namespace, name, the (name, value) pairs of the
+    # dimensions, then the rendering options(stat, label, yAxis, ...)
+    line = [namespace, metric_name]
+    for name, value in dimensions:
+        line += [name, value]
+    if options:
+        line.append(options)
+    return line
+
+
+def alarm_metric(alarm, metric_name=None, query=None, **options):
+    # The metric `alarm` watches(the one of its metric math `query`), or another
+    # metric_name of the same namespace and dimensions
+    source = alarm
+    if query is not None:
+        source = [q for q in alarm.Metrics if q.Id == query][0].MetricStat.Metric
+    dimensions = [(d.Name, d.Value) for d in source.properties.get('Dimensions', [])]
+    return metric(source.Namespace, metric_name or source.MetricName, dimensions, **options)
+
+
+def threshold(alarm, label, axis='left'):
+    # a horizontal line where `alarm` goes off
+    return {'label': label, 'value': float(alarm.Threshold), 'yAxis': axis}
+
+
+def widget(title, metrics, stat='Average', annotations=None):
+    properties = {
+        'title': title,
+        'region': Ref('AWS::Region'),
+        'metrics': metrics,
+        'view': 'timeSeries',
+        'stacked': False,
+        'stat': stat,
+        'period': PERIOD,
+    }
+    if annotations:
+        properties['annotations'] = {'horizontal': annotations}
+    return {'type': 'metric', 'width': WIDGET_WIDTH, 'height': WIDGET_HEIGHT, 'properties': properties}
+
+
+def init(t, r):
+    stackname = Ref('AWS::StackName')
+
+    # Every metric comes from an alarm(or its metric math), so the dashboard
+    # shows what the alarms see, for whichever load balancer the webservers are
+    # behind. Widgets read from the load balancer at the top left down to the
+    # session table.
+    latency = r['elb_latency_alarm']
+    widgets = [
+        widget("Response time", [
+            alarm_metric(latency, stat='p50', label='p50'),
+            alarm_metric(latency, stat='p90', label='p90'),
+            alarm_metric(latency, stat='p99', label='p99'),
+        ], annotations=[threshold(latency, 'Alarm')]),
+        widget("Requests and 5xx responses", [
+            alarm_metric(latency, 'RequestCount', label='Requests'),
+            alarm_metric(r['elb_5xx_error_alarm'], label='5xx responses', yAxis='right'),
+        ], stat='Sum'),
+        widget("Webservers", [
+            metric('AWS/EC2', 'CPUUtilization', [('AutoScalingGroupName', Ref(r['webserver_asg']))], label='CPU'),
+            alarm_metric(r['elb_healthy_hosts_alarm'], label='Healthy webservers', yAxis='right'),
+        ]),
+        widget("Judging queue", [
+            alarm_metric(r['judgehost_scaleout_alarm'], query='queue', label='Queued judgings'),
+            alarm_metric(r['judgehost_scaleout_alarm'], query='instances', label='Judgehosts', yAxis='right'),
+        ]),
+        widget("Database CPU and connections", [
+            alarm_metric(r['rds_cpu_alarm'], label='CPU'),
+            alarm_metric(r['rds_cpu_alarm'], 'DatabaseConnections', label='Connections', yAxis='right'),
+        ], annotations=[threshold(r['rds_cpu_alarm'], 'CPU alarm')]),
+        widget("Database latency", [
+            alarm_metric(r['rds_read_latency_alarm'], label='Read'),
+            alarm_metric(r['rds_write_latency_alarm'], label='Write'),
+        ], annotations=[threshold(r['rds_read_latency_alarm'], 'Alarm')]),
+        widget("Database IOPS", [
+            alarm_metric(r['rds_cpu_alarm'], 'ReadIOPS', label='Read'),
+            alarm_metric(r['rds_cpu_alarm'], 'WriteIOPS', label='Write'),
+            alarm_metric(r['rds_queue_depth_alarm'], label='Queue depth', yAxis='right'),
+        ]),
+    ]
+
+    # consumed capacity is a sum over the period, provisioned capacity per second
+    capacity = []
+    for x in "Read", "Write":
+        alarm = r['sessiontable_{}alarm'.format(x.lower())]
+        consumed = 'consumed{}'.format(x.lower())
+        capacity += [
+            alarm_metric(alarm, query='consumed', stat='Sum', id=consumed, visible=False),
+            [{'expression': '{} / {}'.format(consumed, PERIOD), 'label': 'Consumed {}s'.format(x.lower()),
+              'id': 'per{}'.format(consumed)}],
+            alarm_metric(alarm, 'Provisioned{}CapacityUnits'.format(x), query='consumed',
+                         label='Provisioned {}s'.format(x.lower())),
+        ]
+    widgets.append(widget("Session table capacity", capacity))
+
+    for i, w in enumerate(widgets):
+        w['x'] = (i % 2) * WIDGET_WIDTH
+        w['y'] = (i // 2) * WIDGET_HEIGHT
+
+    r['dashboard'] = t.add_resource(Dashboard(
+        "PerformanceDashboard",
+        DashboardName=stackname,
+        DashboardBody=json_join({'widgets': widgets})
+    ))
+    t.add_output(Output(
+        'DashboardURL',
+        Description="CloudWatch dashboard of the cluster's performance",
+        Value=Join("", ["https://console.aws.amazon.com/cloudwatch/home?region=", Ref("AWS::Region"),
+                        "#dashboards:name=", Ref(r['dashboard'])])
+    ))
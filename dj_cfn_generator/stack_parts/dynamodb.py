@@ -1,15 +1,51 @@
 #!/usr/bin/env python
-from troposphere import Ref, Join
-from troposphere.dynamodb2 import (KeySchema, AttributeDefinition,
-                                   ProvisionedThroughput, Table)
-from troposphere.cloudwatch import Alarm, MetricDimension
+from troposphere import Ref, Join, If, FindInMap, Select, Split, NoValue
+from troposphere.dynamodb import (KeySchema, AttributeDefinition,
+                                  ProvisionedThroughput, Table, TimeToLiveSpecification)
+from troposphere.cloudwatch import Alarm, MetricDimension, MetricDataQuery, MetricStat, Metric
+from troposphere.applicationautoscaling import (ScalableTarget, ScalableTargetAction, ScalingPolicy,
+                                                ScheduledAction, TargetTrackingScalingPolicyConfiguration,
+                                                PredefinedMetricSpecification)
+
+# share of the capacity consumed over 5 minutes the capacity alarms go off at
+CAPACITY_ALARM_SHARE = 0.8
+# consumed/provisioned capacity autoscaled tables aim for
+AUTOSCALING_TARGET = 70
+
+
+def application_time(time):
+    # Application Auto Scaling schedules take "at(2017-03-18T09:00:00)", without
+    # the Z of the contest schedule parameters
+    return Join("", ["at(", Select(0, Split("Z", time)), ")"])
 
 
 def init(t, r):
     stackname = Ref('AWS::StackName')
+    mode = r['settings']['dynamodb_mode']
+
+    def capacity(key):
+        return If(r['has_dynamodb_capacity'], Ref(r['dynamodb_capacity']),
+                  FindInMap("SizeMap", Ref(r['contestsize']), key))
 
-    dynamodb_capacity = Ref(r['dynamodb_capacity'])
-    # Create the DynamoDB Session Table
+    def min_capacity(key):
+        return FindInMap("SizeMap", Ref(r['contestsize']), key)
+
+    if mode == 'ondemand':
+        billing = {'BillingMode': 'PAY_PER_REQUEST'}
+    elif mode == 'autoscaling':
+        # start low, the scalable targets below take it from there
+        billing = {'ProvisionedThroughput': ProvisionedThroughput(
+            ReadCapacityUnits=min_capacity('DynamoDBReadMinCapacity'),
+            WriteCapacityUnits=min_capacity('DynamoDBWriteMinCapacity')
+        )}
+    else:
+        billing = {'ProvisionedThroughput': ProvisionedThroughput(
+            ReadCapacityUnits=capacity('DynamoDBReadCapacity'),
+            WriteCapacityUnits=capacity('DynamoDBWriteCapacity')
+        )}
+
+    # Create the DynamoDB Session Table. The session handler stores when each
+    # session expires in "expires", so DynamoDB deletes stale ones itself.
     r['sessiontable'] = t.add_resource(Table(
         "SessionTable",
         AttributeDefinitions=[
@@ -24,29 +60,94 @@ def init(t, r):
                 KeyType="HASH"
             )
         ],
-        ProvisionedThroughput=ProvisionedThroughput(
-            ReadCapacityUnits=dynamodb_capacity,
-            WriteCapacityUnits=dynamodb_capacity
-        )
+        TimeToLiveSpecification=TimeToLiveSpecification(
+            AttributeName="expires",
+            Enabled=True
+        ),
+        **billing
     ))
 
-    # Read and Write Capacity alarms
+    if mode == 'autoscaling':
+        for x in "Read", "Write":
+            # scale between the capacity planned for between the bursts and the
+            # peak(or DynamoDBCapacity). The contest schedule raises the minimum
+            # to the peak ahead of the start, when everyone logs in at once.
+            target = t.add_resource(ScalableTarget(
+                "SessionTable{}ScalableTarget".format(x),
+                ServiceNamespace="dynamodb",
+                ResourceId=Join("/", ["table", Ref(r['sessiontable'])]),
+                ScalableDimension="dynamodb:table:{}CapacityUnits".format(x),
+                MinCapacity=min_capacity('DynamoDB{}MinCapacity'.format(x)),
+                MaxCapacity=capacity('DynamoDB{}Capacity'.format(x)),
+                RoleARN=Join("", ["arn:aws:iam::", Ref("AWS::AccountId"),
+                                  ":role/aws-service-role/dynamodb.application-autoscaling.amazonaws.com/"
+                                  "AWSServiceRoleForApplicationAutoScaling_DynamoDBTable"]),
+                ScheduledActions=[
+                    If(r['is_prewarm_scheduled'], ScheduledAction(
+                        ScheduledActionName="ContestPrewarm",
+                        Schedule=application_time(If(r['has_prewarm_time'], Ref(r['contest_prewarm_time']),
+                                                     Ref(r['contest_start_time']))),
+                        ScalableTargetAction=ScalableTargetAction(
+                            MinCapacity=capacity('DynamoDB{}Capacity'.format(x)),
+                        ),
+                    ), NoValue),
+                    If(r['is_end_scheduled'], ScheduledAction(
+                        ScheduledActionName="ContestEnd",
+                        Schedule=application_time(Ref(r['contest_end_time'])),
+                        ScalableTargetAction=ScalableTargetAction(
+                            MinCapacity=min_capacity('DynamoDB{}MinCapacity'.format(x)),
+                        ),
+                    ), NoValue),
+                ],
+            ))
+            t.add_resource(ScalingPolicy(
+                "SessionTable{}ScalingPolicy".format(x),
+                PolicyName=Join("-", [stackname, "session-{}".format(x.lower())]),
+                PolicyType="TargetTrackingScaling",
+                ScalingTargetId=Ref(target),
+                TargetTrackingScalingPolicyConfiguration=TargetTrackingScalingPolicyConfiguration(
+                    TargetValue=AUTOSCALING_TARGET,
+                    PredefinedMetricSpecification=PredefinedMetricSpecification(
+                        PredefinedMetricType="DynamoDB{}CapacityUtilization".format(x)
+                    ),
+                ),
+            ))
+
+    # Read and Write Capacity alarms, when more than 80% of the capacity(the
+    # fixed one, the autoscaling maximum, or what was planned for on-demand
+    # tables) is consumed
     for x in "Read", 'Write':
         r['sessiontable_{}alarm'.format(x.lower())] = t.add_resource(Alarm(
             "SessionTable{}CapacityAlarm".format(x),
             AlarmDescription=Join("", [stackname, "{} capacity limit on the session table".format(x)]),
-            Namespace="AWS/DynamoDB",
-            MetricName="Consumed{}CapacityUnits".format(x),
-            Dimensions=[
-                MetricDimension(
-                    Name="TableName",
-                    Value=Ref(r['sessiontable'])
-                )
+            Metrics=[
+                MetricDataQuery(
+                    Id="consumed",
+                    MetricStat=MetricStat(
+                        Metric=Metric(
+                            Namespace="AWS/DynamoDB",
+                            MetricName="Consumed{}CapacityUnits".format(x),
+                            Dimensions=[
+                                MetricDimension(
+                                    Name="TableName",
+                                    Value=Ref(r['sessiontable'])
+                                )
+                            ],
+                        ),
+                        Period=300,
+                        Stat="Sum",
+                    ),
+                    ReturnData=False,
+                ),
+                MetricDataQuery(
+                    Id="share",
+                    Expression=Join("", ["consumed / 300 / ", capacity('DynamoDB{}Capacity'.format(x))]),
+                    Label="Share of {} capacity".format(x.lower()),
+                    ReturnData=True,
+                ),
             ],
-            Statistic="Sum",
-            Period="300",
             EvaluationPeriods="1",
-            Threshold="{}".format(240),    # 80% of capacity. TODO: this needs to scale with dynamodb_capacity
+            Threshold="{}".format(CAPACITY_ALARM_SHARE),
             ComparisonOperator="GreaterThanThreshold",
             AlarmActions=[r['notify_topic']],
             InsufficientDataActions=[r['notify_topic']]
@@ -0,0 +1,176 @@
+from troposphere import Ref, GetAtt, Join, FindInMap, If, Output, Tags
+from troposphere import Tag as cacheTag
+from troposphere.ec2 import SecurityGroup, SecurityGroupIngress
+from troposphere.ec2 import Tag
+from troposphere.elasticache import CacheCluster, ReplicationGroup
+from troposphere.cloudwatch import Alarm, MetricDimension, MetricDataQuery, MetricStat, Metric
+from ..capacity import MAX_CACHE_NODES
+
+CACHE_PORTS = {
+    'redis': 6379,
+    'memcached': 11211,
+}
+# redis runs in cluster mode, with a shard per node of the capacity plan
+REDIS_VERSION = '7.1'
+REDIS_PARAMETER_GROUP = 'default.redis7.cluster.on'
+
+
+def shard_metrics(group, metric_name, statistic, combine):
+    # Metric math for an alarm on metric_name of every shard of the redis
+    # replication group `group`, combined with `combine`(SUM, MAX). The shards
+    # are the clusters <group>-0001-001 and so on, and those the ContestSize
+    # doesn't have report nothing.
+    queries = [
+        MetricDataQuery(
+            Id='shard{}'.format(i),
+            MetricStat=MetricStat(
+                Metric=Metric(
+                    Namespace="AWS/ElastiCache",
+                    MetricName=metric_name,
+                    Dimensions=[MetricDimension(Name="CacheClusterId",
+                                                Value=Join("-", [Ref(group), "{:04d}".format(i), "001"]))],
+                ),
+                Period=300,
+                Stat=statistic,
+            ),
+            ReturnData=False,
+        )
+        for i in range(1, MAX_CACHE_NODES + 1)
+    ]
+    queries.append(MetricDataQuery(
+        Id='shards',
+        Expression='{}([{}])'.format(combine, ', '.join(q.Id for q in queries)),
+        Label=metric_name,
+        ReturnData=True,
+    ))
+    return queries
+
+
+def init(t, r):
+    stackname = Ref('AWS::StackName')
+    engine = r['settings']['cache_engine']
+    port = CACHE_PORTS[engine]
+
+    r['cache_securitygroup'] = t.add_resource(SecurityGroup(
+        "CacheSecurityGroup",
+        GroupDescription=Join("", ["ElastiCache Security Group - ", stackname]),
+        Tags=[
+            Tag("Name", Join("", [stackname, "-cache"])),
+            Tag("djclusterid", stackname)
+        ]
+    ))
+    t.add_resource(SecurityGroupIngress(
+        "WebserverToCache",
+        IpProtocol="tcp", FromPort=str(port), ToPort=str(port),
+        SourceSecurityGroupId=GetAtt(r['webserver_securitygroup'], 'GroupId'),
+        GroupId=GetAtt(r['cache_securitygroup'], 'GroupId')
+    ))
+
+    # The capacity plan spreads the load over CacheNodeCount nodes: memcached
+    # shards over the nodes of a cluster, redis over the shards of a cluster
+    # mode replication group. Either way clients find the nodes from the
+    # configuration endpoint.
+    node_type = If(
+        "IsStaging",
+        'cache.t2.micro',
+        FindInMap("SizeMap", Ref(r['contestsize']), 'CacheNodeType')
+    )
+    nodes = If(
+        "IsStaging",
+        '1',
+        FindInMap("SizeMap", Ref(r['contestsize']), 'CacheNodeCount')
+    )
+    # troposphere only takes a Tags object for ElastiCache
+    tags = Tags(
+        cacheTag("Name", Join("", [stackname, "-cache"])),
+        cacheTag("djclusterid", stackname)
+    )
+    if engine == 'redis':
+        r['cache_cluster'] = t.add_resource(ReplicationGroup(
+            "CacheReplicationGroup",
+            ReplicationGroupDescription=Join("", [stackname, " cache"]),
+            Engine=engine,
+            EngineVersion=REDIS_VERSION,
+            CacheParameterGroupName=REDIS_PARAMETER_GROUP,
+            CacheNodeType=node_type,
+            NumNodeGroups=nodes,
+            ReplicasPerNodeGroup=0,
+            Port=port,
+            SecurityGroupIds=[GetAtt(r['cache_securitygroup'], 'GroupId')],
+            Tags=tags
+        ))
+        endpoint = 'ConfigurationEndPoint'
+    else:
+        r['cache_cluster'] = t.add_resource(CacheCluster(
+            "CacheCluster",
+            Engine=engine,
+            CacheNodeType=node_type,
+            NumCacheNodes=nodes,
+            Port=port,
+            VpcSecurityGroupIds=[GetAtt(r['cache_securitygroup'], 'GroupId')],
+            Tags=tags
+        ))
+        endpoint = 'ConfigurationEndpoint'
+    r['cache_endpoint'] = (GetAtt(r['cache_cluster'], endpoint + '.Address'),
+                           GetAtt(r['cache_cluster'], endpoint + '.Port'))
+
+    def metrics(metric_name, statistic, combine):
+        # the properties of an alarm on metric_name of the whole cache
+        if engine == 'redis':
+            return {'Metrics': shard_metrics(r['cache_cluster'], metric_name, statistic, combine)}
+        return {
+            'Namespace': "AWS/ElastiCache",
+            'MetricName': metric_name,
+            'Dimensions': [
+                MetricDimension(
+                    Name="CacheClusterId",
+                    Value=Ref(r['cache_cluster'])
+                )
+            ],
+            'Statistic': statistic,
+            'Period': "300",
+        }
+
+    t.add_output(Output(
+        'CacheEndpointAddress',
+        Description="ElastiCache endpoint address",
+        Value=r['cache_endpoint'][0]
+    ))
+    t.add_output(Output(
+        'CacheEndpointPort',
+        Description="ElastiCache port number",
+        Value=r['cache_endpoint'][1]
+    ))
+
+    # Cloudwatch alarms
+    r['cache_evictions_alarm'] = t.add_resource(Alarm(
+        "CacheEvictionsAlarm",
+        AlarmDescription=Join("", [stackname, " ElastiCache is evicting items"]),
+        EvaluationPeriods="1",
+        Threshold="0",    # the cache is full when it has to evict anything
+        ComparisonOperator="GreaterThanThreshold",
+        AlarmActions=[r['notify_topic']],
+        InsufficientDataActions=[r['notify_topic']],
+        **metrics("Evictions", "Sum", "SUM")
+    ))
+
+    if engine == 'redis':
+        memory_alarm = dict(
+            metrics("DatabaseMemoryUsagePercentage", "Maximum", "MAX"),
+            Threshold="80",    # 80% of the memory available for data on a shard
+            ComparisonOperator="GreaterThanThreshold",
+        )
+    else:
+        memory_alarm = dict(
+            metrics("FreeableMemory", "Minimum", "MIN"),
+            Threshold="{}".format(64 * 1024 * 1024),    # less than 64MB free on a node
+            ComparisonOperator="LessThanThreshold",
+        )
+    r['cache_memory_alarm'] = t.add_resource(Alarm(
+        "CacheMemoryAlarm",
+        AlarmDescription=Join("", [stackname, " LOW ElastiCache memory"]),
+        EvaluationPeriods="1",
+        AlarmActions=[r['notify_topic']],
+        InsufficientDataActions=[r['notify_topic']],
+        **memory_alarm
+    ))
@@ -2,13 +2,14 @@ from troposphere import Ref, Join
 from troposphere.iam import Role, InstanceProfile
 
 from troposphere.iam import PolicyType as IAMPolicy
-from awacs.aws import Action, Allow, Statement, Principal, Policy
+from awacs.aws import Action, Allow, Statement, Principal, Policy, Condition, StringEquals
 from awacs.sts import AssumeRole
+from ..launch import warm_pool_tiers
 
 
-def init(t, r):
-    r['webserver_role'] = t.add_resource(Role(
-        "WebServerRole",
+def instance_role(title):
+    return Role(
+        title,
         AssumeRolePolicyDocument=Policy(
             Statement=[
                 Statement(
@@ -18,7 +19,11 @@ def init(t, r):
                 )
             ]
         )
-    ))
+    )
+
+
+def init(t, r):
+    r['webserver_role'] = t.add_resource(instance_role("WebServerRole"))
     r['webserver_policy'] = t.add_resource(IAMPolicy(
         "WebServerRolePolicy",
         PolicyName="WebServerRole",
@@ -65,3 +70,46 @@ def init(t, r):
         Roles=[Ref(r['webserver_role'])],
         Path="/domjudge/"
     ))
+
+    # Instances of a group with a warm pool complete its launch hook(see
+    # launch.complete_launch_hook()). Judgehosts only need a role for that.
+    tiers = warm_pool_tiers(r['settings'])
+    roles = []
+    if 'web' in tiers:
+        roles.append(Ref(r['webserver_role']))
+    r['judgehost_instanceprofile'] = None
+    if 'judge' in tiers:
+        judgehost_role = t.add_resource(instance_role("JudgehostRole"))
+        r['judgehost_instanceprofile'] = t.add_resource(InstanceProfile(
+            "JudgehostInstanceProfile",
+            Roles=[Ref(judgehost_role)],
+            Path="/domjudge/"
+        ))
+        roles.append(Ref(judgehost_role))
+    if roles:
+        # The groups are only created once their instances completed the hook,
+        # so this can't name them, only their tag
+        t.add_resource(IAMPolicy(
+            "LaunchHookPolicy",
+            PolicyName="LaunchHook",
+            Roles=roles,
+            PolicyDocument=Policy(
+                Statement=[
+                    Statement(
+                        Sid="1",
+                        Effect="Allow",
+                        Action=[Action("autoscaling", "DescribeAutoScalingInstances")],
+                        Resource=["*"]
+                    ),
+                    Statement(
+                        Sid="2",
+                        Effect="Allow",
+                        Action=[Action("autoscaling", "CompleteLifecycleAction")],
+                        Resource=["*"],
+                        Condition=Condition(
+                            StringEquals("autoscaling:ResourceTag/djclusterid", Ref("AWS::StackName"))
+                        )
+                    )
+                ]
+            )
+        ))
@@ -1,7 +1,18 @@
-from troposphere import Ref, Base64, Join, GetAtt, GetAZs, If, FindInMap
+from troposphere import Ref, Base64, Join, GetAtt, GetAZs, If, FindInMap, NoValue
 from troposphere.autoscaling import Tag as asgTag
-from troposphere.autoscaling import AutoScalingGroup, LaunchConfiguration, ScalingPolicy
+from troposphere.autoscaling import AutoScalingGroup, ScalingPolicy, MetricsCollection, \
+    MixedInstancesPolicy, InstancesDistribution, LaunchTemplateOverrides
+from troposphere.autoscaling import LaunchTemplate as asgLaunchTemplate
 from troposphere.cloudwatch import Alarm
+from troposphere.policies import UpdatePolicy, AutoScalingScheduledAction
+from ..scaling import backlog_per_instance, proportional_steps, prewarm_time, contest_schedule
+from ..launch import launch_template, root_device, launch_template_specification, warm_pool, warm_pool_tiers, \
+    launch_hook, complete_launch_hook
+
+# the chroot the submissions run in, the compilers and the test cases
+ROOT_VOLUME_GB = 32
+# minutes a judgehost takes to boot and register
+BOOT_MINUTES = 5
 
 
 def build_user_data(r):
@@ -11,6 +22,28 @@ cat >/etc/domjudge/restapi.secret <<EOF
 default http://""", GetAtt(r['webserver_elb'], 'DNSName'), """/api/  judgehost  """, Ref(r['judgehost_pass']), """
 EOF
 """]
+    if r['settings']['judge_spot']:
+        # EC2 announces it reclaims a spot instance about two minutes ahead.
+        # Stop judging then, and re-register, which makes the domserver give
+        # the unfinished judgings of this judgehost to another one.
+        parts.append("""cat >/usr/local/sbin/spot-interruption-watch <<'WATCH'
+#!/bin/bash
+while sleep 5; do
+    if curl -sf http://169.254.169.254/latest/meta-data/spot/instance-action >/dev/null; then
+        pkill -TERM -f judgedaemon
+        read -r _ url user pass </etc/domjudge/restapi.secret
+        host=$(hostname | cut -d. -f1)
+        curl -sf -u "$user:$pass" -X PUT -d active=0 "${url}judgehosts/$host"
+        curl -sf -u "$user:$pass" -X POST -d hostname="$host" "${url}judgehosts"
+        exit 0
+    fi
+done
+WATCH
+chmod +x /usr/local/sbin/spot-interruption-watch
+nohup /usr/local/sbin/spot-interruption-watch >/dev/null 2>&1 &
+""")
+    if 'judge' in warm_pool_tiers(r['settings']):
+        parts += complete_launch_hook()
 
     return Base64(Join('', parts))
 
@@ -19,27 +52,63 @@ def init(t, r):
     stackname = Ref('AWS::StackName')
     judgehost_userdata = build_user_data(r)
 
-    lc = LaunchConfiguration(
-        "JudgehostLaunchConfiguration",
-        ImageId=Ref(r['judgehost_ami']),
-        InstanceType=If(
-            "IsStaging",
-            't2.micro',
-            Ref(r['judge_instance_type'])
-        ),
-        SecurityGroups=[GetAtt(r['judgehost_securitygroup'], 'GroupId')],
-        UserData=judgehost_userdata,
-        InstanceMonitoring=If("IsStaging", "False", "True"),
-        KeyName=Ref(r['aws_keypair'])
+    settings = r['settings']
+    # Production spot judgehosts run the judge_instance_types(see below), which
+    # replace the template's instance type, so they don't have a
+    # JudgehostInstanceType parameter to ignore
+    production_type = Ref(r['judge_instance_type'])
+    if settings['judge_spot']:
+        production_type = settings['judge_instance_types'][0]
+    instance_type = If(
+        "IsStaging",
+        't2.micro',
+        production_type
     )
-    #if settings['judge_spot_price']:
-    #    lc.SpotPrice = str(settings['judge_spot_price'])
-    r['judgehost_lc'] = t.add_resource(lc)
+    # not EBS-optimized explicitly: JudgehostInstanceType may be a t2, which
+    # can't be, and current generation types always are
+    device = t.add_resource(root_device("JudgehostRootDevice", r, Ref(r['judgehost_ami'])))
+    r['judgehost_lc'] = t.add_resource(launch_template(
+        "JudgehostLaunchTemplate",
+        r,
+        Ref(r['judgehost_ami']),
+        device,
+        instance_type,
+        r['judgehost_securitygroup'],
+        judgehost_userdata,
+        ROOT_VOLUME_GB,
+        instance_profile=r['judgehost_instanceprofile']
+    ))
+    specification = launch_template_specification(r['judgehost_lc'])
+    if settings['judge_spot']:
+        # Production runs judge_on_demand_base judgehosts on demand, and
+        # judge_spot percent of the rest as spot instances of whichever of
+        # judge_instance_types EC2 has the most spare capacity of(so they get
+        # interrupted the least). Staging keeps a single on-demand t2.micro.
+        launch = {
+            'LaunchTemplate': If("IsStaging", specification, NoValue),
+            'MixedInstancesPolicy': If("IsStaging", NoValue, MixedInstancesPolicy(
+                InstancesDistribution=InstancesDistribution(
+                    OnDemandBaseCapacity=settings['judge_on_demand_base'],
+                    OnDemandPercentageAboveBaseCapacity=100 - settings['judge_spot'],
+                    SpotAllocationStrategy="capacity-optimized"
+                ),
+                LaunchTemplate=asgLaunchTemplate(
+                    LaunchTemplateSpecification=specification,
+                    Overrides=[LaunchTemplateOverrides(InstanceType=i) for i in settings['judge_instance_types']]
+                )
+            )),
+            # start a replacement as soon as EC2 expects to reclaim one
+            'CapacityRebalance': If("IsStaging", NoValue, "true"),
+        }
+    else:
+        launch = {'LaunchTemplate': specification}
+    # instances only enter the warm pool once set up
+    if 'judge' in warm_pool_tiers(settings):
+        launch['LifecycleHookSpecificationList'] = [launch_hook(BOOT_MINUTES)]
 
     r['judgehost_asg'] = t.add_resource(AutoScalingGroup(
         "JudgehostAutoScalingGroup",
         AvailabilityZones=GetAZs(Ref("AWS::Region")),
-        LaunchConfigurationName=Ref(r['judgehost_lc']),
         DependsOn=[(r['webserver_asg']).name],
         DesiredCapacity=If(
             "CreateJudgehosts",
@@ -69,22 +138,54 @@ def init(t, r):
             '0'
         ),
 
-        HealthCheckGracePeriod=300,  # 5 Minute grace period
+        HealthCheckGracePeriod=BOOT_MINUTES * 60,
         HealthCheckType="EC2",
+        # keep the size set by the scheduled actions on stack updates(see webserver)
+        UpdatePolicy=UpdatePolicy(
+            AutoScalingScheduledAction=AutoScalingScheduledAction(
+                IgnoreUnmodifiedGroupSizeProperties=True
+            )
+        ),
+        # the scaling alarms divide the queue by this
+        MetricsCollection=[
+            MetricsCollection(Granularity="1Minute", Metrics=["GroupInServiceInstances"])
+        ],
 
         Tags=[
             asgTag("djclusterid", stackname, True),
             asgTag("Name", Join("", [stackname, "-judge"]), True)
-        ]
+        ],
+        **launch
     ))
 
-    # Autoscale policies + cloudwatch triggers
+    r['judgehost_warm_pool'] = None
+    if 'judge' in warm_pool_tiers(settings):
+        r['judgehost_warm_pool'] = t.add_resource(warm_pool("JudgehostWarmPool", r, r['judgehost_asg']))
+
+    # Scale up for the contest schedule(without judgehosts the group stays empty)
+    def sizes(key):
+        return If("CreateJudgehosts", FindInMap("SizeMap", Ref(r['contestsize']), key), '0')
+    prewarm, prewarm_time_value = prewarm_time("JudgehostPrewarmTime", r, BOOT_MINUTES)
+    t.add_resource(prewarm)
+    r['judgehost_scheduled_actions'] = [
+        t.add_resource(action)
+        for action in contest_schedule("Judgehost", r, r['judgehost_asg'],
+                                       sizes('JudgeASGMaxSize'), sizes('JudgeASGMinSize'), prewarm_time_value)
+    ]
+
+    # Autoscale policies + cloudwatch triggers, on the judging queue per judgehost
+    queue_target = r['settings']['judge_queue_target']
+    queue_metric = Join("", [stackname, "-queuesize"])
+
     r['judgehost_scaleout_policy'] = t.add_resource(ScalingPolicy(
         "JudgehostScaleoutPolicy",
         AutoScalingGroupName=Ref(r['judgehost_asg']),
-        Cooldown=300,    # 5 minutes
-        AdjustmentType="ChangeInCapacity",
-        ScalingAdjustment="1"
+        PolicyType="StepScaling",
+        AdjustmentType="PercentChangeInCapacity",
+        MinAdjustmentMagnitude=1,
+        EstimatedInstanceWarmup=BOOT_MINUTES * 60,
+        MetricAggregationType="Average",
+        StepAdjustments=proportional_steps(queue_target)
     ))
     r['judgehost_scalein_policy'] = t.add_resource(ScalingPolicy(
         "JudgehostScaleinPolicy",
@@ -97,12 +198,9 @@ def init(t, r):
     r['judgehost_scaleout_alarm'] = t.add_resource(Alarm(
         "JudgehostScaleoutAlarm",
         AlarmDescription=Join("", [stackname, " Scale Out Judgehosts"]),
-        Namespace="DOMjudge",
-        MetricName=Join("", [stackname, "-queuesize"]),
-        Statistic="Average",
+        Metrics=backlog_per_instance(r['judgehost_asg'], "DOMjudge", queue_metric, 60),
         EvaluationPeriods="2",
-        Period="300",
-        Threshold="40",    # More than 40 items in queue for 10 minutes
+        Threshold=str(queue_target),    # More than queue_target items per judgehost for 2 minutes
         ComparisonOperator="GreaterThanThreshold",
         AlarmActions=[Ref(r['judgehost_scaleout_policy'])],
         InsufficientDataActions=[]
@@ -111,13 +209,10 @@ def init(t, r):
     r['judgehost_scalein_alarm'] = t.add_resource(Alarm(
         "JudgehostScaleinAlarm",
         AlarmDescription=Join("", [stackname, " Scale In Judgehosts"]),
-        Namespace="DOMjudge",
-        MetricName=Join("", [stackname, "-queuesize"]),
-        Statistic="Average",
+        Metrics=backlog_per_instance(r['judgehost_asg'], "DOMjudge", queue_metric, 300),
         EvaluationPeriods="4",
-        Period="300",
-        Threshold="20",    # Less than 20 items in the queue for 20 minutes
+        Threshold=str(queue_target / 2.0),    # Less than half of that for 20 minutes
         ComparisonOperator="LessThanThreshold",
-        AlarmActions=[Ref(r['judgehost_scaleout_policy'])],
+        AlarmActions=[Ref(r['judgehost_scalein_policy'])],
         InsufficientDataActions=[]
     ))
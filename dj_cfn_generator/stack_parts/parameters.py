@@ -1,14 +1,23 @@
-from troposphere import Ref, Equals, Parameter
+from troposphere import Ref, Equals, Parameter, Not
+from .. import CONTEST_SIZES, ENVIRONMENT_TYPES
 
 
 def init(t, r):
+    settings = r['settings']
+
+    # A template specialized for one environment/size only accepts that value
+    envtypes = ENVIRONMENT_TYPES
+    envtype_constraint = 'Must specify stage or prod'
+    if settings['envtype']:
+        envtypes = [settings['envtype']]
+        envtype_constraint = 'Must specify {}'.format(settings['envtype'])
     r['envtype'] = t.add_parameter(Parameter(
         "EnvironmentType",
         Description='Environment Type',
         Type='String',
-        AllowedValues=['stage', 'prod'],
-        Default='stage',
-        ConstraintDescription='Must specify stage or prod'
+        AllowedValues=envtypes,
+        Default=settings['envtype'] or 'stage',
+        ConstraintDescription=envtype_constraint
     ))
     r['is_staging'] = t.add_condition(
         "IsStaging",
@@ -19,21 +28,32 @@ def init(t, r):
         Equals(Ref(r['envtype']), 'prod')
     )
 
+    contestsizes = CONTEST_SIZES
+    contestsize_constraint = 'Must specify one of nano, small, medium, or large'
+    if settings['contestsize']:
+        contestsizes = [settings['contestsize']]
+        contestsize_constraint = 'Must specify {}'.format(settings['contestsize'])
     r['contestsize'] = t.add_parameter(Parameter(
         "ContestSize",
         Description='Contest Size',
         Type='String',
-        AllowedValues=['nano', 'small', 'medium', 'large'],
-        Default='small',
-        ConstraintDescription='Must specify one of nano, small, medium, or large'
+        AllowedValues=contestsizes,
+        Default=settings['contestsize'] or 'small',
+        ConstraintDescription=contestsize_constraint
     ))
 
     r['dynamodb_capacity'] = t.add_parameter(Parameter(
         "DynamoDBCapacity",
-        Description='DynamoDB Initial Capacity',
-        Type='Number',
-        Default='10',
+        Description='DynamoDB Initial Capacity(empty for the capacity planned for the ContestSize)',
+        Type='String',
+        Default='',
+        AllowedPattern='^[0-9]*$',
+        ConstraintDescription='Must be empty or a number'
     ))
+    r['has_dynamodb_capacity'] = t.add_condition(
+        "HasDynamoDBCapacity",
+        Not(Equals(Ref(r['dynamodb_capacity']), ''))
+    )
 
     # r['route53domain'] = t.add_parameter(Parameter(
     #     "Route53Domain",
@@ -133,6 +153,31 @@ def init(t, r):
         NoEcho=True,
     ))
 
+    # An ALB has to be placed in subnets, and its targets in the same VPC(the
+    # webservers are launched in the default VPC)
+    r['lb_vpc'] = r['lb_subnets'] = r['lb_certificate'] = r['has_lb_certificate'] = None
+    if settings['load_balancer'] == 'alb':
+        r['lb_vpc'] = t.add_parameter(Parameter(
+            "LoadBalancerVpc",
+            Description='The default VPC, which the webservers run in',
+            Type='AWS::EC2::VPC::Id'
+        ))
+        r['lb_subnets'] = t.add_parameter(Parameter(
+            "LoadBalancerSubnets",
+            Description='Subnets of the default VPC to place the load balancer in(at least two AZs)',
+            Type='List<AWS::EC2::Subnet::Id>'
+        ))
+        r['lb_certificate'] = t.add_parameter(Parameter(
+            "LoadBalancerCertificate",
+            Description='ACM certificate ARN for HTTPS(and HTTP/2), empty for HTTP only',
+            Type='String',
+            Default=''
+        ))
+        r['has_lb_certificate'] = t.add_condition(
+            "HasLoadBalancerCertificate",
+            Not(Equals(Ref(r['lb_certificate']), ''))
+        )
+
     # misc things
     r['aws_keypair'] = t.add_parameter(Parameter(
         "AWSKeyPair",
@@ -1,18 +1,52 @@
-from troposphere import Ref, GetAtt, Join, FindInMap, If, Output
+from troposphere import Ref, GetAtt, Join, FindInMap, If, Output, Equals, And, Not, Condition, NoValue
 from troposphere.rds import DBInstance, DBParameterGroup
 from troposphere.ec2 import Tag
 from troposphere.cloudwatch import Alarm, MetricDimension
+from ..capacity import max_connections
+
+
+# The staging database is always a db.t2.micro with a small gp2 volume, whatever
+# the ContestSize, serving the single webserver and judgehost of staging
+STAGING_PROFILE = {
+    'RDSStorageType': 'gp2',
+    'RDSAllocatedStorage': 20,
+    'RDSIOCapacity': 200,
+    'RDSIOCapacityMax': 2000,
+    'RDSLogFileSize': 128 * 1024 * 1024,
+    'RDSMaxConnections': max_connections(1, 1),
+}
 
 
 def init(t, r):
     stackname = Ref('AWS::StackName')
 
+    def profile(key):
+        # the capacity plan's value for the ContestSize(see capacity.py)
+        value = FindInMap("SizeMap", Ref(r['contestsize']), key)
+        if key in STAGING_PROFILE:
+            return If(r['is_staging'], STAGING_PROFILE[key], value)
+        return value
+
+    r['rds_provisioned_iops'] = t.add_condition(
+        "HasRDSProvisionedIops",
+        And(Condition(r['is_producton']), Equals(FindInMap("SizeMap", Ref(r['contestsize']), 'RDSStorageType'), 'io1'))
+    )
+
     r['rds_parametergroup'] = t.add_resource(DBParameterGroup(
         "DOMjudgeParameterGroup",
         Family="mysql5.6",
         Description=Join("", [stackname, " database configuration"]),
         Parameters={
-            "max_allowed_packet": "{}".format(256 * 1024 * 2014),  # 256MB
+            "max_allowed_packet": "{}".format(256 * 1024 * 1024),  # 256MB
+
+            # most of the memory of whatever instance class it runs on holds
+            # the data(the test cases of every problem), the rest comes from
+            # the capacity plan. A new innodb_log_file_size takes a reboot.
+            "innodb_buffer_pool_size": "{DBInstanceClassMemory*3/4}",
+            "innodb_log_file_size": profile('RDSLogFileSize'),
+            "innodb_io_capacity": profile('RDSIOCapacity'),
+            "innodb_io_capacity_max": profile('RDSIOCapacityMax'),
+            "max_connections": profile('RDSMaxConnections'),
 
             "character_set_client": "utf8mb4",
             "character_set_database": "utf8mb4",
@@ -27,8 +61,9 @@ def init(t, r):
 
     r['rds_database'] = t.add_resource(DBInstance(
         "RDSDatabase",
-        AllocatedStorage=10,
-        StorageType="gp2",
+        AllocatedStorage=profile('RDSAllocatedStorage'),
+        StorageType=profile('RDSStorageType'),
+        Iops=If(r['rds_provisioned_iops'], profile('RDSIops'), NoValue),
         DBInstanceClass=If(
             "IsStaging",
             'db.t2.micro',
@@ -142,3 +177,49 @@ def init(t, r):
         AlarmActions=[r['notify_topic']],
         InsufficientDataActions=[r['notify_topic']]
     ))
+
+    # gp2 volumes slow down to their baseline once the burst credits are gone
+    has_burst_balance = t.add_condition(
+        "HasRDSBurstBalance",
+        Not(Condition(r['rds_provisioned_iops']))
+    )
+    r['rds_burst_balance_alarm'] = t.add_resource(Alarm(
+        "RDSBurstBalanceAlarm",
+        Condition=has_burst_balance,
+        AlarmDescription=Join("", [stackname, " LOW storage burst balance"]),
+        Namespace="AWS/RDS",
+        MetricName="BurstBalance",
+        Dimensions=[
+            MetricDimension(
+                Name="DBInstanceIdentifier",
+                Value=Ref(r['rds_database'])
+            )
+        ],
+        Statistic="Minimum",
+        EvaluationPeriods="1",
+        Period="300",
+        Threshold="20",    # less than 20% of the credits left
+        ComparisonOperator="LessThanThreshold",
+        AlarmActions=[r['notify_topic']],
+        InsufficientDataActions=[r['notify_topic']]
+    ))
+
+    r['rds_queue_depth_alarm'] = t.add_resource(Alarm(
+        "RDSQueueDepthAlarm",
+        AlarmDescription=Join("", [stackname, " HIGH disk queue depth"]),
+        Namespace="AWS/RDS",
+        MetricName="DiskQueueDepth",
+        Dimensions=[
+            MetricDimension(
+                Name="DBInstanceIdentifier",
+                Value=Ref(r['rds_database'])
+            )
+        ],
+        Statistic="Average",
+        EvaluationPeriods="5",
+        Period="60",
+        Threshold="10",    # IO waiting on the volume for 5 minutes
+        ComparisonOperator="GreaterThanThreshold",
+        AlarmActions=[r['notify_topic']],
+        InsufficientDataActions=[r['notify_topic']]
+    ))
@@ -0,0 +1,75 @@
+from troposphere import Ref, GetAtt, Join, FindInMap, If, Output, Equals, Or, And, Condition, NoValue
+from troposphere.rds import DBInstance
+from troposphere.ec2 import Tag
+from troposphere.cloudwatch import Alarm, MetricDimension
+from ..capacity import MAX_RDS_REPLICAS
+
+
+def init(t, r):
+    stackname = Ref('AWS::StackName')
+    replica_count = FindInMap("SizeMap", Ref(r['contestsize']), 'RDSReplicaCount')
+
+    r['rds_replicas'] = []
+    r['rds_replica_lag_alarms'] = []
+    conditions = []
+    addresses = []
+    for i in range(1, MAX_RDS_REPLICAS + 1):
+        # CloudFormation can't loop, so there is a condition per replica that
+        # holds when the ContestSize asks for at least that many
+        counts = [Equals(replica_count, str(n)) for n in range(i, MAX_RDS_REPLICAS + 1)]
+        condition = t.add_condition(
+            "HasRDSReplica{}".format(i),
+            And(Condition(r['is_producton']), Or(*counts) if len(counts) > 1 else counts[0])
+        )
+
+        replica = t.add_resource(DBInstance(
+            "RDSReplica{}".format(i),
+            Condition=condition,
+            SourceDBInstanceIdentifier=Ref(r['rds_database']),
+            Engine="MySQL",
+            DBInstanceClass=FindInMap("SizeMap", Ref(r['contestsize']), 'RDSInstanceType'),
+            StorageType=FindInMap("SizeMap", Ref(r['contestsize']), 'RDSStorageType'),
+            Iops=If(r['rds_provisioned_iops'], FindInMap("SizeMap", Ref(r['contestsize']), 'RDSIops'), NoValue),
+            VPCSecurityGroups=[GetAtt(r['rds_securitygroup'], 'GroupId')],
+            DBParameterGroupName=Ref(r['rds_parametergroup']),
+            Tags=[Tag('djclusterid', stackname)]
+        ))
+        r['rds_replicas'].append(replica)
+        conditions.append(condition)
+        addresses.append(GetAtt(replica, 'Endpoint.Address'))
+
+        t.add_output(Output(
+            'RDSReplica{}EndpointAddress'.format(i),
+            Condition=condition,
+            Description="RDS read replica {} endpoint address".format(i),
+            Value=GetAtt(replica, 'Endpoint.Address')
+        ))
+
+        r['rds_replica_lag_alarms'].append(t.add_resource(Alarm(
+            "RDSReplica{}LagAlarm".format(i),
+            Condition=condition,
+            AlarmDescription=Join("", [stackname, " HIGH replica {} lag".format(i)]),
+            Namespace="AWS/RDS",
+            MetricName="ReplicaLag",
+            Dimensions=[
+                MetricDimension(
+                    Name="DBInstanceIdentifier",
+                    Value=Ref(replica)
+                )
+            ],
+            Statistic="Maximum",
+            EvaluationPeriods="5",
+            Period="60",
+            Threshold="30",    # more than 30 seconds behind for 5 minutes
+            ComparisonOperator="GreaterThanThreshold",
+            AlarmActions=[r['notify_topic']],
+            InsufficientDataActions=[r['notify_topic']]
+        )))
+
+    # Read only hosts for the webservers(space separated), the primary when
+    # there are no replicas(staging). Replica i exists whenever there are at
+    # least i, so the most replicas that exist decide the list.
+    read_endpoint = GetAtt(r['rds_database'], 'Endpoint.Address')
+    for i, condition in enumerate(conditions, 1):
+        read_endpoint = If(condition, Join(" ", addresses[:i]), read_endpoint)
+    r['rds_read_endpoint'] = read_endpoint
@@ -0,0 +1,101 @@
+from troposphere import Ref, Equals, Parameter, Condition, And, Not
+from ..functions import function_role, inline_function
+
+# Computes the time LeadMinutes before StartTime(both in the format of the
+# contest schedule parameters), for the Custom::PrewarmTime resources of the
+# tiers. CloudFormation itself can't do arithmetic on times.
+PREWARM_TIME_CODE = """\
+import datetime
+import cfnresponse
+
+FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def handler(event, context):
+    data = {}
+    try:
+        if event['RequestType'] != 'Delete':
+            props = event['ResourceProperties']
+            start = datetime.datetime.strptime(props['StartTime'], FORMAT)
+            lead = datetime.timedelta(minutes=int(props['LeadMinutes']))
+            data['Time'] = (start - lead).strftime(FORMAT)
+        cfnresponse.send(event, context, cfnresponse.SUCCESS, data, event.get('PhysicalResourceId'))
+    except Exception:
+        cfnresponse.send(event, context, cfnresponse.FAILED, data, event.get('PhysicalResourceId'))
+"""
+
+
+def init(t, r):
+    # Contest schedule, to scale up ahead of the known bursts. Times are in UTC
+    # (e.g. "2017-03-18T09:00:00Z") and must be in the future when the stack is
+    # created or updated; leave them empty to not schedule anything.
+    time_pattern = '^$|^[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}Z$'
+    time_constraint = 'Must be empty or a UTC time like 2017-03-18T09:00:00Z'
+    r['contest_prewarm_time'] = t.add_parameter(Parameter(
+        "ContestPrewarmTime",
+        Description='When to scale up for the contest start(UTC), defaults to the boot time of each '
+                    'tier before ContestStartTime',
+        Type='String',
+        Default='',
+        AllowedPattern=time_pattern,
+        ConstraintDescription=time_constraint
+    ))
+    r['contest_start_time'] = t.add_parameter(Parameter(
+        "ContestStartTime",
+        Description='Contest start time(UTC)',
+        Type='String',
+        Default='',
+        AllowedPattern=time_pattern,
+        ConstraintDescription=time_constraint
+    ))
+    r['contest_freeze_time'] = t.add_parameter(Parameter(
+        "ContestFreezeTime",
+        Description='Scoreboard freeze time(UTC)',
+        Type='String',
+        Default='',
+        AllowedPattern=time_pattern,
+        ConstraintDescription=time_constraint
+    ))
+    r['contest_end_time'] = t.add_parameter(Parameter(
+        "ContestEndTime",
+        Description='Contest end time(UTC)',
+        Type='String',
+        Default='',
+        AllowedPattern=time_pattern,
+        ConstraintDescription=time_constraint
+    ))
+    r['has_prewarm_time'] = t.add_condition(
+        "HasContestPrewarmTime",
+        Not(Equals(Ref(r['contest_prewarm_time']), ''))
+    )
+    # staging stacks run a single instance, so they never get scheduled
+    r['is_prewarm_scheduled'] = t.add_condition(
+        "IsContestPrewarmScheduled",
+        And(Condition(r['is_producton']), Not(Equals(Ref(r['contest_start_time']), '')))
+    )
+    r['is_freeze_scheduled'] = t.add_condition(
+        "IsContestFreezeScheduled",
+        And(Condition(r['is_producton']), Not(Equals(Ref(r['contest_freeze_time']), '')))
+    )
+    r['is_end_scheduled'] = t.add_condition(
+        "IsContestEndScheduled",
+        And(Condition(r['is_producton']), Not(Equals(Ref(r['contest_end_time']), '')))
+    )
+
+    # Without a ContestPrewarmTime, the tiers work out their own from
+    # ContestStartTime and their boot time with this function
+    r['is_prewarm_defaulted'] = t.add_condition(
+        "IsContestPrewarmDefaulted",
+        And(Condition(r['is_prewarm_scheduled']), Not(Condition(r['has_prewarm_time'])))
+    )
+    prewarm_role = t.add_resource(function_role(
+        "PrewarmTimeFunctionRole",
+        Condition=r['is_prewarm_defaulted']
+    ))
+    r['prewarm_time_function'] = t.add_resource(inline_function(
+        "PrewarmTimeFunction",
+        "Computes when to scale up ahead of the contest start",
+        prewarm_role,
+        PREWARM_TIME_CODE,
+        Condition=r['is_prewarm_defaulted']
+    ))
@@ -1,15 +1,41 @@
 from troposphere import Ref, Base64, Join, GetAtt, GetAZs, If, FindInMap, Output
 from troposphere.ec2 import Tag as ec2Tag
 from troposphere.autoscaling import Tag as asgTag
-from troposphere.autoscaling import AutoScalingGroup, LaunchConfiguration, ScalingPolicy
+from troposphere.autoscaling import AutoScalingGroup
 from troposphere.elasticloadbalancing import HealthCheck, Listener, LoadBalancer, ConnectionDrainingPolicy
+from troposphere import elasticloadbalancingv2 as elbv2
+from troposphere.ec2 import SecurityGroupIngress
 from troposphere.cloudwatch import Alarm, MetricDimension
-from troposphere.policies import UpdatePolicy, AutoScalingRollingUpdate, CreationPolicy, ResourceSignal
+from troposphere.policies import UpdatePolicy, AutoScalingRollingUpdate, AutoScalingReplacingUpdate, \
+    AutoScalingScheduledAction, CreationPolicy, ResourceSignal
+from ..scaling import web_scaling_policies, prewarm_time, contest_schedule
+from ..launch import launch_template, root_device_function, root_device, launch_template_specification, \
+    warm_pool, warm_pool_tiers, launch_hook, complete_launch_hook
+
+# the domserver, its PHP dependencies and logs
+ROOT_VOLUME_GB = 16
+
+# Minutes a webserver gets to boot and signal when the group is created, and
+# per batch of a rolling update, for every WEB_BOOT_MODES. Installing the
+# domserver at boot takes most of that.
+BOOT_MINUTES = {
+    'install': (15, 5),
+    'prebaked': (5, 3),
+}
 
 
 def build_user_data(r):
 
-    parts = ["""#!/bin/bash
+    if r['settings']['web_boot'] == 'prebaked':
+        # the AMI has the domserver installed, it only needs configuring
+        script = '/root/configure_domserver.sh'
+        parts = ["""#!/bin/bash
+cat >/root/env_vars <<EVARS
+# Set variables that the configuration script might need
+export DJCLUSTERID=\""""]
+    else:
+        script = '/root/deploy_domserver.sh'
+        parts = ["""#!/bin/bash
 # The archive that contains the version of domserver to install
 cat >/root/env_vars <<EVARS
 export DOMSERVER_S3_BUCKET=\"""", Ref(r['s3_bucket']), """\"
@@ -18,21 +44,36 @@ export DOMSERVER_S3_REGION=\"""", Ref(r['s3_region']), """\"
 
 
 # Set variables that the install script might need
-export DJCLUSTERID=\"""", Ref('AWS::StackName'), """\"
+export DJCLUSTERID=\""""]
+    parts += [Ref('AWS::StackName'), """\"
 export DYNAMODB_REGION=\"""", Ref("AWS::Region"), """\"
 export DYNAMODB_TABLE=\"""", Ref(r['sessiontable']), """\"
 export DBHOST=\"""", GetAtt(r['rds_database'], "Endpoint.Address"), """\"
+export DBHOST_RO=\"""", r.get('rds_read_endpoint', GetAtt(r['rds_database'], "Endpoint.Address")), """\"
 export DBNAME=\"""", Ref(r['db_name']), """\"
 export DBUSER=\"""", Ref(r['db_user']), """\"
 export DBPASS=\"""", Ref(r['db_pass']), """\"
 export JUDGEHOSTPASS=\"""", Ref(r['judgehost_pass']), """\"
-export ADMINPASS=\"""", Ref(r['admin_pass']), """\"
+export ADMINPASS=\"""", Ref(r['admin_pass'])]
+    # optional lines start in the string that ends the previous variable, so
+    # without them the user data stays the same
+    if 'cache_endpoint' in r:
+        parts += ["""\"
+export CACHE_ENGINE=\"""" + r['settings']['cache_engine'] + """\"
+export CACHE_HOST=\"""", r['cache_endpoint'][0], """\"
+export CACHE_PORT=\"""", r['cache_endpoint'][1]]
+    ending = ["""\"
 EVARS
 source /root/env_vars
-/root/deploy_domserver.sh
-
+""" + script + """
+"""]
+    if 'web' in warm_pool_tiers(r['settings']):
+        hook = complete_launch_hook()
+        ending = [ending[0] + hook[0]] + hook[1:]
+    ending[-1] += """
 # notify cloudformation we're ready/done now
-aws cloudformation signal-resource --stack-name """, Ref('AWS::StackName'), " --region ", {"Ref": "AWS::Region"},
+aws cloudformation signal-resource --stack-name """
+    parts += ending + [Ref('AWS::StackName'), " --region ", {"Ref": "AWS::Region"},
              " --logical-resource-id WebserverAutoScalingGroup",
              " --unique-id $(curl -s http://169.254.169.254/latest/meta-data/instance-id)",
              " --status SUCCESS", """
@@ -41,11 +82,11 @@ aws cloudformation signal-resource --stack-name """, Ref('AWS::StackName'), " --
     return Base64(Join('', parts))
 
 
-def init(t, r):
+def classic_load_balancer(t, r):
+    # A classic ELB and its alarms. Returns the AutoScalingGroup properties
+    # that attach the webservers to it.
     stackname = Ref('AWS::StackName')
 
-    webserver_userdata = build_user_data(r)
-
     r['webserver_elb'] = t.add_resource(LoadBalancer(
         "WebserverELB",
         AvailabilityZones=GetAZs(Ref("AWS::Region")),
@@ -74,131 +115,6 @@ def init(t, r):
             ec2Tag("djclusterid", stackname)
         ]
     ))
-    t.add_output(Output(
-        'ELBEndpointAddress',
-        Description="ELB endpoint address",
-        Value=GetAtt('WebserverELB', 'DNSName')
-    ))
-    lc = LaunchConfiguration(
-        "WebserverLaunchConfiguration",
-        ImageId=Ref(r['web_ami']),
-        InstanceType=If(
-            "IsStaging",
-            't2.micro',
-            FindInMap("SizeMap", Ref(r['contestsize']), 'WebInstanceType')
-        ),
-        SecurityGroups=[GetAtt(r['webserver_securitygroup'], 'GroupId')],
-        UserData=webserver_userdata,
-        InstanceMonitoring=If("IsStaging", "False", "True"),
-        IamInstanceProfile=Ref(r['webserver_instanceprofile']),
-        KeyName=Ref(r['aws_keypair'])
-    )
-    #if settings['web_spot_price']:
-    #    lc.SpotPrice = str(settings['web_spot_price'])
-    r['webserver_lc'] = t.add_resource(lc)
-
-    # TODO: would be neat to use scheduled actions to automatically scale up for the real contest
-    # TODO: however there seems to be a bug with that and updatepolicy: https://forums.aws.amazon.com/thread.jspa?threadID=170910
-    r['webserver_asg'] = t.add_resource(AutoScalingGroup(
-        "WebserverAutoScalingGroup",
-        AvailabilityZones=GetAZs(Ref("AWS::Region")),
-        LaunchConfigurationName=Ref(r['webserver_lc']),
-        LoadBalancerNames=[Ref(r['webserver_elb'])],
-
-        UpdatePolicy=UpdatePolicy(
-            AutoScalingRollingUpdate=AutoScalingRollingUpdate(
-                PauseTime='PT5M',
-                MinInstancesInService="0",
-                MaxBatchSize='1',
-                WaitOnResourceSignals=True
-            )
-        ),
-        CreationPolicy=CreationPolicy(
-            ResourceSignal=ResourceSignal(
-                Timeout='PT15M'
-            )
-        ),
-        HealthCheckGracePeriod=300,  # 5 Minute grace period(this should match the PauseTime in UpdatePolicy above)
-        HealthCheckType="EC2",  # FIXME: should be ELB
-
-        DesiredCapacity=If(
-            "IsStaging",
-            '1',
-            FindInMap("SizeMap", Ref(r['contestsize']), 'WebASGMinSize')
-        ),
-        MinSize=If(
-            "IsStaging",
-            '1',
-            FindInMap("SizeMap", Ref(r['contestsize']), 'WebASGMinSize')
-        ),
-        MaxSize=If(
-            "IsStaging",
-            '1',
-            FindInMap("SizeMap", Ref(r['contestsize']), 'WebASGMaxSize')
-        ),
-
-        Tags=[
-            asgTag("djclusterid", stackname, True),
-            asgTag("Name", Join("", [stackname, "-web"]), True)
-        ]
-    ))
-
-    # Autoscale policies + cloudwatch triggers
-    r['webserver_scaleout_policy'] = t.add_resource(ScalingPolicy(
-        "WebserverScaleoutPolicy",
-        AutoScalingGroupName=Ref(r['webserver_asg']),
-        Cooldown=300,    # 5 minutes
-        AdjustmentType="ChangeInCapacity",
-        ScalingAdjustment="1"
-    ))
-    r['webserver_scalein_policy'] = t.add_resource(ScalingPolicy(
-        "WebserverScaleinPolicy",
-        AutoScalingGroupName=Ref(r['webserver_asg']),
-        Cooldown=300,    # 5 minutes
-        AdjustmentType="ChangeInCapacity",
-        ScalingAdjustment="-1"
-    ))
-
-    r['webserver_scaleout_alarm'] = t.add_resource(Alarm(
-        "WebserverScaleoutAlarm",
-        AlarmDescription=Join("", [stackname, " Scale Out Web Tier"]),
-        Namespace="AWS/EC2",
-        MetricName="CPUUtilization",
-        Dimensions=[
-            MetricDimension(
-                Name="AutoScalingGroupName",
-                Value=Ref(r['webserver_asg'])
-            )
-        ],
-        Statistic="Average",
-        EvaluationPeriods="1",
-        Period="300",
-        Threshold="80",    # Greater than 80% cpu for 5 minutes
-        ComparisonOperator="GreaterThanThreshold",
-        AlarmActions=[Ref(r['webserver_scaleout_policy'])],
-        InsufficientDataActions=[]
-    ))
-
-    r['webserver_scalein_alarm'] = t.add_resource(Alarm(
-        "WebserverScaleinAlarm",
-        AlarmDescription=Join("", [stackname, " Scale In Web Tier"]),
-        Namespace="AWS/EC2",
-        MetricName="CPUUtilization",
-        Dimensions=[
-            MetricDimension(
-                Name="AutoScalingGroupName",
-                Value=Ref(r['webserver_asg'])
-            )
-        ],
-        Statistic="Average",
-        EvaluationPeriods="4",
-        Period="300",
-        Threshold="30",    # Les than 30% for 20 minutes
-        ComparisonOperator="LessThanThreshold",
-        AlarmActions=[Ref(r['webserver_scaleout_policy'])],
-        InsufficientDataActions=[]
-    ))
-
     # Load Balancer Alarms
     r['elb_healthy_hosts_alarm'] = t.add_resource(Alarm(
         "ELBHealthyHostCountAlarm",
@@ -259,3 +175,278 @@ def init(t, r):
         AlarmActions=[r['notify_topic']],
         InsufficientDataActions=[r['notify_topic']]
     ))
+
+    r['webserver_targetgroup'] = None
+    return {
+        'LoadBalancerNames': [Ref(r['webserver_elb'])],
+        # replace webservers the load balancer finds unhealthy, once they had
+        # the time the CreationPolicy gives them to boot
+        'HealthCheckGracePeriod': BOOT_MINUTES[r['settings']['web_boot']][0] * 60,
+        'HealthCheckType': "ELB",
+    }
+
+
+def alb_alarm(title, r, description, metric_name, threshold, comparison, statistic=None,
+              extended_statistic=None, period="60", evaluation_periods="1", target_group=False):
+    stackname = Ref('AWS::StackName')
+    dimensions = [
+        MetricDimension(
+            Name="LoadBalancer",
+            Value=GetAtt(r['webserver_elb'], 'LoadBalancerFullName')
+        )
+    ]
+    if target_group:
+        dimensions.append(MetricDimension(
+            Name="TargetGroup",
+            Value=GetAtt(r['webserver_targetgroup'], 'TargetGroupFullName')
+        ))
+    alarm = Alarm(
+        title,
+        AlarmDescription=Join("", [stackname, description]),
+        Namespace="AWS/ApplicationELB",
+        MetricName=metric_name,
+        Dimensions=dimensions,
+        EvaluationPeriods=evaluation_periods,
+        Period=period,
+        Threshold=threshold,
+        ComparisonOperator=comparison,
+        AlarmActions=[r['notify_topic']],
+        InsufficientDataActions=[r['notify_topic']]
+    )
+    if extended_statistic:
+        alarm.ExtendedStatistic = extended_statistic
+    else:
+        alarm.Statistic = statistic
+    return alarm
+
+
+def application_load_balancer(t, r):
+    # An Application Load Balancer, its target group and alarms. Returns the
+    # AutoScalingGroup properties that attach the webservers to it.
+    stackname = Ref('AWS::StackName')
+
+    r['webserver_elb'] = t.add_resource(elbv2.LoadBalancer(
+        "WebserverELB",
+        Type="application",
+        Scheme="internet-facing",
+        Subnets=Ref(r['lb_subnets']),
+        SecurityGroups=[GetAtt(r['elb_securitygroup'], 'GroupId')],
+        LoadBalancerAttributes=[
+            # HTTP/2 needs the HTTPS listener. Browsers keep their connections
+            # to the load balancer open while they poll the scoreboard.
+            elbv2.LoadBalancerAttributes(Key="routing.http2.enabled", Value="true"),
+            elbv2.LoadBalancerAttributes(Key="idle_timeout.timeout_seconds", Value="60"),
+        ],
+        Tags=[
+            ec2Tag("Name", Join("", [stackname, "-elb"])),
+            ec2Tag("djclusterid", stackname)
+        ]
+    ))
+
+    # A webserver failing two checks 5 seconds apart leaves rotation, and a new
+    # one gets a growing share of the requests over its first minute, while
+    # its caches warm up
+    r['webserver_targetgroup'] = t.add_resource(elbv2.TargetGroup(
+        "WebserverTargetGroup",
+        VpcId=Ref(r['lb_vpc']),
+        Port=80,
+        Protocol="HTTP",
+        HealthCheckPath="/public/index.php",
+        HealthCheckIntervalSeconds=5,
+        HealthCheckTimeoutSeconds=4,
+        HealthyThresholdCount=2,
+        UnhealthyThresholdCount=2,
+        TargetGroupAttributes=[
+            elbv2.TargetGroupAttribute(Key="deregistration_delay.timeout_seconds", Value="30"),
+            elbv2.TargetGroupAttribute(Key="slow_start.duration_seconds", Value="60"),
+        ],
+        Tags=[
+            ec2Tag("djclusterid", stackname)
+        ]
+    ))
+    forward = [elbv2.Action(Type="forward", TargetGroupArn=Ref(r['webserver_targetgroup']))]
+    t.add_resource(elbv2.Listener(
+        "WebserverHTTPListener",
+        LoadBalancerArn=Ref(r['webserver_elb']),
+        Port=80,
+        Protocol="HTTP",
+        DefaultActions=forward
+    ))
+    t.add_resource(elbv2.Listener(
+        "WebserverHTTPSListener",
+        Condition=r['has_lb_certificate'],
+        LoadBalancerArn=Ref(r['webserver_elb']),
+        Port=443,
+        Protocol="HTTPS",
+        Certificates=[elbv2.Certificate(CertificateArn=Ref(r['lb_certificate']))],
+        DefaultActions=forward
+    ))
+    t.add_resource(SecurityGroupIngress(
+        "InternetToELBPort443",
+        Condition=r['has_lb_certificate'],
+        IpProtocol="tcp", FromPort="443", ToPort="443",
+        CidrIp="0.0.0.0/0",
+        GroupId=GetAtt(r['elb_securitygroup'], 'GroupId')
+    ))
+
+    # Load Balancer Alarms
+    r['elb_healthy_hosts_alarm'] = t.add_resource(alb_alarm(
+        "ELBHealthyHostCountAlarm", r, " ALB no healthy backend hosts",
+        "HealthyHostCount", "1", "LessThanThreshold",    # minimum 1 health host
+        statistic="Minimum", target_group=True
+    ))
+    r['elb_latency_alarm'] = t.add_resource(alb_alarm(
+        "ELBLatencyAlarm", r, " HIGH p99 ALB target response time",
+        "TargetResponseTime", "2", "GreaterThanThreshold",    # 1 in 100 requests takes over 2s
+        extended_statistic="p99", evaluation_periods="3"
+    ))
+    r['elb_5xx_error_alarm'] = t.add_resource(alb_alarm(
+        "ELB5XXErrorAlarm", r, " HIGH ALB target 5xx error rate",
+        "HTTPCode_Target_5XX_Count", "0", "GreaterThanThreshold",    # Any 5xx errors are bad
+        statistic="Sum", period="300"
+    ))
+
+    return {
+        'TargetGroupARNs': [Ref(r['webserver_targetgroup'])],
+        # replace webservers the load balancer finds unhealthy, once they had
+        # the time the CreationPolicy gives them to boot
+        'HealthCheckGracePeriod': BOOT_MINUTES[r['settings']['web_boot']][0] * 60,
+        'HealthCheckType': "ELB",
+    }
+
+
+def deploy_policy(r, update_minutes):
+    # How a deploy(a new launch template version) replaces the webservers.
+    # Returns the UpdatePolicy and ResourceSignal properties for that.
+    strategy = r['settings']['web_deploy']
+    if strategy == 'replace':
+        # A new group is created next to the old one, which keeps serving until
+        # every webserver of the new one has signalled, and is deleted then
+        return {
+            'AutoScalingReplacingUpdate': AutoScalingReplacingUpdate(WillReplace=True)
+        }, {
+            'Count': If(
+                "IsStaging",
+                '1',
+                FindInMap("SizeMap", Ref(r['contestsize']), 'WebASGMinSize')
+            )
+        }
+
+    if strategy == 'batches':
+        # see capacity.plan_deploy()
+        batch_size = If("IsStaging", '1', FindInMap("SizeMap", Ref(r['contestsize']), 'WebDeployBatchSize'))
+        min_in_service = If("IsStaging", '0', FindInMap("SizeMap", Ref(r['contestsize']), 'WebDeployMinInService'))
+    else:
+        batch_size = '1'
+        min_in_service = "0"
+    return {
+        'AutoScalingRollingUpdate': AutoScalingRollingUpdate(
+            PauseTime='PT{}M'.format(update_minutes),
+            MinInstancesInService=min_in_service,
+            MaxBatchSize=batch_size,
+            WaitOnResourceSignals=True
+        )
+    }, {}
+
+
+def init(t, r):
+    stackname = Ref('AWS::StackName')
+
+    webserver_userdata = build_user_data(r)
+    creation_minutes, update_minutes = BOOT_MINUTES[r['settings']['web_boot']]
+    deploy, signals = deploy_policy(r, update_minutes)
+
+    if r['settings']['load_balancer'] == 'alb':
+        balancing = application_load_balancer(t, r)
+    else:
+        balancing = classic_load_balancer(t, r)
+    t.add_output(Output(
+        'ELBEndpointAddress',
+        Description="ELB endpoint address",
+        Value=GetAtt('WebserverELB', 'DNSName')
+    ))
+    r['root_device_function'] = root_device_function(t)
+    device = t.add_resource(root_device("WebserverRootDevice", r, Ref(r['web_ami'])))
+    r['webserver_lc'] = t.add_resource(launch_template(
+        "WebserverLaunchTemplate",
+        r,
+        Ref(r['web_ami']),
+        device,
+        If(
+            "IsStaging",
+            't2.micro',
+            FindInMap("SizeMap", Ref(r['contestsize']), 'WebInstanceType')
+        ),
+        r['webserver_securitygroup'],
+        webserver_userdata,
+        ROOT_VOLUME_GB,
+        instance_profile=r['webserver_instanceprofile'],
+        ebs_optimized=If("IsStaging", "false", FindInMap("SizeMap", Ref(r['contestsize']), 'WebEbsOptimized'))
+    ))
+
+    # instances only enter the warm pool once set up
+    if 'web' in warm_pool_tiers(r['settings']):
+        balancing['LifecycleHookSpecificationList'] = [launch_hook(creation_minutes)]
+
+    r['webserver_asg'] = t.add_resource(AutoScalingGroup(
+        "WebserverAutoScalingGroup",
+        AvailabilityZones=GetAZs(Ref("AWS::Region")),
+        LaunchTemplate=launch_template_specification(r['webserver_lc']),
+
+        UpdatePolicy=UpdatePolicy(
+            # Without this, every stack update resets the group size to the
+            # template values, undoing the scheduled actions below. See
+            # https://forums.aws.amazon.com/thread.jspa?threadID=170910
+            AutoScalingScheduledAction=AutoScalingScheduledAction(
+                IgnoreUnmodifiedGroupSizeProperties=True
+            ),
+            **deploy
+        ),
+        CreationPolicy=CreationPolicy(
+            ResourceSignal=ResourceSignal(
+                Timeout='PT{}M'.format(creation_minutes),
+                **signals
+            )
+        ),
+
+        DesiredCapacity=If(
+            "IsStaging",
+            '1',
+            FindInMap("SizeMap", Ref(r['contestsize']), 'WebASGMinSize')
+        ),
+        MinSize=If(
+            "IsStaging",
+            '1',
+            FindInMap("SizeMap", Ref(r['contestsize']), 'WebASGMinSize')
+        ),
+        MaxSize=If(
+            "IsStaging",
+            '1',
+            FindInMap("SizeMap", Ref(r['contestsize']), 'WebASGMaxSize')
+        ),
+
+        Tags=[
+            asgTag("djclusterid", stackname, True),
+            asgTag("Name", Join("", [stackname, "-web"]), True)
+        ],
+        **balancing
+    ))
+
+    r['webserver_warm_pool'] = None
+    if 'web' in warm_pool_tiers(r['settings']):
+        r['webserver_warm_pool'] = t.add_resource(warm_pool("WebserverWarmPool", r, r['webserver_asg']))
+
+    # Target tracking autoscaling, on the metrics chosen at generation time
+    def sizes(key):
+        return FindInMap("SizeMap", Ref(r['contestsize']), key)
+    r['webserver_scaling_policies'] = [
+        t.add_resource(policy)
+        for policy in web_scaling_policies(r, r['settings']['web_scaling'], sizes)
+    ]
+    prewarm, prewarm_time_value = prewarm_time("WebserverPrewarmTime", r, creation_minutes)
+    t.add_resource(prewarm)
+    r['webserver_scheduled_actions'] = [
+        t.add_resource(action)
+        for action in contest_schedule("Webserver", r, r['webserver_asg'],
+                                       sizes('WebASGMaxSize'), sizes('WebASGMinSize'), prewarm_time_value)
+    ]
@@ -1,13 +1,17 @@
+import re
 from setuptools import setup
 
+with open('dj_cfn_generator/__init__.py') as f:
+    version = re.search(r"^__version__ = '(.*)'$", f.read(), re.M).group(1)
+
 setup(name='dj_cfn_generator',
-      version='0.1',
+      version=version,
       description='Cloudformation generator for DOMjudge',
       url='http://github.com/cloudcontest/dj_cfn_generator',
       author='Keith Johnson',
       author_email='kj@ubergeek42.com',
       license='MIT',
-      packages=['dj_cfn_generator'],
+      packages=['dj_cfn_generator', 'dj_cfn_generator.stack_parts'],
       scripts=['bin/dj_cfn_generator'],
       install_requires=[
           'troposphere',
@@ -15,4 +19,7 @@ setup(name='dj_cfn_generator',
           'docopt',
           'awacs'
       ],
+      extras_require={
+          'tests': ['pytest', 'moto>=5'],
+      },
       zip_safe=True)
@@ -0,0 +1,25 @@
+from dj_cfn_generator import CONTEST_SIZES
+from dj_cfn_generator.capacity import plan, plan_rds, MAX_RDS_REPLICAS
+
+SMALL_DATABASE = [['db.t2.small', 2, 400]]
+
+
+def replica_counts(workload=None):
+    plans = plan(workload)
+    return [plans[size]['RDSReplicaCount'] for size in CONTEST_SIZES]
+
+
+def test_replicas_never_decrease_with_size():
+    for workload in None, {'rds_instance_types': SMALL_DATABASE}, \
+            {'sizes': {'small': {'teams': 400}}, 'rds_instance_types': SMALL_DATABASE}:
+        counts = replica_counts(workload)
+        assert counts == sorted(counts)
+        assert 1 <= counts[0] and counts[-1] <= MAX_RDS_REPLICAS
+
+
+def test_replicas_take_the_reads_the_primary_does_not():
+    # a primary sized for all queries with headroom takes the reads itself
+    assert plan_rds(100, 0.5, SMALL_DATABASE) == ('db.t2.small', 1)
+    # 80% of 500 queries are reads, the primary takes 200 less 100 writes
+    assert plan_rds(500, 0.5, SMALL_DATABASE) == ('db.t2.small', 3)
+    assert plan_rds(5000, 0.5, SMALL_DATABASE) == ('db.t2.small', MAX_RDS_REPLICAS)
@@ -0,0 +1,72 @@
+import copy
+
+from dj_cfn_generator.diff import diff_templates, format_diff
+
+SPECIFICATION = {
+    'LaunchTemplateId': {'Ref': 'LaunchTemplate'},
+    'Version': {'Fn::GetAtt': ['LaunchTemplate', 'LatestVersionNumber']},
+}
+
+TEMPLATE = {
+    'Resources': {
+        'LaunchTemplate': {
+            'Type': 'AWS::EC2::LaunchTemplate',
+            'Properties': {'LaunchTemplateData': {'ImageId': 'ami-1', 'UserData': 'v1'}},
+        },
+        'DirectGroup': {
+            'Type': 'AWS::AutoScaling::AutoScalingGroup',
+            'Properties': {'MinSize': '1', 'MaxSize': '2', 'LaunchTemplate': SPECIFICATION},
+            'UpdatePolicy': {'AutoScalingRollingUpdate': {'MaxBatchSize': '1', 'PauseTime': 'PT5M'}},
+        },
+        'MixedGroup': {
+            'Type': 'AWS::AutoScaling::AutoScalingGroup',
+            'Properties': {
+                'MinSize': '1',
+                'MaxSize': '4',
+                'MixedInstancesPolicy': {
+                    'LaunchTemplate': {'LaunchTemplateSpecification': SPECIFICATION},
+                    'InstancesDistribution': {'OnDemandBaseCapacity': '1'},
+                },
+            },
+        },
+        'Alarm': {
+            # only refers to the template's id, which a new version keeps
+            'Type': 'AWS::CloudWatch::Alarm',
+            'Properties': {'AlarmDescription': {'Ref': 'LaunchTemplate'}},
+        },
+    }
+}
+
+
+def changed(**data):
+    template = copy.deepcopy(TEMPLATE)
+    template['Resources']['LaunchTemplate']['Properties']['LaunchTemplateData'].update(data)
+    return template
+
+
+def test_new_launch_template_version_rolls_out_every_group():
+    diff = diff_templates(TEMPLATE, changed(UserData='v2'))
+    rollouts = dict((r['resource'], r) for r in diff['rollouts'])
+    assert sorted(rollouts) == ['DirectGroup', 'MixedGroup']
+    assert rollouts['DirectGroup']['properties'] == ['LaunchTemplate']
+    assert rollouts['MixedGroup']['properties'] == ['MixedInstancesPolicy']
+    assert rollouts['MixedGroup']['caused_by'] == ['LaunchTemplate']
+
+    changes = dict((c['name'], c) for c in diff['changes'])
+    assert changes['LaunchTemplate']['action'] == 'modify'
+    assert 'Alarm' not in changes
+    assert 'refers to new version of LaunchTemplate' in format_diff(diff)
+
+
+def test_replaced_launch_template_rolls_out_every_group():
+    new = copy.deepcopy(TEMPLATE)
+    new['Resources']['LaunchTemplate']['Properties']['LaunchTemplateName'] = 'web'
+    diff = diff_templates(TEMPLATE, new)
+    assert sorted(r['resource'] for r in diff['rollouts']) == ['DirectGroup', 'MixedGroup']
+    changes = dict((c['name'], c) for c in diff['changes'])
+    assert changes['Alarm']['caused_by'] == ['LaunchTemplate']
+    assert 'refers to replaced LaunchTemplate' in format_diff(diff)
+
+
+def test_unchanged_template_has_no_rollout():
+    assert diff_templates(TEMPLATE, changed()) == {'changes': [], 'rollouts': []}
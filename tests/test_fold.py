@@ -0,0 +1,22 @@
+import copy
+
+from dj_cfn_generator import build_template
+from dj_cfn_generator.fold import fold_template
+
+
+def test_fold_drops_unreferenced_parameters():
+    template, owners = build_template()
+    folded = fold_template(copy.deepcopy(template), {'ContestSize': 'nano', 'EnvironmentType': 'stage'})
+    # staging has no contest schedule and always runs t2.micro judgehosts
+    for name in 'ContestSize', 'EnvironmentType', 'ContestStartTime', 'ContestFreezeTime', 'ContestEndTime', \
+            'ContestPrewarmTime', 'JudgehostInstanceType':
+        assert name not in folded['Parameters']
+    assert 'AdminPassword' in folded['Parameters']
+
+
+def test_fold_keeps_parameters_still_referenced():
+    template, owners = build_template(web_boot='prebaked', load_balancer='alb')
+    assert 'S3DeployArchive' not in template['Parameters']
+    folded = fold_template(copy.deepcopy(template), {'ContestSize': 'large', 'EnvironmentType': 'prod'})
+    for name in 'ContestStartTime', 'JudgehostInstanceType', 'LoadBalancerVpc':
+        assert name in folded['Parameters']
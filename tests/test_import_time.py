@@ -0,0 +1,34 @@
+import os
+import sys
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+sys.path.insert(0, BENCHMARKS)
+import import_time  # noqa: E402
+
+BUDGET_MS = 100
+RUNS = 3
+
+
+def fastest(argv=None):
+    # (microseconds, modules imported) of the fastest of RUNS runs
+    return min((import_time.measure(argv) for _ in range(RUNS)), key=lambda run: run[0])
+
+
+def test_startup_imports():
+    total, imported = fastest()
+    assert total / 1000.0 <= BUDGET_MS
+    assert import_time.lazy_imported(imported) == []
+
+
+def test_cache_hit_imports(tmp_path):
+    script = os.path.join(import_time.ROOT, 'bin', 'dj_cfn_generator')
+    argv = [script, '--cache-dir', str(tmp_path)]
+    # the first run renders the template into the cache
+    import_time.measure(argv)
+    assert os.listdir(str(tmp_path))
+
+    total, imported = fastest(argv)
+    assert total / 1000.0 <= BUDGET_MS
+    assert 'dj_cfn_generator.cache' in imported
+    # troposphere and boto3 included
+    assert import_time.lazy_imported(imported) == []
@@ -0,0 +1,50 @@
+from dj_cfn_generator import build_template
+from dj_cfn_generator.fold import prune_template
+
+
+def test_prune_template():
+    template = {
+        'Parameters': {'Used': {}, 'InCondition': {}, 'InSub': {}, 'Unused': {}},
+        'Conditions': {
+            'Used': {'Fn::Equals': [{'Ref': 'InCondition'}, 'x']},
+            'Unused': {'Fn::Equals': [{'Ref': 'Unused'}, 'x']},
+        },
+        'Mappings': {'Unused': {}},
+        'Resources': {
+            'Resource': {
+                'Type': 'AWS::SNS::Topic',
+                'Condition': 'Used',
+                'Properties': {
+                    'TopicName': {'Fn::Sub': '${InSub}-${!Unused}'},
+                    'DisplayName': {'Ref': 'Used'},
+                },
+            },
+        },
+    }
+    prune_template(template)
+    assert sorted(template['Parameters']) == ['InCondition', 'InSub', 'Used']
+    assert list(template['Conditions']) == ['Used']
+    assert 'Mappings' not in template
+
+
+def test_partial_build_only_asks_for_its_parameters():
+    template, owners = build_template(parts=['rds'])
+    for name in 'AWSKeyPair', 'AdminPassword', 'JudgehostPassword', 'WebserverAMI', 'JudgehostAMI', \
+            'JudgehostInstanceType', 'S3DeployBucket', 'S3DeployArchive', 'S3DeployRegion':
+        assert name not in template['Parameters']
+    assert 'DatabasePassword' in template['Parameters']
+
+
+def test_partial_build_needs_no_iam():
+    # the functions behind custom resources and their roles come with the
+    # parts that use them
+    template, owners = build_template(parts=['rds'])
+    types = set(body['Type'] for body in template['Resources'].values())
+    assert not [t for t in types if t.startswith('AWS::IAM::') or t.startswith('AWS::Lambda::')]
+
+
+def test_spot_judgehosts_have_no_instance_type_parameter():
+    template, owners = build_template(parts=['judgehost'])
+    assert 'JudgehostInstanceType' in template['Parameters']
+    template, owners = build_template(parts=['judgehost'], judge_spot=70)
+    assert 'JudgehostInstanceType' not in template['Parameters']
@@ -0,0 +1,78 @@
+import gzip
+import hashlib
+import io
+
+import boto3
+import pytest
+
+from dj_cfn_generator import publish
+
+# moto stands in for S3; without it(see the tests extra) these are skipped
+moto = pytest.importorskip('moto')
+
+BUCKET = 'cf-templates'
+TEMPLATE = b'{"AWSTemplateFormatVersion": "2010-09-09", "Resources": {}}'
+
+
+@pytest.fixture
+def client():
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def test_template_key_is_content_hash():
+    key = publish.template_key(TEMPLATE)
+    assert key == 'cloudformation-{}.json'.format(hashlib.sha256(TEMPLATE).hexdigest()[:16])
+    assert publish.template_key(io.BytesIO(TEMPLATE)) == key
+    assert publish.template_key(TEMPLATE + b' ') != key
+
+
+def test_publish_and_fetch(client):
+    key, uploaded = publish.publish_template(client, BUCKET, TEMPLATE)
+    assert uploaded
+    assert key == publish.template_key(TEMPLATE)
+    assert client.get_object(Bucket=BUCKET, Key='latest')['Body'].read() == key.encode('utf-8')
+    assert publish.fetch_template(client, BUCKET) == (key, TEMPLATE)
+
+
+def test_unchanged_template_is_skipped(client):
+    publish.publish_template(client, BUCKET, TEMPLATE)
+    etag = client.head_object(Bucket=BUCKET, Key=publish.template_key(TEMPLATE))['ETag']
+    assert etag.strip('"') == hashlib.md5(TEMPLATE).hexdigest()
+
+    calls = []
+    client.meta.events.register('before-call.s3.PutObject', lambda **kwargs: calls.append(kwargs))
+    assert publish.publish_template(client, BUCKET, io.BytesIO(TEMPLATE)) == (publish.template_key(TEMPLATE), False)
+    assert calls == []
+
+
+def test_changed_template_moves_pointer(client):
+    publish.publish_template(client, BUCKET, TEMPLATE)
+    changed = TEMPLATE.replace(b'{}', b'{"Topic": {"Type": "AWS::SNS::Topic"}}')
+    key, uploaded = publish.publish_template(client, BUCKET, changed)
+    assert uploaded
+    assert publish.fetch_template(client, BUCKET) == (key, changed)
+    # the old template stays for stacks that still point at it
+    client.head_object(Bucket=BUCKET, Key=publish.template_key(TEMPLATE))
+
+
+def test_gzipped(client):
+    key, uploaded = publish.publish_template(client, BUCKET, TEMPLATE, gzipped=True)
+    assert uploaded
+    response = client.get_object(Bucket=BUCKET, Key=key)
+    assert response['ContentEncoding'] == 'gzip'
+    assert gzip.decompress(response['Body'].read()) == TEMPLATE
+    assert publish.fetch_template(client, BUCKET) == (key, TEMPLATE)
+    # the gzipped bytes don't depend on when they were made
+    assert publish.publish_template(client, BUCKET, TEMPLATE, gzipped=True) == (key, False)
+
+
+def test_publish_templates(client):
+    templates = [('latest-{}'.format(i), TEMPLATE.replace(b'{}', '{{"N{}": {{}}}}'.format(i).encode('utf-8')))
+                 for i in range(4)]
+    results = publish.publish_templates(client, BUCKET, templates, workers=2)
+    assert [uploaded for key, uploaded in results] == [True] * 4
+    for (pointer, body), (key, uploaded) in zip(templates, results):
+        assert publish.fetch_template(client, BUCKET, pointer) == (key, body)
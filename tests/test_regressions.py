@@ -0,0 +1,36 @@
+import os
+import sys
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+sys.path.insert(0, BENCHMARKS)
+import run  # noqa: E402
+
+BASE = {'min': 0.010, 'median': 0.011, 'peak_bytes': 100 * 1024}
+
+
+def check(result, strict=False):
+    return run.regressions('bench', dict(BASE, **result), BASE, 0.5, 2, strict)
+
+
+def test_within_threshold():
+    assert check({'min': 0.014, 'peak_bytes': 140 * 1024}) == ([], [])
+
+
+def test_memory_regression_fails():
+    failures, marks = check({'peak_bytes': 200 * 1024})
+    assert len(failures) == 1 and 'peaked' in failures[0]
+    # too little to tell from noise
+    base = dict(BASE, peak_bytes=1024)
+    assert run.regressions('bench', dict(base, peak_bytes=8 * 1024), base, 0.5, 2, False) == ([], [])
+
+
+def test_slower_is_marked_unless_strict():
+    assert check({'min': 0.020}) == ([], ["bench took 20.00ms, more than 50% over the baseline 10.00ms"])
+    failures, marks = check({'min': 0.020}, strict=True)
+    assert len(failures) == 1 and not marks
+
+
+def test_much_slower_fails():
+    failures, marks = check({'min': 0.040})
+    assert failures == ["bench took 40.00ms, more than 200% over the baseline 10.00ms"]
+    assert not marks
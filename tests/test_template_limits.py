@@ -0,0 +1,20 @@
+import os
+import sys
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+sys.path.insert(0, BENCHMARKS)
+import run  # noqa: E402
+
+from dj_cfn_generator.size import limit_errors, S3_LIMIT  # noqa: E402
+
+
+def test_limit_errors():
+    assert limit_errors({'Resources': {}}, S3_LIMIT) == []
+    assert len(limit_errors({'Resources': {}}, S3_LIMIT + 1)) == 1
+    assert limit_errors({'Resources': dict.fromkeys(range(501), {})}, 0) == [
+        "Template has 501 Resources, over the limit of 500"]
+
+
+def test_templates_within_limits():
+    lines, errors = run.check_limits()
+    assert errors == []
@@ -0,0 +1,64 @@
+import json
+
+from dj_cfn_generator import build_template
+
+
+def user_data(**options):
+    # The webserver user data of a template, with the CloudFormation functions
+    # in it written out as their JSON
+    template, owners = build_template(**options)
+    data = template['Resources']['WebserverLaunchTemplate']['Properties']['LaunchTemplateData']['UserData']
+    return ''.join(p if isinstance(p, str) else json.dumps(p, sort_keys=True)
+                   for p in data['Fn::Base64']['Fn::Join'][1])
+
+
+def test_install():
+    data = user_data(parts=['webserver'])
+    assert 'export DOMSERVER_S3_BUCKET="{"Ref": "S3DeployBucket"}"\n' in data
+    assert 'export DOMSERVER_S3_FILE="{"Ref": "S3DeployArchive"}"\n' in data
+    assert '\n/root/deploy_domserver.sh\n' in data
+    assert 'configure_domserver.sh' not in data
+
+
+def test_prebaked():
+    data = user_data(parts=['webserver'], web_boot='prebaked')
+    # the AMI has the domserver, so nothing is downloaded or installed
+    assert 'DOMSERVER_S3' not in data
+    assert 'deploy_domserver.sh' not in data
+    assert '\n/root/configure_domserver.sh\n' in data
+    assert 'export DJCLUSTERID="{"Ref": "AWS::StackName"}"\n' in data
+
+
+def test_both_modes_configure_and_signal():
+    for mode in 'install', 'prebaked':
+        data = user_data(parts=['webserver'], web_boot=mode)
+        assert data.startswith('#!/bin/bash\n')
+        assert '\ncat >/root/env_vars <<EVARS\n' in data
+        assert 'export ADMINPASS="{"Ref": "AdminPassword"}"\nEVARS\nsource /root/env_vars\n' in data
+        assert '--logical-resource-id WebserverAutoScalingGroup' in data
+
+
+def test_read_endpoint():
+    primary = '{"Fn::GetAtt": ["RDSDatabase", "Endpoint.Address"]}'
+    data = user_data(parts=['webserver'])
+    assert 'export DBHOST_RO="{}"\n'.format(primary) in data
+
+    data = user_data(parts=['webserver', 'rdsreplica'])
+    line = [x for x in data.split('\n') if x.startswith('export DBHOST_RO=')][0]
+    assert line != 'export DBHOST_RO="{}"'.format(primary)
+    assert 'RDSReplica' in line
+    # the primary is what's left without replicas
+    assert primary in line
+
+
+def test_cache_lines():
+    for mode in 'install', 'prebaked':
+        data = user_data(parts=['webserver'], web_boot=mode)
+        assert 'CACHE_' not in data
+
+        data = user_data(parts=['webserver', 'elasticache'], web_boot=mode, cache_engine='redis')
+        assert 'export CACHE_ENGINE="redis"\n' in data
+        assert 'export CACHE_HOST="' in data
+        assert 'export CACHE_PORT="' in data
+        # the variables stay inside the env_vars heredoc
+        assert data.index('export CACHE_PORT=') < data.index('\nEVARS\n')